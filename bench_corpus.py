@@ -0,0 +1,190 @@
+"""基准测试用的合成拉伸测试报告PDF语料
+
+每份报告包含封面、1~N页拉伸试验数据表（多页时为续表）、签字页，部分报告附带照片页；
+按 --scanned-ratio 的比例把整份报告栅格化为无文本层的扫描件。牌号同时覆盖规则阈值表内（Q235B、Q355B等）
+和表外（Q345B、20#）的材料，实测值有一定比例低于标准下限，符合性分析的规则路径和RAG路径都会被走到。
+
+语料目录下的 manifest.jsonl 每行记录一份报告：path、pages、scanned 和报告内容的真值 report
+（结构与视觉模型提取的JSON一致，可直接作为符合性分析的输入）。
+
+用法：
+    python bench_corpus.py bench_corpus/ [--count 12] [--scanned-ratio 0.25] [--max-data-pages 2] [--seed 1]
+"""
+import argparse
+import json
+import os
+import random
+
+# 牌号、材料类型、厚度（mm）、屈服强度和抗拉强度的大致范围（MPa）、断后伸长率（%）
+GRADES = [
+    ("Q235B", "钢板", 10, (235, 300), (370, 500), (26, 32)),
+    ("Q235B", "钢板", 20, (225, 290), (370, 500), (26, 32)),
+    ("Q275A", "钢板", 16, (275, 330), (410, 540), (22, 27)),
+    ("Q355B", "钢板", 20, (345, 420), (470, 630), (21, 27)),
+    ("Q390C", "钢板", 30, (370, 450), (490, 650), (20, 25)),
+    ("Q345B", "钢板", 12, (345, 410), (470, 630), (21, 26)),
+    ("20#", "钢管", 8, (245, 300), (410, 530), (25, 30)),
+]
+FONT = "china-s"  # PyMuPDF内置的简体中文字体
+TABLE_HEADERS = ["试样编号", "最大力(kN)", "屈服强度(MPa)", "抗拉强度(MPa)", "断后伸长率(%)"]
+ROWS_PER_PAGE = 12  # 每页数据表的行数
+SCAN_DPI = 150  # 扫描件的栅格化分辨率
+
+
+def make_report_data(rng, index, rows):
+    """生成一份报告的真值数据；约六分之一的报告屈服强度低于下限"""
+    grade, material_type, thickness, yield_range, tensile_range, elongation_range = rng.choice(GRADES)
+    failing = rng.random() < 1 / 6
+    details = []
+    for num in range(1, rows + 1):
+        yield_strength = rng.randint(*yield_range) - (40 if failing else 0)
+        tensile_strength = max(rng.randint(*tensile_range), yield_strength + 60)
+        area = 20 * thickness  # 板状试样宽20mm
+        details.append({
+            "Num": num,
+            "最大力": {"数值": round(tensile_strength * area / 1000, 1), "单位": "kN"},
+            "屈服强度": yield_strength,
+            "抗拉强度": tensile_strength,
+            "断后伸长率": f"{rng.uniform(*elongation_range):.1f}%",
+        })
+
+    def average(key):
+        return sum(row[key] for row in details) / len(details)
+
+    return {
+        "产品信息": {
+            "报告编号": f"BENCH-{index:04d}",
+            "材料名称": f"{grade} {material_type} δ={thickness}mm",
+            "材料类型": material_type,
+            "试验类型": "室温拉伸试验" if material_type == "钢板" else "钢管室温拉伸试验",
+            "执行标准": "GB/T 228.1-2021",
+        },
+        "测试数据": {
+            "详细数据": details,
+            "平均值": {
+                "最大力": f"{sum(row['最大力']['数值'] for row in details) / len(details):.1f} kN",
+                "屈服强度": f"{average('屈服强度'):.0f} MPa",
+                "抗拉强度": f"{average('抗拉强度'):.0f} MPa",
+                "断后伸长率": f"{sum(float(row['断后伸长率'].rstrip('%')) for row in details) / len(details):.1f}%",
+            },
+        },
+    }
+
+
+def _draw_table(fitz, page, top, rows):
+    col_width = 100
+    for r, values in enumerate([TABLE_HEADERS] + rows):
+        y = top + r * 24
+        for c, value in enumerate(values):
+            page.draw_rect(fitz.Rect(50 + c * col_width, y, 50 + (c + 1) * col_width, y + 24))
+            page.insert_text((55 + c * col_width, y + 16), str(value), fontname=FONT, fontsize=9)
+
+
+def build_report_pdf(report, rng, appendix_photo=False):
+    """按报告数据排版PDF，返回fitz.Document"""
+    import fitz  # PyMuPDF
+
+    info = report["产品信息"]
+    details = report["测试数据"]["详细数据"]
+    doc = fitz.open()
+
+    cover = doc.new_page()
+    cover.insert_text((200, 300), "检 测 报 告", fontname=FONT, fontsize=30)
+    cover.insert_text((150, 380), f"报告编号：{info['报告编号']}", fontname=FONT, fontsize=14)
+    cover.insert_text((150, 410), "委托单位：某某钢结构有限公司", fontname=FONT, fontsize=14)
+
+    chunks = [details[i:i + ROWS_PER_PAGE] for i in range(0, len(details), ROWS_PER_PAGE)]
+    for page_index, chunk in enumerate(chunks):
+        page = doc.new_page()
+        title = "拉伸试验结果" if page_index == 0 else "拉伸试验结果（续表）"
+        page.insert_text((50, 60), title, fontname=FONT, fontsize=14)
+        if page_index == 0:
+            lines = [
+                f"材料名称：{info['材料名称']}    材料类型：{info['材料类型']}",
+                f"试验类型：{info['试验类型']}    执行标准：{info['执行标准']}",
+            ]
+            for i, line in enumerate(lines):
+                page.insert_text((50, 90 + i * 20), line, fontname=FONT, fontsize=11)
+        rows = [
+            [row["Num"], row["最大力"]["数值"], row["屈服强度"], row["抗拉强度"], row["断后伸长率"].rstrip("%")]
+            for row in chunk
+        ]
+        _draw_table(fitz, page, 140, rows)
+        if page_index == len(chunks) - 1:
+            averages = report["测试数据"]["平均值"]
+            summary = "平均值：" + "，".join(f"{key} {value}" for key, value in averages.items())
+            page.insert_text((50, 140 + (len(rows) + 2) * 24), summary, fontname=FONT, fontsize=10)
+
+    signature = doc.new_page()
+    signature.insert_text((50, 700), "批准：张三    审核：李四    检验：王五", fontname=FONT, fontsize=12)
+
+    if appendix_photo:
+        photo = doc.new_page()
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 160, 120), False)
+        for x in range(0, 160, 4):
+            for y in range(0, 120, 4):
+                pix.set_rect(fitz.IRect(x, y, x + 4, y + 4), (rng.randint(0, 255),) * 3)
+        photo.insert_image(fitz.Rect(50, 50, 550, 425), pixmap=pix)
+        photo.insert_text((50, 470), "附录 试样断口照片", fontname=FONT, fontsize=12)
+    return doc
+
+
+def rasterize(doc):
+    """把文档栅格化为只有图像的扫描件"""
+    import fitz  # PyMuPDF
+
+    scanned = fitz.open()
+    for page in doc:
+        pix = page.get_pixmap(dpi=SCAN_DPI, colorspace=fitz.csGRAY)
+        scanned_page = scanned.new_page(width=page.rect.width, height=page.rect.height)
+        scanned_page.insert_image(scanned_page.rect, pixmap=pix)
+    doc.close()
+    return scanned
+
+
+def generate_corpus(out_dir, count=12, scanned_ratio=0.25, max_data_pages=2, seed=1):
+    """生成语料并写出manifest.jsonl，返回manifest条目列表"""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+    for index in range(1, count + 1):
+        rows = rng.randint(3, ROWS_PER_PAGE * max_data_pages)
+        report = make_report_data(rng, index, rows)
+        doc = build_report_pdf(report, rng, appendix_photo=rng.random() < 0.3)
+        scanned = rng.random() < scanned_ratio
+        if scanned:
+            doc = rasterize(doc)
+        path = os.path.join(out_dir, f"report_{index:03d}.pdf")
+        doc.save(path, deflate=True)
+        entries.append({"path": os.path.abspath(path), "pages": doc.page_count, "scanned": scanned, "report": report})
+        doc.close()
+
+    with open(os.path.join(out_dir, "manifest.jsonl"), "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return entries
+
+
+def load_corpus(out_dir):
+    """读取语料目录下的manifest.jsonl"""
+    with open(os.path.join(out_dir, "manifest.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成拉伸测试报告PDF语料")
+    parser.add_argument("out_dir", help="输出目录")
+    parser.add_argument("--count", type=int, default=12, help="报告份数")
+    parser.add_argument("--scanned-ratio", type=float, default=0.25, help="扫描件（无文本层）的比例")
+    parser.add_argument("--max-data-pages", type=int, default=2, help="数据表最多占用的页数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子，相同种子生成相同语料")
+    args = parser.parse_args(argv)
+
+    entries = generate_corpus(args.out_dir, args.count, args.scanned_ratio, args.max_data_pages, args.seed)
+    pages = sum(entry["pages"] for entry in entries)
+    scanned = sum(entry["scanned"] for entry in entries)
+    print(f"[语料] 已生成 {len(entries)} 份报告（共 {pages} 页，扫描件 {scanned} 份）: {args.out_dir}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
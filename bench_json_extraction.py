@@ -0,0 +1,173 @@
+"""JSON提取微基准：对比逐级正则匹配的旧实现与单遍括号配对扫描的extract_json_from_response
+
+优先使用录制的真实模型响应：--cache-db读取页面结果缓存（pdf_result_cache.sqlite3中缓存的正是模型返回的消息内容），
+--responses读取目录下的响应文本文件（*.txt/*.md，每个文件一条）或JSONL文件（每行的content或response字段）。
+没有录制的响应时使用构造样本：纯JSON（启用response_format时）、带说明文字的```json代码块、
+三层嵌套的无代码块JSON、被max_tokens截断的JSON、带尾逗号的JSON，以及200行明细的长响应（正常和带尾逗号）。
+
+注意旧实现在无代码块、截断等样本上很快，但返回的是内层的部分对象（结果列中的"0行"），速度不能单独比较。
+
+用法：
+    python bench_json_extraction.py [--repeat N]
+    python bench_json_extraction.py --cache-db pdf_result_cache.sqlite3 [--limit N] [--repeat N]
+    python bench_json_extraction.py --responses recorded/ [--repeat N]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import time
+
+from pdf_extraction import extract_json_from_response
+
+
+def legacy_extract_json_from_response(response_text):
+    """旧实现：整体解析 -> 代码块正则 -> 两个宽泛正则，每个匹配都尝试json.loads和json_repair"""
+    import json_repair
+
+    try:
+        return json.loads(response_text)
+    except Exception:
+        pass
+    json_match = re.search(r'```json\s*\n(.*?)\n```', response_text, re.DOTALL | re.IGNORECASE)
+    if json_match:
+        json_str = json_match.group(1).strip()
+        try:
+            return json.loads(json_str)
+        except Exception:
+            try:
+                return json_repair.loads(json_str)
+            except Exception:
+                pass
+    for pattern in (r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', r'\{.*?\}'):
+        for match in re.findall(pattern, response_text, re.DOTALL):
+            if len(match) > 50:
+                try:
+                    return json.loads(match)
+                except Exception:
+                    try:
+                        return json_repair.loads(match)
+                    except Exception:
+                        continue
+    return None
+
+
+def _report(rows):
+    return {
+        "产品信息": {"材料名称": "Q355B 钢板 δ=20mm", "材料类型": "钢板", "试验类型": "室温拉伸试验", "执行标准": "GB/T 228.1-2021"},
+        "测试数据": {
+            "详细数据": [
+                {"Num": i + 1, "最大力": {"数值": 188.2 + i % 7, "单位": "kN"}, "抗拉强度": 520 + i % 13, "屈服强度": 380 + i % 11, "断后伸长率": "24.5%"}
+                for i in range(rows)
+            ],
+            "平均值": {"最大力": "190.1 kN", "抗拉强度": "526 MPa", "屈服强度": "385 MPa", "断后伸长率": "24.5%"},
+        },
+    }
+
+
+def build_samples():
+    """构造基准样本：名称 -> 响应文本"""
+    report = json.dumps(_report(3), ensure_ascii=False, indent=2)
+    long_report = json.dumps(_report(200), ensure_ascii=False, indent=2)
+    trailing_comma = report.replace('"GB/T 228.1-2021"\n', '"GB/T 228.1-2021",\n', 1)
+    long_trailing_comma = long_report.replace('"GB/T 228.1-2021"\n', '"GB/T 228.1-2021",\n', 1)
+    prose = "根据图片内容，这是一份拉伸测试报告（编号 {BG-2024-001}），提取结果如下。注意：\"试样3\"的断口位置在标距外。\n\n"
+    return {
+        "纯JSON": json.dumps(_report(3), ensure_ascii=False),
+        "代码块": f"{prose}```json\n{report}\n```\n\n以上数据均来自报告第1页。",
+        "无代码块嵌套": f"{prose}{report}\n\n如有疑问请核对原始报告。",
+        "截断": f"```json\n{report[:len(report) * 2 // 3]}",
+        "尾逗号": f"```json\n{trailing_comma}\n```",
+        "长响应200行": f"{prose}```json\n{long_report}\n```",
+        "长响应尾逗号": f"{prose}{long_trailing_comma}",
+    }
+
+
+def load_cached_responses(db_path, limit=None, table="page_results"):
+    """从页面结果缓存中读取录制的模型响应：名称 -> 响应文本"""
+    conn = sqlite3.connect(db_path)
+    try:
+        query = f"SELECT key, content FROM {table} ORDER BY created_at"
+        rows = conn.execute(query + (" LIMIT ?" if limit else ""), (limit,) if limit else ()).fetchall()
+    finally:
+        conn.close()
+    return {f"缓存{key[:8]}": content for key, content in rows}
+
+
+def load_recorded_responses(path, limit=None):
+    """读取录制的模型响应：目录下每个*.txt/*.md文件一条，或JSONL文件每行的content/response字段"""
+    responses = {}
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith((".txt", ".md")):
+                with open(os.path.join(path, name), encoding="utf-8") as f:
+                    responses[os.path.splitext(name)[0]] = f.read()
+    else:
+        with open(path, encoding="utf-8") as f:
+            for index, line in enumerate(f):
+                if line.strip():
+                    record = json.loads(line)
+                    responses[str(record.get("name", index))] = record.get("content") or record.get("response") or ""
+    return dict(list(responses.items())[:limit]) if limit else responses
+
+
+def _bench(func, text, repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(text)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(text)
+        elapsed = (time.perf_counter() - start) / repeat
+    return result, elapsed * 1000
+
+
+def _describe(result):
+    if not isinstance(result, dict):
+        return "无结果"
+    test_data = result.get("测试数据")
+    rows = len(test_data.get("详细数据", [])) if isinstance(test_data, dict) else 0
+    return f"{len(result)}个部分/{rows}行"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON提取微基准")
+    parser.add_argument("--repeat", type=int, default=200, help="每个样本的重复次数")
+    parser.add_argument("--cache-db", help="页面结果缓存（pdf_result_cache.sqlite3），使用其中录制的模型响应")
+    parser.add_argument("--responses", help="录制的模型响应：目录（*.txt/*.md）或JSONL文件")
+    parser.add_argument("--limit", type=int, help="最多使用的录制响应数")
+    args = parser.parse_args(argv)
+
+    if args.cache_db:
+        samples = load_cached_responses(args.cache_db, args.limit)
+    elif args.responses:
+        samples = load_recorded_responses(args.responses, args.limit)
+    else:
+        samples = build_samples()
+    if not samples:
+        print("没有可用的响应样本")
+        return 1
+
+    print(f"{'样本':<12}{'长度':>8}{'旧实现ms':>12}{'新实现ms':>12}{'加速':>8}  旧结果 / 新结果")
+    legacy_times, new_times, changed = [], [], 0
+    for name, text in samples.items():
+        legacy_result, legacy_ms = _bench(legacy_extract_json_from_response, text, args.repeat)
+        new_result, new_ms = _bench(extract_json_from_response, text, args.repeat)
+        legacy_times.append(legacy_ms)
+        new_times.append(new_ms)
+        changed += legacy_result != new_result
+        print(f"{name:<12}{len(text):>8}{legacy_ms:>12.3f}{new_ms:>12.3f}{legacy_ms / new_ms:>7.1f}x  {_describe(legacy_result)} / {_describe(new_result)}")
+    if len(samples) > 1:
+        for label, times in (("旧实现", legacy_times), ("新实现", new_times)):
+            quantiles = statistics.quantiles(times, n=20, method="inclusive")
+            print(f"{label}：合计 {sum(times):.3f}ms，中位数 {statistics.median(times):.3f}ms，P95 {quantiles[-1]:.3f}ms，最慢 {max(times):.3f}ms")
+        print(f"共 {len(samples)} 条响应，两种实现结果不同的 {changed} 条")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""基准测试用的本地模型服务替身：兼容OpenAI的 /chat/completions（含流式）和 /embeddings
+
+- 回放：--recordings 指定录制文件（JSONL），请求与录制的请求完全一致时返回录制的内容，
+  否则按请求类型（vision / text / stream / keywords / chat）轮流返回同类录制，都没有时返回内置的合成响应。
+- 录制：同时指定 --upstream 和 --record 时把请求转发到真实模型服务，并把响应追加到录制文件，
+  之后即可离线回放。
+- 延迟和错误注入：--latency/--jitter 模拟模型耗时，--error-rate 按概率返回 --error-status（默认503，带Retry-After）。
+- GET /stats 返回按类型统计的请求数，GET /stats?reset=1 读取后清零。
+
+嵌入向量由文本哈希确定性生成，相同文本得到相同向量，LightRAG的向量检索可以正常工作。
+
+用法：
+    python bench_mock_server.py [--port 10010] [--latency 0.5] [--error-rate 0.05] [--recordings rec.jsonl]
+    python bench_mock_server.py --upstream http://model-server/v1 --api-key sk-xxx --record rec.jsonl
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 合成响应：一份覆盖规则阈值表的拉伸报告和一段符合性结论
+SYNTHETIC_REPORT = {
+    "产品信息": {
+        "材料名称": "Q355B 钢板 δ=20mm",
+        "材料类型": "钢板",
+        "试验类型": "室温拉伸试验",
+        "执行标准": "GB/T 228.1-2021",
+    },
+    "测试数据": {
+        "详细数据": [
+            {"Num": 1, "最大力": {"数值": 190.2, "单位": "kN"}, "屈服强度": 385, "抗拉强度": 526, "断后伸长率": "24.5%"},
+            {"Num": 2, "最大力": {"数值": 189.6, "单位": "kN"}, "屈服强度": 381, "抗拉强度": 522, "断后伸长率": "25.0%"},
+        ],
+        "平均值": {"最大力": "189.9 kN", "屈服强度": "383 MPa", "抗拉强度": "524 MPa", "断后伸长率": "24.8%"},
+    },
+}
+SYNTHETIC_CONCLUSION = (
+    "通过本次拉伸试验，测定了本批次钢板各项力学性能指标，结果表明钢板 Q355B 钢板 δ=20mm 的各项指标符合相关中国标准要求：\n"
+    "• 抗拉强度指标符合：GB/T 1591-2018 低合金高强度结构钢 - 470~630 MPa，实测 524 MPa\n"
+    "• 屈服强度指标符合：GB/T 1591-2018 低合金高强度结构钢 - ≥345 MPa，实测 383 MPa\n"
+    "• 断后伸长率符合：GB/T 1591-2018 低合金高强度结构钢 - ≥21%，实测 24.8%"
+)
+SYNTHETIC_KEYWORDS = {"high_level_keywords": ["标准符合性", "力学性能"], "low_level_keywords": ["Q355B", "屈服强度", "抗拉强度", "断后伸长率"]}
+STREAM_CHUNK_CHARS = 8  # 流式响应每个事件携带的字符数
+
+
+def request_key(body):
+    """录制和回放使用的请求键：模型和消息内容（含图像）的哈希"""
+    canonical = json.dumps({"model": body.get("model"), "messages": body.get("messages")}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def request_kind(body):
+    """按请求内容归类：vision / text / stream / keywords / chat"""
+    messages = body.get("messages") or []
+    has_image = any(
+        isinstance(message.get("content"), list) and any(part.get("type") == "image_url" for part in message["content"])
+        for message in messages
+    )
+    text = json.dumps(messages, ensure_ascii=False) if not has_image else ""
+    if has_image:
+        return "vision"
+    if body.get("stream"):
+        return "stream"
+    if "high_level_keywords" in text:
+        return "keywords"
+    if "JSON" in text and "拉伸" in text:
+        return "text"
+    return "chat"
+
+
+def synthetic_content(kind):
+    if kind in ("vision", "text"):
+        return "```json\n" + json.dumps(SYNTHETIC_REPORT, ensure_ascii=False, indent=2) + "\n```"
+    if kind == "keywords":
+        return json.dumps(SYNTHETIC_KEYWORDS, ensure_ascii=False)
+    return SYNTHETIC_CONCLUSION
+
+
+def embed_text(text, dim):
+    """由文本哈希确定性生成单位长度的嵌入向量"""
+    import numpy as np
+
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+
+class MockModelServer:
+    """模型服务替身的状态：录制内容、请求统计和注入参数"""
+
+    def __init__(self, latency=0.5, jitter=0.0, embedding_latency=0.02, stream_chunk_delay=0.02,
+                 error_rate=0.0, error_status=503, retry_after=1, embedding_dim=4096,
+                 recordings=None, upstream=None, api_key=None, record_path=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.embedding_latency = embedding_latency
+        self.stream_chunk_delay = stream_chunk_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.embedding_dim = embedding_dim
+        self.upstream = upstream
+        self.api_key = api_key
+        self.record_path = record_path
+        self.random = random.Random(seed)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.by_key = {}
+        self.by_kind = {}
+        self._kind_cursor = Counter()
+        if recordings:
+            self.load_recordings(recordings)
+
+    def load_recordings(self, path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self.by_key[record["key"]] = record["content"]
+                self.by_kind.setdefault(record["kind"], []).append(record["content"])
+        print(f"[模拟服务] 已加载 {len(self.by_key)} 条录制响应", flush=True)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def snapshot(self, reset=False):
+        with self.lock:
+            stats = dict(self.stats)
+            if reset:
+                self.stats.clear()
+        return stats
+
+    def sleep(self, base):
+        time.sleep(max(0.0, base + self.random.uniform(-self.jitter, self.jitter)))
+
+    def should_fail(self):
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def chat_content(self, body, kind):
+        key = request_key(body)
+        if key in self.by_key:
+            return self.by_key[key]
+        if self.upstream:
+            return self.forward(body, key, kind)
+        recorded = self.by_kind.get(kind)
+        if recorded:
+            with self.lock:
+                index = self._kind_cursor[kind] % len(recorded)
+                self._kind_cursor[kind] += 1
+            return recorded[index]
+        return synthetic_content(kind)
+
+    def forward(self, body, key, kind):
+        """转发到真实模型服务（流式请求按非流式转发），录制响应内容"""
+        import requests
+
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        response = requests.post(f"{self.upstream}/chat/completions", json=dict(body, stream=False), headers=headers, timeout=600)
+        response.raise_for_status()
+        content = response.json()["choices"][0]["message"]["content"]
+        with self.lock:
+            self.by_key[key] = content
+            self.by_kind.setdefault(kind, []).append(content)
+            if self.record_path:
+                with open(self.record_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "kind": kind, "content": content}, ensure_ascii=False) + "\n")
+        return content
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.startswith("/stats"):
+            self._send_json(200, self.mock.snapshot(reset="reset=1" in self.path))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        mock = self.mock
+
+        if self.path.endswith("/embeddings"):
+            mock.count("embeddings")
+            mock.sleep(mock.embedding_latency)
+            if mock.should_fail():
+                mock.count("errors")
+                self._send_json(mock.error_status, {"error": {"message": "模拟服务过载"}}, {"Retry-After": str(mock.retry_after)})
+                return
+            texts = body.get("input")
+            texts = [texts] if isinstance(texts, str) else texts
+            data = [{"object": "embedding", "index": i, "embedding": embed_text(text, mock.embedding_dim)} for i, text in enumerate(texts)]
+            self._send_json(200, {"object": "list", "data": data, "model": body.get("model"),
+                                  "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+            return
+
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        kind = request_kind(body)
+        mock.count(kind)
+        mock.sleep(mock.latency)
+        if mock.should_fail():
+            mock.count("errors")
+            self._send_json(mock.error_status, {"error": {"message": "模拟服务过载"}}, {"Retry-After": str(mock.retry_after)})
+            return
+        content = mock.chat_content(body, kind)
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(content), STREAM_CHUNK_CHARS):
+                event = {"choices": [{"index": 0, "delta": {"content": content[i:i + STREAM_CHUNK_CHARS]}}]}
+                self._send_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                time.sleep(mock.stream_chunk_delay)
+            self._send_chunk(b"data: [DONE]\n\n")
+            self._send_chunk(b"")
+            return
+
+        self._send_json(200, {
+            "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+
+def start_mock_server(port=0, host="127.0.0.1", **options):
+    """在后台线程中启动模型服务替身，返回 (HTTP服务器, MockModelServer)；port为0时自动分配端口"""
+    mock = MockModelServer(**options)
+    handler = type("BoundMockHandler", (MockHandler,), {"mock": mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-model-server", daemon=True).start()
+    return server, mock
+
+
+def add_server_arguments(parser):
+    """添加模拟服务的命令行参数（bench_pipeline复用）"""
+    parser.add_argument("--latency", type=float, default=0.5, help="对话请求的模拟耗时（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="耗时的随机波动范围（秒）")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="嵌入请求的模拟耗时（秒）")
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.02, help="流式响应相邻事件的间隔（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="按该概率返回错误响应")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误使用的HTTP状态码")
+    parser.add_argument("--retry-after", type=int, default=1, help="错误响应的Retry-After（秒）")
+    parser.add_argument("--embedding-dim", type=int, default=4096, help="嵌入向量维度，应与EmbeddingFunc一致")
+    parser.add_argument("--recordings", help="回放的录制文件（JSONL）")
+    parser.add_argument("--seed", type=int, default=None, help="延迟和错误注入的随机种子")
+
+
+def server_options(args):
+    return {
+        "latency": args.latency, "jitter": args.jitter, "embedding_latency": args.embedding_latency,
+        "stream_chunk_delay": args.stream_chunk_delay, "error_rate": args.error_rate,
+        "error_status": args.error_status, "retry_after": args.retry_after,
+        "embedding_dim": args.embedding_dim, "recordings": args.recordings, "seed": args.seed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="兼容OpenAI接口的本地模型服务替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10010)
+    add_server_arguments(parser)
+    parser.add_argument("--upstream", help="录制模式：转发到的真实模型服务地址（如 http://host:port/v1）")
+    parser.add_argument("--api-key", help="录制模式：真实模型服务的API Key")
+    parser.add_argument("--record", help="录制模式：响应追加写入的JSONL文件")
+    args = parser.parse_args(argv)
+
+    server, _ = start_mock_server(
+        args.port, args.host, upstream=args.upstream, api_key=args.api_key, record_path=args.record, **server_options(args)
+    )
+    print(f"[模拟服务] 已启动: http://{args.host}:{server.server_port}/v1", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
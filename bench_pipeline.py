@@ -0,0 +1,332 @@
+"""端到端性能基准：在本地模型服务替身上测量 analyze_pdf、process_pdf_file 和 analyze_compliance
+
+每个（场景, 会话数）组合在独立子进程中运行：N个会话线程同时各处理 --reports-per-session 份语料报告，
+子进程统计吞吐（页/秒、份/秒）、单份报告耗时的p50/p95、各处理阶段（pdf_metrics的span）耗时的p50/p95
+和峰值RSS，主进程从模型服务替身读取本轮发出的请求数。
+
+不指定 --base-url 时在本进程内启动 bench_mock_server，语料目录不存在时按 bench_corpus 生成。
+--save-baseline 保存本次结果；--baseline 与基线比较，吞吐下降、p95耗时、峰值内存或请求数
+超过 --tolerance 时列出回归项并以退出码1结束，可直接用作CI门禁。
+
+用法：
+    python bench_pipeline.py [--corpus bench_corpus/] [--scenarios analyze_pdf,process_pdf_file] [--sessions 1,2,4]
+                             [--latency 0.5] [--error-rate 0.02] [--output results.json]
+                             [--save-baseline baseline.json | --baseline baseline.json --tolerance 0.15]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_corpus import generate_corpus, load_corpus
+from bench_mock_server import add_server_arguments, server_options, start_mock_server
+
+SCENARIOS = ("analyze_pdf", "process_pdf_file", "analyze_compliance")
+DEFAULT_SESSIONS = "1,2,4"
+REPORTS_PER_SESSION = 4  # 每个会话处理的报告份数
+REGRESSION_TOLERANCE = 0.15  # 与基线相比允许的相对变化
+RESULT_MARKER = "BENCH_RESULT "  # 子进程输出结果行的前缀，和日志输出区分开
+
+# 与基线比较的指标：名称 -> 越大越好(True) / 越小越好(False)
+GATED_METRICS = {
+    "pages_per_sec": True,
+    "latency_p95": False,
+    "peak_rss_mb": False,
+    "requests": False,
+}
+
+
+def percentile(values, q):
+    """线性插值的分位数，q取0~100"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 4) if values else None,
+        "p95": round(percentile(values, 95), 4) if values else None,
+        "total": round(sum(values), 4),
+    }
+
+
+class StageRecorder:
+    """收集pdf_metrics阶段耗时的原始样本"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, value, labels):
+        with self._lock:
+            self.samples.setdefault(labels["stage"], []).append(value)
+
+    def summary(self):
+        with self._lock:
+            return {stage: summarize(values) for stage, values in sorted(self.samples.items())}
+
+
+class _UploadedFile:
+    """模拟Gradio上传文件对象（只需要name属性）"""
+
+    def __init__(self, name):
+        self.name = name
+
+
+def _prepare_child(config):
+    """子进程内：把模型服务地址和工作目录指向基准环境后再导入被测模块"""
+    import pdf_extraction
+    import pdf_metrics
+    import pdf_render_pool
+
+    pdf_extraction.BASE_URL = config["base_url"]
+    pdf_extraction.WORKING_DIR = config["working_dir"]
+    pdf_metrics.configure_logging(config["log_level"])
+    if config.get("render_workers"):
+        pdf_render_pool.RENDER_POOL_ENABLED = True
+        pdf_render_pool.RENDER_POOL_WORKERS = config["render_workers"]
+        pdf_render_pool.get_render_pool()
+    recorder = StageRecorder()
+    pdf_metrics.STAGE_DURATION.add_listener(recorder)
+
+    if config["scenario"] == "analyze_pdf":
+        extractor = pdf_extraction.PDFExtractor(use_cache=False)
+
+        def run_one(entry):
+            results = extractor.analyze_pdf(entry["path"], pdf_extraction.REPORT_QUESTION)
+            if isinstance(results, dict):
+                return False
+            with results:
+                return any("error" not in item["result"] for item in results)
+        return run_one, recorder
+
+    import pdf_analysis_app as app
+
+    app.RULE_ENGINE_ENABLED = config["rules"]
+    app.analyzer.result_cache = None
+    app.analyzer.compliance_cache = None
+
+    if config["scenario"] == "process_pdf_file":
+        def run_one(entry):
+            _, _, report_json = app.process_pdf_file(_UploadedFile(entry["path"]))
+            return report_json is not None
+        return run_one, recorder
+
+    # 符合性分析以语料真值为输入，先初始化LightRAG，存储加载不计入会话耗时
+    app.run_async(app.analyzer.initialize_rag())
+
+    def run_one(entry):
+        report_json = entry["report"]
+        html = app.analyze_compliance(app.format_test_data_html(report_json), report_json)
+        return "标准符合性分析失败" not in html
+    return run_one, recorder
+
+
+def run_child(config):
+    """子进程入口：运行一个（场景, 会话数）组合，向stdout输出一行结果JSON"""
+    import resource
+
+    run_one, recorder = _prepare_child(config)
+    entries = load_corpus(config["corpus"])
+    sessions = config["sessions"]
+    per_session = config["reports_per_session"]
+    # 会话i从语料的第i份开始依次取报告，不同会话处理的报告错开
+    assignments = [[entries[(i + j) % len(entries)] for j in range(per_session)] for i in range(sessions)]
+
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(sessions)
+
+    def session(items):
+        barrier.wait()
+        for entry in items:
+            start = time.perf_counter()
+            try:
+                ok = run_one(entry)
+            except Exception as e:
+                ok = False
+                print(f"[基准] {entry['path']} 失败: {str(e)}", file=sys.stderr, flush=True)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                if not ok:
+                    failures.append(entry["path"])
+
+    threads = [threading.Thread(target=session, args=(items,)) for items in assignments]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    reports = sessions * per_session
+    pages = sum(entry["pages"] for items in assignments for entry in items)
+    result = {
+        "scenario": config["scenario"],
+        "sessions": sessions,
+        "reports": reports,
+        "pages": pages,
+        "failures": len(failures),
+        "wall_seconds": round(wall, 3),
+        "pages_per_sec": round(pages / wall, 3),
+        "reports_per_sec": round(reports / wall, 3),
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        # Linux上ru_maxrss单位为KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages": recorder.summary(),
+    }
+    print(RESULT_MARKER + json.dumps(result, ensure_ascii=False), flush=True)
+
+
+def _fetch_stats(base_url, mock, reset):
+    """读取并清零模型服务替身的请求统计；外部服务不支持时返回None"""
+    if mock is not None:
+        return mock.snapshot(reset=reset)
+    import requests
+
+    root = base_url.rsplit("/v1", 1)[0]
+    try:
+        response = requests.get(f"{root}/stats", params={"reset": 1} if reset else None, timeout=5)
+        return response.json()
+    except Exception:
+        return None
+
+
+def run_scenario(config, base_url, mock):
+    """在子进程中运行一个组合，附加模型服务侧的请求统计"""
+    _fetch_stats(base_url, mock, reset=True)
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", json.dumps(config, ensure_ascii=False)],
+        capture_output=True, text=True, encoding="utf-8",
+    )
+    result_lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+    if completed.returncode != 0 or not result_lines:
+        raise RuntimeError(f"{config['scenario']} × {config['sessions']} 运行失败:\n{completed.stderr[-2000:]}")
+    result = json.loads(result_lines[-1][len(RESULT_MARKER):])
+    stats = _fetch_stats(base_url, mock, reset=True)
+    if stats is not None:
+        result["requests"] = sum(value for name, value in stats.items() if name != "errors")
+        result["injected_errors"] = stats.get("errors", 0)
+        result["requests_by_kind"] = stats
+    return result
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """返回超出容差的回归项列表"""
+    baseline_index = {(item["scenario"], item["sessions"]): item for item in baseline}
+    regressions = []
+    for result in results:
+        base = baseline_index.get((result["scenario"], result["sessions"]))
+        if base is None:
+            continue
+        for metric, higher_is_better in GATED_METRICS.items():
+            current, previous = result.get(metric), base.get(metric)
+            if current is None or not previous:
+                continue
+            change = (current - previous) / previous
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{result['scenario']} × {result['sessions']}会话 {metric}: {previous} -> {current}（{change:+.1%}）")
+    return regressions
+
+
+def print_results(results, top_stages):
+    print(f"{'场景':<20}{'会话':>4}{'报告':>6}{'页':>6}{'耗时s':>9}{'页/秒':>9}{'份/秒':>8}{'p50 s':>8}{'p95 s':>8}{'RSS MB':>9}{'请求':>7}{'失败':>6}")
+    for r in results:
+        print(f"{r['scenario']:<20}{r['sessions']:>4}{r['reports']:>6}{r['pages']:>6}{r['wall_seconds']:>9.2f}{r['pages_per_sec']:>9.2f}"
+              f"{r['reports_per_sec']:>8.2f}{r['latency_p50']:>8.2f}{r['latency_p95']:>8.2f}{r['peak_rss_mb']:>9.1f}"
+              f"{str(r.get('requests', '-')):>7}{r['failures']:>6}")
+    for r in results:
+        stages = sorted(r["stages"].items(), key=lambda item: item[1]["total"], reverse=True)[:top_stages]
+        print(f"\n[{r['scenario']} × {r['sessions']}会话] 累计耗时最多的阶段")
+        for stage, s in stages:
+            print(f"  {stage:<26}{s['count']:>6} 次  p50 {s['p50'] * 1000:>9.1f}ms  p95 {s['p95'] * 1000:>9.1f}ms  累计 {s['total']:>8.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF分析流水线的离线性能基准")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", default="bench_corpus", help="语料目录，不存在时自动生成")
+    parser.add_argument("--corpus-count", type=int, default=12, help="自动生成语料时的报告份数")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景列表")
+    parser.add_argument("--sessions", default=DEFAULT_SESSIONS, help="逗号分隔的并发会话数列表，如 1,2,4,8")
+    parser.add_argument("--reports-per-session", type=int, default=REPORTS_PER_SESSION, help="每个会话处理的报告份数")
+    parser.add_argument("--rules", action="store_true", help="符合性分析启用本地规则判定（默认关闭，测量RAG+LLM路径）")
+    parser.add_argument("--rag-dir", help="LightRAG工作目录（已入库标准的索引），默认使用空的临时目录")
+    parser.add_argument("--base-url", help="使用已有的模型服务（如单独启动的bench_mock_server），不启动内置替身")
+    parser.add_argument("--log-level", default="WARNING", help="被测代码的日志级别")
+    parser.add_argument("--render-workers", type=int, default=0, help="被测代码使用N个进程的渲染池渲染页面，0为不使用")
+    parser.add_argument("--top-stages", type=int, default=8, help="每个组合显示的阶段数")
+    parser.add_argument("--output", help="把完整结果写入JSON文件")
+    parser.add_argument("--save-baseline", help="把本次结果保存为基线")
+    parser.add_argument("--baseline", help="与基线比较，超出容差时以退出码1结束")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="允许的相对变化")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return 0
+
+    if not os.path.exists(os.path.join(args.corpus, "manifest.jsonl")):
+        generate_corpus(args.corpus, count=args.corpus_count)
+    corpus = os.path.abspath(args.corpus)
+
+    mock = None
+    base_url = args.base_url
+    if base_url is None:
+        server, mock = start_mock_server(**server_options(args))
+        base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    print(f"[基准] 模型服务: {base_url}，语料: {corpus}", flush=True)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_rag_") as temp_dir:
+        for scenario in args.scenarios.split(","):
+            for sessions in (int(value) for value in args.sessions.split(",")):
+                config = {
+                    "scenario": scenario,
+                    "sessions": sessions,
+                    "reports_per_session": args.reports_per_session,
+                    "corpus": corpus,
+                    "base_url": base_url,
+                    "working_dir": args.rag_dir or temp_dir,
+                    "rules": args.rules,
+                    "log_level": args.log_level,
+                    "render_workers": args.render_workers,
+                }
+                print(f"[基准] 运行 {scenario} × {sessions} 会话...", flush=True)
+                results.append(run_scenario(config, base_url, mock))
+
+    print_results(results, args.top_stages)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n[基准] 已保存基线: {args.save_baseline}", flush=True)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n[基准] 发现 {len(regressions)} 项超出 {args.tolerance:.0%} 容差的回归：", flush=True)
+            for line in regressions:
+                print(f"  {line}", flush=True)
+            return 1
+        print(f"\n[基准] 与基线相比没有超出 {args.tolerance:.0%} 容差的回归", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,154 +1,217 @@
-import gradio as gr
 import asyncio
-import os
+import atexit
+import hashlib
+import html
 import json
-import base64
-import requests
-import fitz  # PyMuPDF
-from lightrag import LightRAG, QueryParam
-from lightrag.utils import EmbeddingFunc
-from lightrag.llm.openai import openai_embed, openai_complete_if_cache
-from lightrag.utils import setup_logger
-import json_repair
-import time
+import os
 import re
+import time
+import threading
+import unicodedata
+from pdf_compliance_rules import evaluate_report, format_rule_conclusion
+from pdf_extraction import (
+    WORKING_DIR, API_KEY, BASE_URL, VL_MODEL,
+    MAX_RETRIES, RESULT_CACHE_ENABLED, REPORT_QUESTION,
+    PRODUCT_INFO_KEYS, TEST_DATA_KEYS,
+    close_http_client, post_model_api, stream_model_api,
+    PDFExtractor, ResultCache,
+)
+from pdf_jobs import JobQueue, JobQueueFullError
+from pdf_metrics import METRICS_FILE, METRICS_PORT, STAGE_DURATION, get_logger, start_metrics_server, traced, write_metrics_file
+from pdf_render_pool import get_render_pool, shutdown_render_pool
+from pdf_retry import ApiResponseError, retry_api_call, async_retry_api_call
 
-print("[启动] 所有导入完成", flush=True)
+logger = get_logger("app")
 
-# 设置日志
-print("[启动] 设置LightRAG日志...", flush=True)
-setup_logger("lightrag", level="INFO")
-print("[启动] 日志设置完成", flush=True)
+logger.info("[启动] 所有导入完成")
 
 # 配置参数
-print("[启动] 加载配置参数...", flush=True)
-WORKING_DIR = "./"
-API_KEY = "sk-xxx"
-BASE_URL = "http://127.0.0.1:10010/v1"
-VL_MODEL = "qwen25-vl-72b"
+logger.debug("[启动] 加载配置参数...")
 EMBEDDING_MODEL = "qwen3-embedding-8b"
 
-# 重试配置
-MAX_RETRIES = 3
-RETRY_DELAY = 2  # 秒
-BACKOFF_FACTOR = 2  # 指数退避因子
-
-print("[启动] 配置参数加载完成", flush=True)
-
-def retry_api_call(max_retries=MAX_RETRIES, delay=RETRY_DELAY, backoff_factor=BACKOFF_FACTOR):
-    """API重试装饰器"""
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            last_exception = None
-            for attempt in range(max_retries):
-                try:
-                    print(f"[重试] API调用尝试 {attempt + 1}/{max_retries}", flush=True)
-                    result = func(*args, **kwargs)
-                    if attempt > 0:
-                        print(f"[重试] API调用在第 {attempt + 1} 次尝试后成功", flush=True)
-                    return result
-                except Exception as e:
-                    last_exception = e
-                    current_delay = delay * (backoff_factor ** attempt)
-                    print(f"[重试] API调用失败 (尝试 {attempt + 1}/{max_retries}): {str(e)}", flush=True)
-                    
-                    if attempt < max_retries - 1:
-                        print(f"[重试] 等待 {current_delay} 秒后重试...", flush=True)
-                        time.sleep(current_delay)
-                    else:
-                        print(f"[重试] 所有重试都失败，放弃API调用", flush=True)
-            
-            # 如果所有重试都失败，抛出最后一个异常
-            raise last_exception
-        return wrapper
-    return decorator
-
-def async_retry_api_call(max_retries=MAX_RETRIES, delay=RETRY_DELAY, backoff_factor=BACKOFF_FACTOR):
-    """异步API重试装饰器"""
-    def decorator(func):
-        async def wrapper(*args, **kwargs):
-            last_exception = None
-            for attempt in range(max_retries):
-                try:
-                    print(f"[重试] 异步API调用尝试 {attempt + 1}/{max_retries}", flush=True)
-                    result = await func(*args, **kwargs)
-                    if attempt > 0:
-                        print(f"[重试] 异步API调用在第 {attempt + 1} 次尝试后成功", flush=True)
-                    return result
-                except Exception as e:
-                    last_exception = e
-                    current_delay = delay * (backoff_factor ** attempt)
-                    print(f"[重试] 异步API调用失败 (尝试 {attempt + 1}/{max_retries}): {str(e)}", flush=True)
-                    
-                    if attempt < max_retries - 1:
-                        print(f"[重试] 等待 {current_delay} 秒后重试...", flush=True)
-                        await asyncio.sleep(current_delay)
-                    else:
-                        print(f"[重试] 所有异步重试都失败，放弃API调用", flush=True)
-            
-            # 如果所有重试都失败，抛出最后一个异常
-            raise last_exception
-        return wrapper
-    return decorator
+# 界面并发配置
+UI_CONCURRENCY_LIMIT = 32  # 界面事件的并发上限；实际分析任务的并发由任务队列控制
+JOB_POLL_INTERVAL = 0.5  # 界面轮询任务进度的间隔（秒）
+
+# 符合性分析缓存配置
+COMPLIANCE_CACHE_ENABLED = True
+COMPLIANCE_CACHE_PATH = os.path.join(WORKING_DIR, "compliance_cache.sqlite3")
+COMPLIANCE_CACHE_MAX_BYTES = 50 * 1024 * 1024  # 缓存内容总大小上限
+COMPLIANCE_CACHE_MAX_AGE = 7 * 24 * 3600  # 缓存条目最长保留时间（秒）
+COMPLIANCE_QUERY_MODE = "hybrid"  # LightRAG查询模式
+COMPLIANCE_SINGLE_PASS = True  # LightRAG只返回检索上下文，由一次流式调用直接按模板生成结论
+RULE_ENGINE_ENABLED = True  # 阈值表覆盖的牌号直接按规则判定，不调用RAG和LLM
+RAG_INDEX_STAMP_FILE = "rag_index_version.txt"  # 入库命令每次修改索引后在WORKING_DIR中写入的版本戳，作为缓存键中的索引版本
+RAG_INDEX_VERSION_FILES = (
+    "kv_store_full_docs.json", "kv_store_text_chunks.json", "kv_store_doc_status.json",
+    "vdb_chunks.json", "vdb_entities.json", "vdb_relationships.json", "graph_chunk_entity_relation.graphml",
+)  # 没有版本戳时据此计算索引版本；不含查询时会被重写的kv_store_llm_response_cache.json
+TOKEN_ENCODING = "o200k_base"  # 统计查询内容token数使用的tiktoken编码
+TOKEN_ENCODING_LOAD_TIMEOUT = 5  # 加载编码的最长等待时间（秒）；首次使用需下载编码文件，离线环境下超时后按字符估算
+
+# LightRAG并行配置：标准入库时实体抽取和嵌入的并发度
+RAG_MAX_PARALLEL_INSERT = 4  # 同时处理的文档数
+RAG_LLM_MAX_ASYNC = 16  # 同时进行的LLM调用数
+RAG_EMBEDDING_MAX_ASYNC = 16  # 同时进行的嵌入调用数
+RAG_EMBEDDING_BATCH_NUM = 32  # 每次嵌入调用的文本数
+
+# 启动预热配置
+WARMUP_ON_START = False  # 启动时在后台初始化LightRAG存储并预热嵌入和对话模型
+
+logger.debug("[启动] 配置参数加载完成")
+
+# 数值单位归一化：单位别名 -> (标准单位, 换算系数)
+UNIT_ALIASES = {
+    "n": ("N", 1), "kn": ("N", 1000),
+    "mpa": ("MPa", 1), "n/mm2": ("MPa", 1), "n/mm²": ("MPa", 1), "gpa": ("MPa", 1000), "kpa": ("MPa", 0.001),
+    "mm": ("mm", 1), "cm": ("mm", 10), "m": ("mm", 1000),
+    "%": ("%", 1),
+    "℃": ("°C", 1), "°c": ("°C", 1), "c": ("°C", 1),
+}
+NUMBER_WITH_UNIT_PATTERN = re.compile(r"^([-+]?\d+(?:\.\d+)?)\s*([^\d\s][^\s]*)?$")
 
-def extract_json_from_response(response_text):
-    """从LLM响应中提取JSON内容"""
+def _normalize_number(value):
+    """统一数值表示：整数值输出为int，其余保留6位有效数字"""
+    value = float(value)
+    if value.is_integer():
+        return int(value)
+    return float(f"{value:.6g}")
+
+def _canonicalize_value(value):
+    if isinstance(value, dict):
+        return {unicodedata.normalize("NFKC", str(key)).strip(): _canonicalize_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonicalize_value(item) for item in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return _normalize_number(value)
+    
+    text = " ".join(unicodedata.normalize("NFKC", str(value)).split())
+    match = NUMBER_WITH_UNIT_PATTERN.match(text)
+    if not match:
+        return text
+    number, unit = match.group(1), match.group(2)
+    if unit is None:
+        return _normalize_number(number)
+    canonical_unit, factor = UNIT_ALIASES.get(unit.lower(), (unit, 1))
+    return f"{_normalize_number(float(number) * factor)} {canonical_unit}"
+
+def canonicalize_report_json(report_json):
+    """将报告JSON规范化为稳定的字符串：键排序、数值和单位归一化"""
+    return json.dumps(_canonicalize_value(report_json), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+def get_rag_index_version(working_dir=WORKING_DIR):
+    """返回LightRAG索引版本号：优先使用入库命令写入的版本戳，没有版本戳时根据文档、文本块、实体和关系存储文件的大小和修改时间生成
+
+    LightRAG查询时会重写的LLM响应缓存不参与计算，符合性检查本身不会改变版本号。
+    """
     try:
-        print("[格式化] 开始提取JSON内容...", flush=True)
-        
-        # 尝试直接解析整个响应
+        with open(os.path.join(working_dir, RAG_INDEX_STAMP_FILE), encoding="utf-8") as f:
+            stamp = f.read().strip()
+        if stamp:
+            return stamp
+    except FileNotFoundError:
+        pass
+    digest = hashlib.sha256()
+    for name in RAG_INDEX_VERSION_FILES:
+        path = os.path.join(working_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def write_rag_index_stamp(working_dir=WORKING_DIR):
+    """入库修改索引后写入新的版本戳，此前的符合性分析缓存随之失效，返回新版本号"""
+    stamp = hashlib.sha256(f"{time.time_ns()}:{os.getpid()}".encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(working_dir, RAG_INDEX_STAMP_FILE)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(stamp)
+    os.replace(temp_path, path)
+    return stamp
+
+def make_compliance_cache_key(stage, report_json):
+    """生成符合性分析缓存键：阶段 + 规范化报告JSON + 索引版本 + 模型和查询模式"""
+    return ResultCache.make_key(stage, canonicalize_report_json(report_json), get_rag_index_version(), VL_MODEL, COMPLIANCE_QUERY_MODE)
+
+def _format_query_value(value):
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value).strip()
+
+def _serialize_report_section(path, value, lines):
+    if isinstance(value, dict):
+        scalars = [f"{key}={_format_query_value(item)}" for key, item in value.items() if not isinstance(item, (dict, list))]
+        if scalars:
+            lines.append(f"{path}: " + "; ".join(scalars))
+        for key, item in value.items():
+            if isinstance(item, (dict, list)):
+                _serialize_report_section(f"{path}/{key}", item, lines)
+    elif isinstance(value, list):
+        rows = [item for item in value if isinstance(item, dict)]
+        if rows and len(rows) == len(value):
+            # 表格数据只输出一次列名，每行只输出数值
+            columns = list(dict.fromkeys(key for row in rows for key in row))
+            lines.append(f"{path}: " + "|".join(columns))
+            for row in rows:
+                lines.append("|".join(_format_query_value(row.get(column, "")) for column in columns))
+        else:
+            lines.append(f"{path}: " + "; ".join(_format_query_value(item) for item in value))
+    elif value not in (None, ""):
+        lines.append(f"{path}: {_format_query_value(value)}")
+
+def serialize_report_for_query(report_json):
+    """将报告JSON序列化为紧凑的查询文本：每个部分一行键值对，表格只保留列名和数值"""
+    lines = []
+    for key, value in report_json.items():
+        _serialize_report_section(key, value, lines)
+    return "\n".join(lines)
+
+def strip_html(html_text):
+    """去除HTML标签和样式，仅保留可读文本"""
+    text = re.sub(r"<style.*?</style>", " ", html_text, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r"<[^>]+>", " ", text)
+    return " ".join(html.unescape(text).split())
+
+_token_encoder = None
+_token_encoder_lock = threading.Lock()
+
+def _load_token_encoder():
+    """加载tiktoken编码，失败或超过TOKEN_ENCODING_LOAD_TIMEOUT秒时返回False
+
+    本地没有编码文件时tiktoken会下载（请求没有超时，离线环境中可能一直等待），因此在后台线程中加载。
+    """
+    loaded = {}
+    
+    def load():
         try:
-            json_data = json.loads(response_text)
-            print("[格式化] 直接解析JSON成功", flush=True)
-            return json_data
-        except:
-            pass
-        
-        # 查找```json代码块
-        json_match = re.search(r'```json\s*\n(.*?)\n```', response_text, re.DOTALL | re.IGNORECASE)
-        if json_match:
-            json_str = json_match.group(1).strip()
-            try:
-                json_data = json.loads(json_str)
-                print("[格式化] 从代码块提取JSON成功", flush=True)
-                return json_data
-            except:
-                # 尝试使用json_repair修复
-                try:
-                    json_data = json_repair.loads(json_str)
-                    print("[格式化] JSON修复后解析成功", flush=True)
-                    return json_data
-                except:
-                    pass
-        
-        # 查找任何可能的JSON结构 - 更精确的匹配
-        json_patterns = [
-            r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}',  # 嵌套JSON
-            r'\{.*?\}',  # 简单JSON
-        ]
-        
-        for pattern in json_patterns:
-            json_matches = re.findall(pattern, response_text, re.DOTALL)
-            for match in json_matches:
-                if len(match) > 50:  # 过滤太短的匹配
-                    try:
-                        json_data = json.loads(match)
-                        print("[格式化] 从模式匹配提取JSON成功", flush=True)
-                        return json_data
-                    except:
-                        try:
-                            json_data = json_repair.loads(match)
-                            print("[格式化] JSON修复后解析成功", flush=True)
-                            return json_data
-                        except:
-                            continue
-        
-        print("[格式化] 无法提取JSON，返回原文本", flush=True)
-        return None
-        
-    except Exception as e:
-        print(f"[格式化] JSON提取异常: {str(e)}", flush=True)
-        return None
+            import tiktoken
+            loaded["encoder"] = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            loaded["error"] = e
+    
+    thread = threading.Thread(target=load, name="tiktoken-load", daemon=True)
+    thread.start()
+    thread.join(TOKEN_ENCODING_LOAD_TIMEOUT)
+    if "encoder" in loaded:
+        return loaded["encoder"]
+    reason = str(loaded["error"]) if "error" in loaded else f"{TOKEN_ENCODING_LOAD_TIMEOUT}秒内未完成"
+    logger.warning(f"[后台] 无法加载tiktoken编码 {TOKEN_ENCODING}（{reason}），token数改为按字符估算")
+    return False
+
+def count_tokens(text):
+    """统计文本token数；tiktoken未安装、编码文件下载失败或超时（如离线环境）时按字符估算"""
+    global _token_encoder
+    if _token_encoder is None:
+        with _token_encoder_lock:
+            if _token_encoder is None:
+                _token_encoder = _load_token_encoder()
+    if _token_encoder:
+        return len(_token_encoder.encode(text))
+    # 估算：中日韩字符约1个token，其他字符约4个字符1个token
+    cjk_chars = sum(1 for char in text if "\u4e00" <= char <= "\u9fff")
+    return cjk_chars + (len(text) - cjk_chars + 3) // 4
 
 def safe_get_nested_value(data, path, default="未知"):
     """安全地获取嵌套字典的值"""
@@ -162,6 +225,7 @@ def safe_get_nested_value(data, path, default="未知"):
     except:
         return default
 
+@traced("format_report_html")
 def format_test_data_html(json_data):
     """将测试数据格式化为HTML显示"""
     try:
@@ -190,9 +254,8 @@ def format_test_data_html(json_data):
         """)
         
         # 产品信息部分 - 智能适配不同的key名称
-        product_info_keys = ["产品信息", "基本信息", "试验信息", "材料信息", "产品基本信息"]
         product_info = None
-        for key in product_info_keys:
+        for key in PRODUCT_INFO_KEYS:
             if key in json_data:
                 product_info = json_data[key]
                 break
@@ -241,9 +304,8 @@ def format_test_data_html(json_data):
             html_parts.append('</div>')
         
         # 测试数据部分 - 智能适配不同的结构
-        test_data_keys = ["测试数据", "试验数据", "检测数据", "测量数据", "实验数据"]
         test_data = None
-        for key in test_data_keys:
+        for key in TEST_DATA_KEYS:
             if key in json_data:
                 test_data = json_data[key]
                 break
@@ -320,8 +382,7 @@ def format_test_data_html(json_data):
                 html_parts.append('</div></div>')
         
         # 其他信息
-        processed_keys = set(["产品信息", "基本信息", "试验信息", "材料信息", "产品基本信息", 
-                             "测试数据", "试验数据", "检测数据", "测量数据", "实验数据"])
+        processed_keys = set(PRODUCT_INFO_KEYS + TEST_DATA_KEYS)
         
         for key, value in json_data.items():
             if key not in processed_keys and value:
@@ -338,7 +399,7 @@ def format_test_data_html(json_data):
         return "".join(html_parts)
         
     except Exception as e:
-        print(f"[格式化] HTML格式化异常: {str(e)}", flush=True)
+        logger.warning(f"[格式化] HTML格式化异常: {str(e)}")
         return f"""
         <div style="padding: 20px; background: #fff3cd; border: 1px solid #ffeaa7; border-radius: 8px;">
             <h4 style="color: #d63031; margin: 0 0 10px 0;">⚠️ 格式化出错</h4>
@@ -347,14 +408,9 @@ def format_test_data_html(json_data):
         </div>
         """
 
-@retry_api_call(max_retries=MAX_RETRIES)
-def format_compliance_result(raw_result, report_json):
-    """调用LLM格式化标准符合性分析结果"""
-    print("[格式化] 开始格式化符合性分析结果...", flush=True)
-    
-    # 提取产品信息用于模板
+def get_conclusion_subject(report_json):
+    """从产品信息中提取结论模板使用的产品类型和规格描述"""
     product_type = "钢板"
-    material_name = "未知"
     thickness = "未知"
     
     if report_json and isinstance(report_json, dict):
@@ -365,15 +421,11 @@ def format_compliance_result(raw_result, report_json):
             thickness = product_info["材料名称"]
         if "试验类型" in product_info and "管" in product_info["试验类型"]:
             product_type = "钢管"
-    
-    format_prompt = f"""
-请将以下标准符合性分析结果格式化为规范的结论报告。
-
-原始分析结果：
-{raw_result}
-
-请按照以下模板格式化：
+    return product_type, thickness
 
+def get_conclusion_template(product_type, thickness):
+    """返回符合性结论的输出模板说明"""
+    return f"""
 如果符合标准，使用模板：
 "通过本次拉伸试验，测定了本批次{product_type}各项力学性能指标，结果表明{product_type} {thickness} 的各项指标符合相关中国标准要求：
 • 最大力指标符合：[标准号] [标准名] - [具体要求]
@@ -390,12 +442,41 @@ def format_compliance_result(raw_result, report_json):
 
 请保持简洁明了，突出关键信息。
 """
+
+@traced("rule_engine")
+def rule_based_compliance(report_json):
+    """按本地阈值表判定报告，返回结论文本；牌号未覆盖或数据不全时返回None"""
+    if not RULE_ENGINE_ENABLED or not report_json:
+        return None
+    start = time.perf_counter()
+    evaluation = evaluate_report(report_json)
+    if evaluation is None:
+        logger.info("[规则] 阈值表未覆盖该报告，使用RAG+LLM分析")
+        return None
+    product_type, thickness = get_conclusion_subject(report_json)
+    conclusion = format_rule_conclusion(evaluation, product_type, thickness)
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    logger.info(f"[规则] {evaluation['standard']} {evaluation['grade']} 厚度{evaluation['thickness']:g}mm，"
+                f"判定{len(evaluation['metrics'])}项指标，{'全部符合' if evaluation['passed'] else '存在不符合项'}，耗时 {elapsed_us:.0f} 微秒")
+    return conclusion
+
+@traced("format_compliance")
+@retry_api_call(max_retries=MAX_RETRIES)
+def format_compliance_result(raw_result, report_json):
+    """调用LLM格式化标准符合性分析结果"""
+    logger.info("[格式化] 开始格式化符合性分析结果...")
     
-    api_url = f"{BASE_URL}/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
+    # 提取产品信息用于模板
+    product_type, thickness = get_conclusion_subject(report_json)
+    
+    format_prompt = f"""
+请将以下标准符合性分析结果格式化为规范的结论报告。
+
+原始分析结果：
+{raw_result}
+
+请按照以下模板格式化：
+{get_conclusion_template(product_type, thickness)}"""
     
     payload = {
         "model": VL_MODEL,
@@ -409,25 +490,67 @@ def format_compliance_result(raw_result, report_json):
         "temperature": 0.1
     }
     
-    print("[格式化] 发送格式化请求到API...", flush=True)
-    response = requests.post(api_url, headers=headers, json=payload, timeout=60)
-    response.raise_for_status()
-    
-    result = response.json()
-    if "error" in result:
-        raise Exception(f"API返回错误: {result['error']}")
+    logger.debug("[格式化] 发送格式化请求到API...")
+    result = post_model_api("/chat/completions", payload)
     
     if "choices" in result and len(result["choices"]) > 0:
         formatted_result = result["choices"][0]["message"]["content"]
-        print("[格式化] 符合性结果格式化完成", flush=True)
+        logger.info("[格式化] 符合性结果格式化完成")
         return formatted_result
     else:
-        raise Exception("API响应格式错误")
+        raise ApiResponseError("API响应格式错误")
+
+def stream_compliance_conclusion(context, report_info, report_json):
+    """根据检索到的标准内容，用一次流式调用直接按模板生成结论，逐步产出累计的结论文本"""
+    product_type, thickness = get_conclusion_subject(report_json)
+    prompt = f"""
+请根据以下检索到的国家标准内容，判断这份报告是否符合国家标准，包括其中的每个指标是否都达到了国家标准的要求，并直接输出规范的结论报告。
+
+国家标准内容：
+{context}
 
+报告内容：
+{report_info}
+
+请按照以下模板输出：
+{get_conclusion_template(product_type, thickness)}"""
+    
+    payload = {
+        "model": VL_MODEL,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "max_tokens": 1500,
+        "temperature": 0.1
+    }
+    
+    logger.debug("[格式化] 发送流式结论请求到API...")
+    start = time.perf_counter()
+    text = ""
+    for event in stream_model_api("/chat/completions", payload):
+        choices = event.get("choices") or []
+        content = (choices[0].get("delta") or {}).get("content") if choices else None
+        if not content:
+            continue
+        if not text:
+            STAGE_DURATION.observe(time.perf_counter() - start, stage="conclusion_first_token")
+            logger.info(f"[格式化] 收到首个token，耗时 {time.perf_counter() - start:.2f} 秒")
+        text += content
+        yield text
+    
+    if not text:
+        raise ApiResponseError("API响应格式错误")
+    STAGE_DURATION.observe(time.perf_counter() - start, stage="conclusion_stream")
+    logger.info(f"[格式化] 流式结论生成完成，耗时 {time.perf_counter() - start:.2f} 秒，长度: {len(text)} 字符")
+
+@traced("format_compliance_html")
 def format_compliance_html(compliance_text):
     """将符合性分析结果格式化为HTML"""
     try:
-        print("[格式化] 开始HTML格式化符合性结果...", flush=True)
+        logger.debug("[格式化] 开始HTML格式化符合性结果...")
         
         # 分析结果的不同部分
         lines = compliance_text.strip().split('\n')
@@ -465,11 +588,11 @@ def format_compliance_html(compliance_text):
         html_parts.append('</div>')
         
         result = "".join(html_parts)
-        print("[格式化] 符合性HTML格式化完成", flush=True)
+        logger.debug("[格式化] 符合性HTML格式化完成")
         return result
         
     except Exception as e:
-        print(f"[格式化] HTML格式化异常: {str(e)}", flush=True)
+        logger.warning(f"[格式化] HTML格式化异常: {str(e)}")
         # 降级处理，至少保证可读性
         return f"""
         <div style="padding: 20px; background: #f8f9fa; border: 1px solid #dee2e6; border-radius: 8px; font-family: 'Microsoft YaHei', sans-serif;">
@@ -546,33 +669,134 @@ def format_paragraph_html(paragraph_text):
         </div>
         """
 
-print("[启动] 检查工作目录...", flush=True)
+logger.debug("[启动] 检查工作目录...")
 if not os.path.exists(WORKING_DIR):
-    print(f"[启动] 创建工作目录: {WORKING_DIR}", flush=True)
+    logger.info(f"[启动] 创建工作目录: {WORKING_DIR}")
     os.makedirs(WORKING_DIR)
 else:
-    print(f"[启动] 工作目录已存在: {WORKING_DIR}", flush=True)
+    logger.debug(f"[启动] 工作目录已存在: {WORKING_DIR}")
+
+class BackgroundEventLoop:
+    """在后台线程中长期运行的事件循环
+
+    LightRAG的存储和客户端绑定在初始化时所在的事件循环上，所有异步任务都提交到
+    这个唯一的循环中执行，同步的Gradio处理函数通过run()等待结果。
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台事件循环（已启动时直接返回）"""
+        with self._lock:
+            if self.loop is not None:
+                return self.loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+            
+            self.thread = threading.Thread(target=run_loop, name="asyncio-loop", daemon=True)
+            self.thread.start()
+            ready.wait()
+            self.loop = loop
+            logger.info("[后台] 后台事件循环已启动")
+            return loop
+
+    def run(self, coro, timeout=None):
+        """在后台事件循环中执行协程并阻塞等待结果"""
+        loop = self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        return future.result(timeout)
+
+    @staticmethod
+    async def _cancel_pending_tasks():
+        """取消循环中仍在等待的后台任务（如LightRAG的工作协程）"""
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        """取消剩余任务，停止后台事件循环并等待线程退出"""
+        with self._lock:
+            if self.loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._cancel_pending_tasks(), self.loop).result(timeout=10)
+            except Exception as e:
+                logger.warning(f"[后台] 取消后台任务失败: {str(e)}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=10)
+            self.loop.close()
+            self.loop = None
+            self.thread = None
+            logger.info("[后台] 后台事件循环已停止")
+
+background_loop = BackgroundEventLoop()
+
+def run_async(coro, timeout=None):
+    """在共享的后台事件循环中执行协程"""
+    return background_loop.run(coro, timeout)
 
-class PDFAnalyzer:
+class PDFAnalyzer(PDFExtractor):
     def __init__(self):
-        print("[启动] 初始化PDFAnalyzer...", flush=True)
+        logger.info("[启动] 初始化PDFAnalyzer...")
+        super().__init__(use_cache=RESULT_CACHE_ENABLED)
         self.lightrag_instance = None
         self.initialized = False
-        print("[启动] PDFAnalyzer初始化完成", flush=True)
+        self._rag_init_lock = None
+        self.compliance_cache = None
+        if COMPLIANCE_CACHE_ENABLED:
+            self.compliance_cache = ResultCache(
+                db_path=COMPLIANCE_CACHE_PATH,
+                max_bytes=COMPLIANCE_CACHE_MAX_BYTES,
+                max_age=COMPLIANCE_CACHE_MAX_AGE,
+                table="compliance_results"
+            )
+        self.readiness = {"status": "cold", "rag": False, "embedding": False, "chat": False, "error": None, "elapsed": None}
+        logger.info("[启动] PDFAnalyzer初始化完成")
     
     async def initialize_rag(self):
-        """初始化LightRAG实例"""
+        """初始化LightRAG实例
+
+        应在后台事件循环中调用（见run_async），并发调用时只会初始化一次。
+        """
         if self.initialized:
-            print("[后台] LightRAG已初始化，直接返回实例", flush=True)
+            logger.debug("[后台] LightRAG已初始化，直接返回实例")
             return self.lightrag_instance
-            
-        print("[后台] 开始初始化LightRAG实例...", flush=True)
-        print(f"[后台] 工作目录: {WORKING_DIR}", flush=True)
-        print(f"[后台] 使用模型: {VL_MODEL}", flush=True)
-        print(f"[后台] 嵌入模型: {EMBEDDING_MODEL}", flush=True)
+        
+        if self._rag_init_lock is None:
+            self._rag_init_lock = asyncio.Lock()
+        async with self._rag_init_lock:
+            if self.initialized:
+                return self.lightrag_instance
+            return await self._create_rag_instance()
+    
+    async def _create_rag_instance(self):
+        """创建LightRAG实例并初始化存储系统"""
+        # lightrag在首次使用时才导入，只做PDF提取时无需加载
+        from lightrag import LightRAG
+        from lightrag.llm.openai import openai_embed, openai_complete_if_cache
+        from lightrag.utils import EmbeddingFunc, setup_logger
+        
+        setup_logger("lightrag", level="INFO")
+        logger.info("[后台] 开始初始化LightRAG实例...")
+        logger.info(f"[后台] 工作目录: {WORKING_DIR}")
+        logger.debug(f"[后台] 使用模型: {VL_MODEL}")
+        logger.info(f"[后台] 嵌入模型: {EMBEDDING_MODEL}")
         
         self.lightrag_instance = LightRAG(
             working_dir=WORKING_DIR,
+            max_parallel_insert=RAG_MAX_PARALLEL_INSERT,
+            llm_model_max_async=RAG_LLM_MAX_ASYNC,
+            embedding_func_max_async=RAG_EMBEDDING_MAX_ASYNC,
+            embedding_batch_num=RAG_EMBEDDING_BATCH_NUM,
             llm_model_func=lambda prompt, system_prompt=None, history_messages=[], **kwargs: openai_complete_if_cache(
                 VL_MODEL,
                 prompt,
@@ -594,252 +818,252 @@ class PDFAnalyzer:
             )
         )
         
-        print("[后台] 正在初始化存储系统...", flush=True)
+        logger.info("[后台] 正在初始化存储系统...")
         await self.lightrag_instance.initialize_storages()
         self.initialized = True
-        print("[后台] LightRAG初始化完成", flush=True)
+        logger.info("[后台] LightRAG初始化完成")
         return self.lightrag_instance
     
-    @retry_api_call(max_retries=MAX_RETRIES)
-    def call_vision_api_with_base64(self, base64_image, question):
-        """使用base64编码的图像调用视觉API"""
-        print("[后台] 正在调用视觉API...", flush=True)
-        api_url = f"{BASE_URL}/chat/completions"
-        
-        headers = {
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        image_url = f"data:image/png;base64,{base64_image}"
-        print(f"[后台] API URL: {api_url}", flush=True)
-        print(f"[后台] 使用模型: {VL_MODEL}", flush=True)
-        print(f"[后台] 图像大小: {len(base64_image)} 字符", flush=True)
-
-        payload = {
-            "model": VL_MODEL,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": image_url}},
-                        {"type": "text", "text": question}
-                    ]
-                }
-            ],
-            "max_tokens": 2048
-        }
-
-        print("[后台] 发送API请求...", flush=True)
-        response = requests.post(api_url, headers=headers, json=payload, timeout=60)
-        response.raise_for_status()
-        print("[后台] API请求成功", flush=True)
-        
-        result = response.json()
-        
-        # 检查API响应是否包含错误
-        if "error" in result:
-            raise Exception(f"API返回错误: {result['error']}")
-        
-        return result
-
-    def analyze_pdf(self, pdf_path, question):
-        """分析PDF文件的每一页"""
+    async def finalize_rag(self):
+        """关闭LightRAG存储，将内存中的数据写回工作目录"""
+        if not self.initialized:
+            return
+        logger.info("[后台] 正在关闭LightRAG存储...")
+        await self.lightrag_instance.finalize_storages()
+        self.lightrag_instance = None
+        self.initialized = False
+        logger.info("[后台] LightRAG存储已关闭")
+    
+    async def warm_up(self):
+        """预热：初始化LightRAG存储，并各执行一次极小的嵌入调用和对话调用"""
+        logger.info("[预热] 开始预热...")
+        start = time.perf_counter()
+        self.readiness.update({"status": "warming", "error": None})
         try:
-            print(f"[后台] 开始分析PDF文件: {pdf_path}", flush=True)
-            doc = fitz.open(pdf_path)
-            total_pages = len(doc)
-            print(f"[后台] PDF总页数: {total_pages}", flush=True)
-            all_results = []
+            await self.initialize_rag()
+            self.readiness["rag"] = True
+            logger.info("[预热] LightRAG存储初始化完成")
             
-            for page_num in range(total_pages):
-                print(f"[后台] 正在处理第 {page_num + 1}/{total_pages} 页...", flush=True)
-                page = doc.load_page(page_num)
-                
-                # 将页面渲染为图像
-                print(f"[后台] 第{page_num + 1}页: 开始渲染图像...", flush=True)
-                zoom = 2
-                mat = fitz.Matrix(zoom, zoom)
-                pix = page.get_pixmap(matrix=mat)
-                
-                # 获取图像字节
-                img_bytes = pix.tobytes("png")
-                print(f"[后台] 第{page_num + 1}页: 图像大小 {len(img_bytes)} 字节", flush=True)
-                
-                # Base64编码
-                print(f"[后台] 第{page_num + 1}页: 进行Base64编码...", flush=True)
-                base64_image = base64.b64encode(img_bytes).decode('utf-8')
-                
-                # 调用API分析图像（带重试机制）
-                print(f"[后台] 第{page_num + 1}页: 开始API分析...", flush=True)
-                try:
-                    result = self.call_vision_api_with_base64(base64_image, question)
-                    print(f"[后台] 第{page_num + 1}页: 分析完成", flush=True)
-                    
-                    all_results.append({
-                        "page": page_num + 1,
-                        "result": result
-                    })
-                except Exception as api_error:
-                    print(f"[后台] 第{page_num + 1}页: API调用最终失败: {str(api_error)}", flush=True)
-                    # 继续处理其他页面，但记录错误
-                    all_results.append({
-                        "page": page_num + 1,
-                        "result": {"error": f"API调用失败: {str(api_error)}"}
-                    })
+            await self.lightrag_instance.embedding_func(["预热"])
+            self.readiness["embedding"] = True
+            logger.info("[预热] 嵌入模型调用完成")
+            
+            payload = {
+                "model": VL_MODEL,
+                "messages": [{"role": "user", "content": "ping"}],
+                "max_tokens": 1
+            }
+            await asyncio.to_thread(post_model_api, "/chat/completions", payload)
+            self.readiness["chat"] = True
+            logger.info("[预热] 对话模型调用完成")
             
-            doc.close()
-            print(f"[后台] PDF分析完成，共处理 {total_pages} 页", flush=True)
-            return all_results
+            self.readiness["status"] = "ready"
         except Exception as e:
-            error_msg = f"处理PDF时出错: {str(e)}"
-            print(f"[后台] 错误: {error_msg}", flush=True)
-            return {"error": error_msg}
-
-    @async_retry_api_call(max_retries=MAX_RETRIES)
-    async def analyze_report_compliance(self, report_info):
-        """使用LightRAG分析报告是否符合国家标准"""
-        print("[后台] 开始分析报告符合性...", flush=True)
+            # 预热失败不影响服务，首个请求会按需重新初始化
+            self.readiness.update({"status": "failed", "error": str(e)})
+            logger.warning(f"[预热] 预热失败: {str(e)}")
+        finally:
+            self.readiness["elapsed"] = round(time.perf_counter() - start, 2)
+        logger.info(f"[预热] 预热结束，状态: {self.readiness['status']}，耗时 {self.readiness['elapsed']} 秒")
+        return self.readiness
+    
+    def start_warm_up(self):
+        """在后台事件循环中启动预热，不阻塞调用方"""
+        loop = background_loop.start()
+        return asyncio.run_coroutine_threadsafe(self.warm_up(), loop)
+    
+    def get_readiness(self):
+        """返回当前就绪状态的副本"""
+        return dict(self.readiness)
+    
+    @async_retry_api_call(max_retries=MAX_RETRIES, endpoint=BASE_URL)
+    async def query_rag(self, query, only_need_context=False):
+        """向LightRAG发送一次查询，经过重试策略和模型服务的熔断器"""
+        from lightrag import QueryParam
+        
+        return await self.lightrag_instance.aquery(
+            query,
+            param=QueryParam(mode=COMPLIANCE_QUERY_MODE, only_need_context=only_need_context)
+        )
+
+    @traced("rag_query")
+    async def analyze_report_compliance(self, report_info, report_json=None):
+        """使用LightRAG分析报告是否符合国家标准
+
+        提供report_json时按规范化的报告JSON和当前索引版本缓存查询结果；缓存的读写不经过熔断器，
+        熔断期间已缓存的报告仍可返回结果，缓存命中也不会被当作探测成功。
+        """
+        logger.info("[后台] 开始分析报告符合性...")
+        cache_key = None
+        if self.compliance_cache is not None and report_json:
+            cache_key = make_compliance_cache_key("rag_query", report_json)
+            cached_result = self.compliance_cache.get(cache_key)
+            if cached_result is not None:
+                logger.info("[后台] 命中符合性查询缓存")
+                return cached_result
+        
         await self.initialize_rag()
         
         query = f"请判断这份报告是否符合国家标准，包括其中的每个指标是否都达到了国家标准的要求，并给出判断依据。\n{report_info}"
-        print("[后台] 构建查询语句完成", flush=True)
-        print(f"[后台] 查询内容长度: {len(query)} 字符", flush=True)
+        logger.debug("[后台] 构建查询语句完成")
+        logger.debug(f"[后台] 查询内容长度: {len(query)} 字符")
         
-        mode = "hybrid"
-        print(f"[后台] 使用查询模式: {mode}", flush=True)
-        print("[后台] 正在向LightRAG发送查询请求...", flush=True)
+        logger.debug(f"[后台] 使用查询模式: {COMPLIANCE_QUERY_MODE}")
+        logger.debug("[后台] 正在向LightRAG发送查询请求...")
         
-        res = await self.lightrag_instance.aquery(
-            query,
-            param=QueryParam(mode=mode, only_need_context=False)
-        )
+        res = await self.query_rag(query)
         
-        print("[后台] LightRAG查询完成", flush=True)
-        print(f"[后台] 返回结果长度: {len(str(res))} 字符", flush=True)
+        logger.info("[后台] LightRAG查询完成")
+        logger.debug(f"[后台] 返回结果长度: {len(str(res))} 字符")
+        if cache_key is not None and res:
+            self.compliance_cache.put(cache_key, str(res))
         return res
 
+    @traced("rag_context")
+    async def retrieve_compliance_context(self, report_info, report_json=None):
+        """只从LightRAG检索与报告相关的国家标准内容，不调用LLM生成回答
+
+        提供report_json时按规范化的报告JSON和当前索引版本缓存检索结果，缓存的读写同样不经过熔断器。
+        """
+        logger.info("[后台] 开始检索国家标准内容...")
+        cache_key = None
+        if self.compliance_cache is not None and report_json:
+            cache_key = make_compliance_cache_key("rag_context", report_json)
+            cached_result = self.compliance_cache.get(cache_key)
+            if cached_result is not None:
+                logger.info("[后台] 命中标准检索缓存")
+                return cached_result
+        
+        await self.initialize_rag()
+        
+        query = f"请判断这份报告是否符合国家标准，包括其中的每个指标是否都达到了国家标准的要求，并给出判断依据。\n{report_info}"
+        logger.debug(f"[后台] 使用查询模式: {COMPLIANCE_QUERY_MODE}，只返回检索上下文")
+        context = await self.query_rag(query, only_need_context=True)
+        
+        logger.info(f"[后台] 标准检索完成，上下文长度: {len(str(context))} 字符")
+        if cache_key is not None and context:
+            self.compliance_cache.put(cache_key, str(context))
+        return context
+
 # 创建全局分析器实例
-print("[后台] 正在创建PDF分析器实例...", flush=True)
+logger.info("[后台] 正在创建PDF分析器实例...")
 try:
     analyzer = PDFAnalyzer()
-    print("[后台] PDF分析器实例创建成功", flush=True)
+    logger.info("[后台] PDF分析器实例创建成功")
 except Exception as e:
-    print(f"[后台] 创建PDF分析器失败: {str(e)}", flush=True)
+    logger.error(f"[后台] 创建PDF分析器失败: {str(e)}")
     raise
 
+def shutdown():
+    """进程退出时关闭LightRAG存储、后台事件循环和HTTP连接，并按配置写出指标文件"""
+    if background_loop.loop is not None:
+        try:
+            run_async(analyzer.finalize_rag(), timeout=60)
+        except Exception as e:
+            logger.warning(f"[后台] 关闭LightRAG存储失败: {str(e)}")
+        background_loop.stop()
+    close_http_client()
+    shutdown_render_pool()
+    if METRICS_FILE:
+        write_metrics_file(METRICS_FILE)
+
+atexit.register(shutdown)
 
-def process_pdf_file(file):
-    """处理上传的PDF文件"""
-    print("[后台] ========== 开始处理PDF文件 ==========", flush=True)
+
+def process_pdf_file(file, progress=None):
+    """处理上传的PDF文件
+
+    返回 (状态文本, 报告HTML, 报告JSON)，报告JSON由调用方按会话保存，未能提取时为None。
+    progress为可选的进度回调，接收一条进度说明文本。
+    """
+    logger.info("[后台] ========== 开始处理PDF文件 ==========")
     
     # 立即输出以确认函数被调用
     import sys
     sys.stdout.flush()
     
     if file is None:
-        print("[后台] 错误: 未上传文件", flush=True)
-        return "请上传PDF文件", ""
+        logger.warning("[后台] 错误: 未上传文件")
+        return "请上传PDF文件", "", None
     
-    print(f"[后台] 接收到文件: {file.name}", flush=True)
-    print(f"[后台] 文件对象类型: {type(file)}", flush=True)
-    print(f"[后台] 文件是否存在: {hasattr(file, 'name')}", flush=True)
+    logger.info(f"[后台] 接收到文件: {file.name}")
+    logger.debug(f"[后台] 文件对象类型: {type(file)}")
+    logger.debug(f"[后台] 文件是否存在: {hasattr(file, 'name')}")
     
     # 检查文件路径是否存在
     import os
     if hasattr(file, 'name') and file.name:
         file_exists = os.path.exists(file.name)
-        print(f"[后台] 文件路径存在: {file_exists}", flush=True)
+        logger.debug(f"[后台] 文件路径存在: {file_exists}")
         if not file_exists:
-            print(f"[后台] 错误: 文件路径不存在 {file.name}", flush=True)
-            return "文件路径不存在", ""
+            logger.warning(f"[后台] 错误: 文件路径不存在 {file.name}")
+            return "文件路径不存在", "", None
     
     try:
-        # 第一步：提取PDF信息
-        question = "请详细分析这份拉伸测试报告，提取出产品的关键信息，比如产品型号、参数等，以及所有的关键数据，可能的维度包括但不限于最大力、屈服强度、抗拉强度、断后伸长率等，并以JSON格式返回。"
-        print("[后台] 分析问题设置完成", flush=True)
-        
-        print("[后台] 开始调用PDF分析器...", flush=True)
-        results = analyzer.analyze_pdf(file.name, question)
+        # 第一步：提取PDF信息，多页报告按REPORT_STITCH_MODE合并为一份完整报告
+        logger.info("[后台] 开始调用PDF分析器（逐页流式处理）...")
+        try:
+            progress_callback = None
+            if progress is not None:
+                progress_callback = lambda done, total: progress(f"已分析 {done}/{total} 页")
+            report = analyzer.extract_report(file.name, REPORT_QUESTION, progress_callback=progress_callback)
+        except Exception as e:
+            logger.warning(f"[后台] PDF分析失败: 处理PDF时出错: {str(e)}")
+            return f"PDF分析失败: 处理PDF时出错: {str(e)}", "", None
         
-        if isinstance(results, dict) and "error" in results:
-            print(f"[后台] PDF分析失败: {results['error']}", flush=True)
-            return f"PDF分析失败: {results['error']}", ""
+        logger.debug("[后台] 开始提取分析结果...")
+        error_summary = report["errors"]
         
-        print("[后台] 开始提取分析结果...", flush=True)
-        # 提取第一页的分析结果
-        if results and len(results) > 0:
-            print(f"[后台] 获得 {len(results)} 页分析结果", flush=True)
+        if report["raw"] is not None:
+            raw_report_info, json_data = report["raw"], report["json"]
+            logger.debug("[后台] 开始格式化报告信息...")
             
-            # 查找第一个成功的结果
-            successful_result = None
-            for result_item in results:
-                result = result_item["result"]
-                if not isinstance(result, dict) or "error" not in result:
-                    successful_result = result_item
-                    break
-                    
-            if successful_result:
-                result = successful_result["result"]
-                if "choices" in result and len(result["choices"]) > 0:
-                    raw_report_info = result["choices"][0]["message"]["content"]
-                    print(f"[后台] 提取原始报告信息成功，长度: {len(raw_report_info)} 字符", flush=True)
-                    
-                    # 提取并格式化JSON内容
-                    print("[后台] 开始格式化报告信息...", flush=True)
-                    json_data = extract_json_from_response(raw_report_info)
-                    
-                    if json_data:
-                        # 格式化为HTML显示
-                        formatted_html = format_test_data_html(json_data)
-                        print("[后台] 报告信息格式化完成", flush=True)
-                        print("[后台] ========== PDF处理完成 ===========", flush=True)
-                        
-                        # 将JSON数据存储起来供后续使用
-                        if not hasattr(analyzer, 'last_report_json'):
-                            analyzer.last_report_json = {}
-                        analyzer.last_report_json = json_data
-                        
-                        return "PDF信息提取完成", formatted_html
-                    else:
-                        # 如果无法提取JSON，返回原始格式化的文本
-                        print("[后台] 无法提取JSON，返回原始内容", flush=True)
-                        formatted_text = raw_report_info.replace('\n', '<br>').replace('```json', '<pre>').replace('```', '</pre>')
-                        print("[后台] ========== PDF处理完成 ===========", flush=True)
-                        return "PDF信息提取完成（原始格式）", formatted_text
-                else:
-                    print("[后台] 错误: PDF分析结果格式错误", flush=True)
-                    return "PDF分析结果格式错误", ""
+            if json_data:
+                # 格式化为HTML显示
+                formatted_html = format_test_data_html(json_data)
+                logger.debug("[后台] 报告信息格式化完成")
+                logger.info("[后台] ========== PDF处理完成 ===========")
+                
+                return "PDF信息提取完成", formatted_html, json_data
             else:
-                # 所有页面都失败了
-                error_summary = []
-                for result_item in results:
-                    if isinstance(result_item["result"], dict) and "error" in result_item["result"]:
-                        error_summary.append(f"第{result_item['page']}页: {result_item['result']['error']}")
+                # 如果无法提取JSON，返回原始格式化的文本
+                logger.warning("[后台] 无法提取JSON，返回原始内容")
+                formatted_text = raw_report_info.replace('\n', '<br>').replace('```json', '<pre>').replace('```', '</pre>')
+                logger.info("[后台] ========== PDF处理完成 ===========")
+                return "PDF信息提取完成（原始格式）", formatted_text, None
+        elif report["format_error"]:
+            logger.warning("[后台] 错误: PDF分析结果格式错误")
+            return "PDF分析结果格式错误", "", None
+        elif error_summary:
+            # 所有页面都失败了
+            error_msg = f"所有页面分析都失败了:\n" + "\n".join(error_summary[:3])  # 只显示前3个错误
+            if len(error_summary) > 3:
+                error_msg += f"\n... 以及其他 {len(error_summary) - 3} 个错误"
                 
-                error_msg = f"所有页面分析都失败了:\n" + "\n".join(error_summary[:3])  # 只显示前3个错误
-                if len(error_summary) > 3:
-                    error_msg += f"\n... 以及其他 {len(error_summary) - 3} 个错误"
-                    
-                print(f"[后台] 所有页面都失败: {error_msg}", flush=True)
-                return error_msg, ""
+            logger.warning(f"[后台] 所有页面都失败: {error_msg}")
+            return error_msg, "", None
         else:
-            print("[后台] 错误: 未能获取PDF分析结果", flush=True)
-            return "未能获取PDF分析结果", ""
+            logger.warning("[后台] 错误: 未能获取PDF分析结果")
+            return "未能获取PDF分析结果", "", None
             
     except Exception as e:
         error_msg = f"处理PDF时出错: {str(e)}"
-        print(f"[后台] 异常: {error_msg}", flush=True)
-        print(f"[后台] 异常类型: {type(e)}", flush=True)
+        logger.error(f"[后台] 异常: {error_msg}")
+        logger.error(f"[后台] 异常类型: {type(e)}")
         import traceback
-        print(f"[后台] 异常堆栈: {traceback.format_exc()}", flush=True)
-        return error_msg, ""
+        logger.error(f"[后台] 异常堆栈: {traceback.format_exc()}")
+        return error_msg, "", None
+
+def analyze_compliance(report_info, report_json=None, progress=None, partial=None):
+    """分析报告是否符合国家标准
 
-def analyze_compliance(report_info):
-    """分析报告是否符合国家标准"""
-    print("[后台] ========== 开始标准符合性分析 ==========", flush=True)
+    report_json为当前会话提取的报告JSON，序列化为紧凑文本后用于检索查询，并填充结论模板中的产品信息；
+    没有JSON时从report_info的HTML中提取纯文本。
+    progress为可选的进度回调，接收一条进度说明文本；partial为可选的回调，单次流式模式下接收生成中的结论文本。
+    """
+    logger.info("[后台] ========== 开始标准符合性分析 ==========")
     if not report_info.strip():
-        print("[后台] 错误: 报告信息为空", flush=True)
+        logger.warning("[后台] 错误: 报告信息为空")
         return """
         <div style="padding: 20px; background: #e2e3e5; border: 2px solid #c6c8ca; border-radius: 8px; font-family: 'Microsoft YaHei', sans-serif; text-align: center;">
             <h4 style="color: #6c757d; margin: 0 0 10px 0;">📋 等待分析</h4>
@@ -847,73 +1071,221 @@ def analyze_compliance(report_info):
         </div>
         """
     
-    print(f"[后台] 报告信息长度: {len(report_info)} 字符", flush=True)
+    logger.debug(f"[后台] 报告信息长度: {len(report_info)} 字符")
     
     try:
-        print("[后台] 创建新的事件循环...", flush=True)
-        # 使用asyncio运行异步函数
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            print("[后台] 开始执行异步分析任务...", flush=True)
-            raw_result = loop.run_until_complete(analyzer.analyze_report_compliance(report_info))
-            print(f"[后台] 原始分析完成，结果长度: {len(str(raw_result))} 字符", flush=True)
-            
-            # 格式化分析结果
+        # 阈值表覆盖的牌号直接按规则判定
+        rule_result = rule_based_compliance(report_json)
+        if rule_result is not None:
+            logger.info("[后台] ========== 标准符合性分析完成 ===========")
+            return format_compliance_html(rule_result)
+        
+        # 异步分析任务统一在共享的后台事件循环中执行
+        # 相同报告在索引未更新时直接返回缓存的结论
+        format_cache_key = None
+        if analyzer.compliance_cache is not None and report_json:
+            format_cache_key = make_compliance_cache_key("formatted", report_json)
+            cached_result = analyzer.compliance_cache.get(format_cache_key)
+            if cached_result is not None:
+                logger.info("[后台] 命中符合性结论缓存")
+                logger.info("[后台] ========== 标准符合性分析完成 ===========")
+                return format_compliance_html(cached_result)
+        
+        # 查询使用紧凑的报告JSON序列化文本，而不是带样式的HTML
+        if report_json:
+            query_info = serialize_report_for_query(report_json)
+        else:
+            query_info = strip_html(report_info)
+        html_tokens = count_tokens(report_info)
+        query_tokens = count_tokens(query_info)
+        logger.info(f"[后台] 查询报告内容: HTML {html_tokens} tokens -> 紧凑文本 {query_tokens} tokens，节省 {html_tokens - query_tokens} tokens")
+        
+        if COMPLIANCE_SINGLE_PASS:
+            # LightRAG只检索标准内容，结论由一次流式调用直接按模板生成
+            logger.info("[后台] 开始检索标准内容（单次流式模式）...")
+            if progress is not None:
+                progress("正在检索国家标准库...")
+            context = run_async(analyzer.retrieve_compliance_context(query_info, report_json))
+            if progress is not None:
+                progress("正在生成符合性结论...")
+            formatted_result = ""
             try:
-                print("[后台] 开始格式化符合性分析结果...", flush=True)
-                report_json = getattr(analyzer, 'last_report_json', None)
-                formatted_result = format_compliance_result(str(raw_result), report_json)
-                print("[后台] 符合性分析结果格式化完成", flush=True)
-                
-                # 将结果转换为HTML格式显示
+                for formatted_result in stream_compliance_conclusion(context, query_info, report_json):
+                    if partial is not None:
+                        partial(formatted_result)
+            except Exception as stream_error:
+                # 已经输出了部分结论时不再重新生成
+                if formatted_result:
+                    raise
+                logger.warning(f"[后台] 流式结论生成失败，改用检索+格式化两步流程: {str(stream_error)}")
+            else:
+                if format_cache_key is not None:
+                    analyzer.compliance_cache.put(format_cache_key, formatted_result)
                 html_result = format_compliance_html(formatted_result)
-                print("[后台] ========== 标准符合性分析完成 ===========", flush=True)
+                logger.info("[后台] ========== 标准符合性分析完成 ===========")
                 return html_result
-            except Exception as format_error:
-                print(f"[后台] 格式化失败，返回原始结果: {str(format_error)}", flush=True)
-                print("[后台] ========== 标准符合性分析完成 ===========", flush=True)
-                # 原始结果也转换为HTML显示
-                return format_compliance_html(str(raw_result))
-        finally:
-            print("[后台] 关闭事件循环", flush=True)
-            loop.close()
-    except Exception as e:
-        error_msg = f"标准符合性分析失败: {str(e)}"
-        print(f"[后台] 异常: {error_msg}", flush=True)
-        # 如果是重试机制失败，提供更友好的错误信息
-        if "重试" in str(e) or "API调用失败" in str(e):
-            error_html = f"""
-            <div style="padding: 20px; background: #f8d7da; border: 2px solid #f5c6cb; border-radius: 8px; font-family: 'Microsoft YaHei', sans-serif;">
-                <h4 style="color: #721c24; margin: 0 0 10px 0;">⚠️ 服务暂时不可用</h4>
-                <p style="color: #721c24; line-height: 1.6; margin: 0;">分析服务暂时不可用，请稍后重试。</p>
-                <details style="margin-top: 15px;">
-                    <summary style="color: #721c24; cursor: pointer;">查看详细错误信息</summary>
-                    <pre style="background: #721c24; color: white; padding: 10px; margin-top: 10px; border-radius: 4px; font-size: 12px; overflow-x: auto;">{error_msg}</pre>
-                </details>
-            </div>
-            """
-            return error_html
         
-        # 其他错误的HTML格式化
-        return f"""
-        <div style="padding: 20px; background: #fff3cd; border: 2px solid #ffeaa7; border-radius: 8px; font-family: 'Microsoft YaHei', sans-serif;">
-            <h4 style="color: #856404; margin: 0 0 10px 0;">❗ 分析过程出现问题</h4>
-            <p style="color: #856404; line-height: 1.6; margin: 0;">标准符合性分析过程中出现异常，请检查PDF文件内容或稍后重试。</p>
+        logger.debug("[后台] 开始执行异步分析任务...")
+        if progress is not None:
+            progress("正在检索国家标准库...")
+        raw_result = run_async(analyzer.analyze_report_compliance(query_info, report_json))
+        logger.info(f"[后台] 原始分析完成，结果长度: {len(str(raw_result))} 字符")
+        
+        # 格式化分析结果
+        try:
+            logger.info("[后台] 开始格式化符合性分析结果...")
+            if progress is not None:
+                progress("正在生成符合性结论...")
+            formatted_result = format_compliance_result(str(raw_result), report_json)
+            logger.info("[后台] 符合性分析结果格式化完成")
+            if format_cache_key is not None:
+                analyzer.compliance_cache.put(format_cache_key, formatted_result)
+            
+            # 将结果转换为HTML格式显示
+            html_result = format_compliance_html(formatted_result)
+            logger.info("[后台] ========== 标准符合性分析完成 ===========")
+            return html_result
+        except Exception as format_error:
+            logger.warning(f"[后台] 格式化失败，返回原始结果: {str(format_error)}")
+            logger.info("[后台] ========== 标准符合性分析完成 ===========")
+            # 原始结果也转换为HTML显示
+            return format_compliance_html(str(raw_result))
+    except Exception as e:
+        logger.error(f"[后台] 异常: 标准符合性分析失败: {str(e)}")
+        return format_compliance_error_html(str(e))
+
+def format_compliance_error_html(error):
+    """将标准符合性分析的异常格式化为HTML提示"""
+    error_msg = f"标准符合性分析失败: {error}"
+    # 如果是重试机制失败，提供更友好的错误信息
+    if "重试" in error or "API调用失败" in error:
+        error_html = f"""
+        <div style="padding: 20px; background: #f8d7da; border: 2px solid #f5c6cb; border-radius: 8px; font-family: 'Microsoft YaHei', sans-serif;">
+            <h4 style="color: #721c24; margin: 0 0 10px 0;">⚠️ 服务暂时不可用</h4>
+            <p style="color: #721c24; line-height: 1.6; margin: 0;">分析服务暂时不可用，请稍后重试。</p>
             <details style="margin-top: 15px;">
-                <summary style="color: #856404; cursor: pointer;">查看详细错误信息</summary>
-                <pre style="background: #856404; color: white; padding: 10px; margin-top: 10px; border-radius: 4px; font-size: 12px; overflow-x: auto;">{error_msg}</pre>
+                <summary style="color: #721c24; cursor: pointer;">查看详细错误信息</summary>
+                <pre style="background: #721c24; color: white; padding: 10px; margin-top: 10px; border-radius: 4px; font-size: 12px; overflow-x: auto;">{error_msg}</pre>
             </details>
         </div>
         """
+        return error_html
+    
+    # 其他错误的HTML格式化
+    return f"""
+    <div style="padding: 20px; background: #fff3cd; border: 2px solid #ffeaa7; border-radius: 8px; font-family: 'Microsoft YaHei', sans-serif;">
+        <h4 style="color: #856404; margin: 0 0 10px 0;">❗ 分析过程出现问题</h4>
+        <p style="color: #856404; line-height: 1.6; margin: 0;">标准符合性分析过程中出现异常，请检查PDF文件内容或稍后重试。</p>
+        <details style="margin-top: 15px;">
+            <summary style="color: #856404; cursor: pointer;">查看详细错误信息</summary>
+            <pre style="background: #856404; color: white; padding: 10px; margin-top: 10px; border-radius: 4px; font-size: 12px; overflow-x: auto;">{error_msg}</pre>
+        </details>
+    </div>
+    """
+
+# 后台任务队列：界面事件只负责提交任务和展示进度
+job_queue = JobQueue()
+
+async def _watch_job(job):
+    """异步轮询任务进度，逐条产出 ("message", 进度消息)；任务更新中间结果时产出 ("partial", 最新中间结果)，任务结束后返回"""
+    seen = 0
+    partial_version = 0
+    while True:
+        messages, finished = job.progress_since(seen)
+        seen += len(messages)
+        for message in messages:
+            yield "message", message
+        partial, version = job.partial_since(partial_version)
+        if version != partial_version:
+            partial_version = version
+            yield "partial", partial
+        if finished:
+            return
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+def format_progress_html(message):
+    """将任务进度格式化为HTML提示"""
+    return f"""
+    <div style="padding: 15px; background: #e7f1ff; border: 1px solid #b6d4fe; border-radius: 8px; font-family: 'Microsoft YaHei', sans-serif;">
+        <p style="color: #084298; margin: 0;">⏳ {message}</p>
+    </div>
+    """
+
+async def process_pdf_file_stream(file, report_json):
+    """界面事件：提交PDF处理任务并流式返回进度
+
+    report_json是当前会话的报告状态，处理完成前保持不变，完成后替换为新的提取结果。
+    """
+    if file is None:
+        yield "请上传PDF文件", "", report_json
+        return
+    
+    try:
+        job = job_queue.submit("extract", lambda job, file: process_pdf_file(file, progress=job.report), file)
+    except JobQueueFullError as e:
+        yield f"系统繁忙，请稍后重试（{str(e)}）", "", report_json
+        return
+    
+    yield f"任务 {job.id} 已提交，排队中...", "", report_json
+    async for _, message in _watch_job(job):
+        yield f"任务 {job.id}: {message}", "", report_json
+    
+    if job.status == "done":
+        yield job.result
+    else:
+        yield f"处理PDF时出错: {job.error}", "", None
+
+async def analyze_compliance_stream(report_info, report_json):
+    """界面事件：提交标准符合性分析任务并流式返回进度"""
+    if not report_info.strip():
+        yield analyze_compliance(report_info)
+        return
+    
+    try:
+        job = job_queue.submit(
+            "compliance",
+            lambda job, report_info, report_json: analyze_compliance(report_info, report_json, progress=job.report, partial=job.set_partial),
+            report_info,
+            report_json
+        )
+    except JobQueueFullError as e:
+        yield format_progress_html(f"系统繁忙，请稍后重试（{str(e)}）")
+        return
+    
+    yield format_progress_html(f"任务 {job.id} 已提交，排队中...")
+    async for kind, value in _watch_job(job):
+        if kind == "partial":
+            # 流式生成中的结论逐步渲染
+            yield format_compliance_html(value)
+        else:
+            yield format_progress_html(f"任务 {job.id}: {value}")
+    
+    if job.status == "done":
+        yield job.result
+    else:
+        yield format_compliance_error_html(job.error)
+
+def format_readiness_markdown():
+    """将分析器就绪状态格式化为界面显示文本"""
+    readiness = analyzer.get_readiness()
+    status_labels = {"cold": "⚪ 未预热（首次分析时初始化）", "warming": "🟡 预热中", "ready": "🟢 已就绪", "failed": "🔴 预热失败"}
+    text = f"**服务状态：** {status_labels.get(readiness['status'], readiness['status'])}"
+    if readiness["elapsed"] is not None:
+        text += f"（耗时 {readiness['elapsed']} 秒）"
+    if readiness["error"]:
+        text += f"  \n错误信息：{readiness['error']}"
+    return text
 
 def create_pdf_analysis_interface():
     """创建PDF分析界面"""
-    print("[界面] 开始创建Gradio界面...", flush=True)
+    import gradio as gr
+    
+    logger.debug("[界面] 开始创建Gradio界面...")
     
     with gr.Blocks(title="PDF测试报告分析系统") as interface:
         gr.Markdown("# PDF测试报告分析系统")
         gr.Markdown("上传PDF测试报告，系统将分析其是否符合国家标准")
+        readiness_text = gr.Markdown(format_readiness_markdown())
         
         with gr.Row():
             with gr.Column(scale=1):
@@ -953,23 +1325,29 @@ def create_pdf_analysis_interface():
                     show_label=True
                 )
         
-        print("[界面] 界面组件创建完成，开始绑定事件...", flush=True)
+        # 每个会话独立保存提取的报告JSON，避免并发用户之间互相覆盖
+        report_state = gr.State(None)
+        
+        logger.debug("[界面] 界面组件创建完成，开始绑定事件...")
         
         # 事件绑定 - 恢复到原始PDF处理函数
         analyze_btn.click(
-            fn=process_pdf_file,
-            inputs=[pdf_file],
-            outputs=[status_text, report_info]
+            fn=process_pdf_file_stream,
+            inputs=[pdf_file, report_state],
+            outputs=[status_text, report_info, report_state]
         )
         
-        print("[界面] 事件绑定完成", flush=True)
+        logger.debug("[界面] 事件绑定完成")
         
         compliance_btn.click(
-            fn=analyze_compliance,
-            inputs=[report_info],
+            fn=analyze_compliance_stream,
+            inputs=[report_info, report_state],
             outputs=[compliance_result]
         )
         
+        # 页面加载时刷新服务就绪状态
+        interface.load(fn=format_readiness_markdown, outputs=[readiness_text])
+        
         # 示例说明
         gr.Markdown("""
         ## 使用说明
@@ -984,28 +1362,41 @@ def create_pdf_analysis_interface():
         - 分析过程可能需要几秒钟时间，请耐心等待
         """)
     
-    print("[界面] Gradio界面创建完成", flush=True)
+    logger.debug("[界面] Gradio界面创建完成")
     return interface
 
 if __name__ == "__main__":
-    print("[后台] ========== 启动PDF分析系统 ===========", flush=True)
-    print(f"[后台] 工作目录: {WORKING_DIR}", flush=True)
-    print(f"[后台] API地址: {BASE_URL}", flush=True)
-    print(f"[后台] 视觉模型: {VL_MODEL}", flush=True)
-    print(f"[后台] 嵌入模型: {EMBEDDING_MODEL}", flush=True)
+    logger.info("[后台] ========== 启动PDF分析系统 ===========")
+    logger.info(f"[后台] 工作目录: {WORKING_DIR}")
+    logger.info(f"[后台] API地址: {BASE_URL}")
+    logger.info(f"[后台] 视觉模型: {VL_MODEL}")
+    logger.info(f"[后台] 嵌入模型: {EMBEDDING_MODEL}")
     
     # 检查Gradio版本
     import gradio
-    print(f"[后台] Gradio版本: {gradio.__version__}", flush=True)
+    logger.info(f"[后台] Gradio版本: {gradio.__version__}")
+    
+    # 启用多进程渲染池时在后台线程启动前创建渲染进程
+    get_render_pool()
+    
+    # 后台预热，首个请求无需等待存储加载
+    if WARMUP_ON_START:
+        logger.info("[后台] 启动后台预热...")
+        analyzer.start_warm_up()
+    
+    # 指标端点
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
     
     # 创建界面
-    print("[后台] 正在创建Gradio界面...", flush=True)
+    logger.info("[后台] 正在创建Gradio界面...")
     demo = create_pdf_analysis_interface()
+    demo.queue(default_concurrency_limit=UI_CONCURRENCY_LIMIT)
     
     # 启动应用
-    print("[后台] 正在启动应用服务器...", flush=True)
-    print("[后台] 服务器地址: 127.0.0.1:10086", flush=True)
-    print("[后台] ========== 系统启动完成 ===========", flush=True)
+    logger.info("[后台] 正在启动应用服务器...")
+    logger.info("[后台] 服务器地址: 127.0.0.1:10086")
+    logger.info("[后台] ========== 系统启动完成 ===========")
     demo.launch(
         server_name="127.0.0.1",
         server_port=10086,
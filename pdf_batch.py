@@ -0,0 +1,273 @@
+"""PDF测试报告批处理：对目录或清单中的PDF执行信息提取和标准符合性分析
+
+渲染和逐页模型调用在进程池中并行执行（每个进程内部仍按VISION_CONCURRENCY并发请求），
+符合性分析在事件循环中以有界并发执行。每完成一份报告立即追加一行JSONL结果，
+重新运行同一命令时会跳过输出文件中已成功的报告，可在中断后继续。同一路径有多条记录时以最后一条为准；
+重新处理的报告在开始前从输出文件中移除旧记录，处理完成后每份报告只保留一条结果。
+
+命令行用法：
+    python pdf_batch.py reports/ -o results.jsonl [--workers N] [--skip-compliance]
+    python pdf_batch.py manifest.txt -o results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_extraction import (
+    REPORT_QUESTION, RESULT_CACHE_ENABLED, VISION_CONCURRENCY,
+    PDFExtractor, close_http_client, hash_file,
+)
+from pdf_metrics import collect_metrics, configure_logging, get_logger, merge_metrics, write_metrics_file
+
+logger = get_logger("batch")
+
+# 批处理配置
+BATCH_WORKERS = max(1, (os.cpu_count() or 2) // 2)  # 提取进程数
+COMPLIANCE_CONCURRENCY = 4  # 同时进行的符合性分析数
+
+
+def collect_pdf_paths(source):
+    """收集待处理的PDF路径：目录下递归查找*.pdf，或读取清单文件（每行一个路径或含path字段的JSON）"""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(".pdf"):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["path"]
+            paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return paths
+
+
+def load_records(output_path):
+    """读取已有的结果文件，返回 {路径: 记录}；同一路径有多条记录时以最后一条为准，忽略崩溃时写了一半的行"""
+    records = {}
+    if not os.path.exists(output_path):
+        return records
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "path" in record:
+                records[record["path"]] = record
+    return records
+
+
+def rewrite_records(output_path, records):
+    """用records（记录列表）原子地替换结果文件"""
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, output_path)
+
+
+class JsonlWriter:
+    """线程安全的JSONL追加写入器，每行写入后立即落盘"""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+_worker_extractor = None
+
+
+def _extract_worker(pdf_path, page_concurrency, use_text_layer, use_cache):
+    """进程池任务：提取单个PDF的报告信息，返回可序列化的结果记录"""
+    global _worker_extractor
+    if _worker_extractor is None:
+        _worker_extractor = PDFExtractor(use_cache=RESULT_CACHE_ENABLED and use_cache)
+
+    start = time.perf_counter()
+    record = {"path": pdf_path, "file_hash": None, "status": "failed", "page": None, "report": None, "raw": None, "errors": []}
+    try:
+        record["file_hash"] = hash_file(pdf_path)
+        report = _worker_extractor.extract_report(
+            pdf_path,
+            REPORT_QUESTION,
+            max_concurrency=page_concurrency,
+            use_text_layer=use_text_layer
+        )
+        record["page"] = report["page"]
+        record["report"] = report["json"]
+        record["errors"] = report["errors"]
+        if report["json"] is None:
+            record["raw"] = report["raw"]
+        if report["raw"] is not None:
+            record["status"] = "ok"
+        elif report["format_error"]:
+            record["errors"].append("PDF分析结果格式错误")
+    except Exception as e:
+        record["errors"].append(f"处理PDF时出错: {str(e)}")
+    record["extract_seconds"] = round(time.perf_counter() - start, 2)
+    # 进程池worker的阶段耗时随结果交回主进程汇总
+    record["_metrics"] = collect_metrics()
+    return record
+
+
+def _last_item(iterable):
+    """消费完可迭代对象，返回最后一项，没有任何产出时返回None"""
+    last = None
+    for last in iterable:
+        pass
+    return last
+
+
+async def _analyze_compliance(analyzer, record):
+    """对提取成功的报告执行符合性分析并格式化结论
+
+    单次流式模式下流式生成失败或没有产出时，与应用一致回退到检索+格式化两步流程。
+    """
+    from pdf_analysis_app import (
+        COMPLIANCE_SINGLE_PASS, format_compliance_result, rule_based_compliance,
+        serialize_report_for_query, stream_compliance_conclusion,
+    )
+
+    start = time.perf_counter()
+    try:
+        rule_result = rule_based_compliance(record["report"])
+        record["compliance_source"] = "rules" if rule_result is not None else "rag"
+        report_info = serialize_report_for_query(record["report"]) if record["report"] else record["raw"]
+        conclusion = rule_result
+        if conclusion is None and COMPLIANCE_SINGLE_PASS:
+            context = await analyzer.retrieve_compliance_context(report_info, record["report"])
+            try:
+                # 流式生成器产出累计文本，最后一项即完整结论
+                conclusion = await asyncio.to_thread(_last_item, stream_compliance_conclusion(context, report_info, record["report"]))
+            except Exception as stream_error:
+                logger.warning(f"[批处理] 流式结论生成失败，改用检索+格式化两步流程: {str(stream_error)}")
+            else:
+                if not conclusion:
+                    logger.warning("[批处理] 流式结论为空，改用检索+格式化两步流程")
+        if not conclusion:
+            raw_result = await analyzer.analyze_report_compliance(report_info, record["report"])
+            record["compliance_raw"] = str(raw_result)
+            try:
+                conclusion = await asyncio.to_thread(format_compliance_result, str(raw_result), record["report"])
+            except Exception as format_error:
+                logger.warning(f"[批处理] 格式化失败，保留原始结果: {str(format_error)}")
+                conclusion = str(raw_result)
+        record["compliance"] = conclusion
+    except Exception as e:
+        record["status"] = "failed"
+        record["errors"].append(f"标准符合性分析失败: {str(e)}")
+    record["compliance_seconds"] = round(time.perf_counter() - start, 2)
+
+
+async def run_batch(pdf_paths, output_path, workers=BATCH_WORKERS, page_concurrency=VISION_CONCURRENCY,
+                    compliance=True, compliance_concurrency=COMPLIANCE_CONCURRENCY,
+                    use_text_layer=None, use_cache=True):
+    """批量处理PDF，结果逐条追加到output_path，返回各状态的计数"""
+    records = load_records(output_path)
+    completed = {(path, record.get("file_hash")) for path, record in records.items() if record.get("status") == "ok"}
+    completed_paths = {path for path, _ in completed}
+    todo = [path for path in pdf_paths if path not in completed_paths or (path, hash_file(path)) not in completed]
+    logger.info(f"[批处理] 共 {len(pdf_paths)} 份报告，已完成 {len(pdf_paths) - len(todo)} 份，待处理 {len(todo)} 份")
+
+    counts = {"ok": 0, "failed": 0}
+    if not todo:
+        return counts
+    if records:
+        # 移除待重新处理的报告的旧记录（以及重复记录），新结果写入后每份报告只有一条记录
+        todo_paths = set(todo)
+        rewrite_records(output_path, [record for path, record in records.items() if path not in todo_paths])
+
+    analyzer = None
+    if compliance:
+        from pdf_analysis_app import analyzer
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(compliance_concurrency)
+    writer = JsonlWriter(output_path)
+    done = 0
+
+    async def process(pdf_path, pool):
+        nonlocal done
+        record = await loop.run_in_executor(pool, _extract_worker, pdf_path, page_concurrency, use_text_layer, use_cache)
+        merge_metrics(record.pop("_metrics"))
+        if compliance and record["status"] == "ok":
+            async with semaphore:
+                await _analyze_compliance(analyzer, record)
+        writer.write(record)
+        counts[record["status"]] += 1
+        done += 1
+        logger.info(f"[批处理] {done}/{len(todo)} {record['status']}: {pdf_path}")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            await asyncio.gather(*(process(path, pool) for path in todo))
+    finally:
+        writer.close()
+        if analyzer is not None:
+            await analyzer.finalize_rag()
+    return counts
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量提取PDF拉伸测试报告并分析标准符合性")
+    parser.add_argument("source", help="PDF目录，或每行一个PDF路径的清单文件")
+    parser.add_argument("-o", "--output", required=True, help="JSONL结果文件，已存在时跳过其中已成功的报告")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="提取进程数")
+    parser.add_argument("--page-concurrency", type=int, default=VISION_CONCURRENCY, help="每个进程同时在途的页面请求上限")
+    parser.add_argument("--compliance-concurrency", type=int, default=COMPLIANCE_CONCURRENCY, help="同时进行的符合性分析数")
+    parser.add_argument("--skip-compliance", action="store_true", help="只提取报告信息，不做符合性分析")
+    parser.add_argument("--no-text-layer", action="store_true", help="禁用文本层快速路径，始终使用图像识别")
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入页面结果缓存")
+    parser.add_argument("--metrics-file", help="结束后把各阶段耗时直方图以Prometheus文本格式写入该文件")
+    parser.add_argument("--log-level", help="日志级别（DEBUG/INFO/WARNING），默认取PDF_LOG_LEVEL或INFO")
+    args = parser.parse_args(argv)
+    if args.log_level:
+        configure_logging(args.log_level)
+
+    pdf_paths = collect_pdf_paths(args.source)
+    start = time.perf_counter()
+    counts = asyncio.run(run_batch(
+        pdf_paths,
+        args.output,
+        workers=args.workers,
+        page_concurrency=args.page_concurrency,
+        compliance=not args.skip_compliance,
+        compliance_concurrency=args.compliance_concurrency,
+        use_text_layer=False if args.no_text_layer else None,
+        use_cache=not args.no_cache
+    ))
+    close_http_client()
+    if args.metrics_file:
+        write_metrics_file(args.metrics_file)
+    print(f"[批处理] 完成：成功 {counts['ok']} 份，失败 {counts['failed']} 份，耗时 {time.perf_counter() - start:.1f} 秒", flush=True)
+    return 0 if counts["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
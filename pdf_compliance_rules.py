@@ -0,0 +1,340 @@
+"""基于本地阈值表的标准符合性判定
+
+常见的拉伸试验结论只是把测试数据平均值中的屈服强度、抗拉强度、断后伸长率与标准中按牌号和厚度分档的限值比较。
+本模块维护GB/T 700、GB/T 1591等标准的阈值表，按牌号建立索引，按厚度分档查找限值后向量化比较各项指标，
+不需要检索和模型调用。表中未覆盖的牌号、厚度缺失或有歧义、三项指标未能全部判定且没有不合格项的报告返回None，
+由调用方回退到RAG+LLM分析。
+"""
+import math
+import re
+import unicodedata
+
+import numpy as np
+
+from pdf_extraction import PRODUCT_INFO_KEYS, TEST_DATA_KEYS
+
+# 参与判定的指标，顺序即阈值矩阵的列顺序
+METRICS = ("屈服强度", "抗拉强度", "断后伸长率")
+METRIC_UNITS = {"屈服强度": "MPa", "抗拉强度": "MPa", "断后伸长率": "%"}
+
+# 测试数据中各指标可能使用的字段名（按优先级）
+METRIC_ALIASES = {
+    "屈服强度": ("屈服强度", "上屈服强度", "ReH", "下屈服强度", "ReL", "规定塑性延伸强度", "Rp0.2"),
+    "抗拉强度": ("抗拉强度", "Rm"),
+    "断后伸长率": ("断后伸长率", "伸长率", "A"),
+}
+AVERAGE_KEYS = ["平均值", "均值", "平均", "Average", "平均结果"]
+DETAIL_KEYS = ["详细数据", "测试结果", "试验结果", "检测结果", "数据详情"]
+THICKNESS_KEY_EXCLUDES = ("偏差", "公差")  # 名称含"厚"但不是厚度本身的字段
+
+# 标准限值：{(标准号, 标准名): {牌号: {指标: [(厚度上限mm, 限值), ...]}}}
+# 厚度分档为左开右闭区间，首档下限为0；屈服强度、断后伸长率为最小值，抗拉强度为(最小值, 最大值)
+STANDARD_LIMITS = {
+    ("GB/T 700-2006", "碳素结构钢"): {
+        "Q195": {
+            "屈服强度": [(16, 195), (40, 185)],
+            "抗拉强度": [(40, (315, 430))],
+            "断后伸长率": [(40, 33)],
+        },
+        "Q215": {
+            "屈服强度": [(16, 215), (40, 205), (60, 195), (100, 185), (150, 175), (200, 165)],
+            "抗拉强度": [(200, (335, 450))],
+            "断后伸长率": [(40, 31), (60, 30), (100, 29), (150, 27), (200, 26)],
+        },
+        "Q235": {
+            "屈服强度": [(16, 235), (40, 225), (60, 215), (100, 215), (150, 195), (200, 185)],
+            "抗拉强度": [(200, (370, 500))],
+            "断后伸长率": [(40, 26), (60, 25), (100, 24), (150, 22), (200, 21)],
+        },
+        "Q275": {
+            "屈服强度": [(16, 275), (40, 265), (60, 255), (100, 245), (150, 225), (200, 215)],
+            "抗拉强度": [(200, (410, 540))],
+            "断后伸长率": [(40, 22), (60, 21), (100, 20), (150, 18), (200, 17)],
+        },
+    },
+    ("GB/T 1591-2018", "低合金高强度结构钢"): {
+        "Q355": {
+            "屈服强度": [(16, 355), (40, 345), (63, 335), (80, 325), (100, 315), (150, 295), (200, 285), (250, 275)],
+            "抗拉强度": [(100, (470, 630)), (250, (450, 600))],
+            "断后伸长率": [(40, 22), (63, 21), (100, 20), (150, 18), (250, 17)],
+        },
+        "Q390": {
+            "屈服强度": [(16, 390), (40, 380), (63, 360), (80, 340), (100, 340), (150, 320)],
+            "抗拉强度": [(100, (490, 650)), (150, (470, 620))],
+            "断后伸长率": [(40, 21), (100, 20), (150, 19)],
+        },
+        "Q420": {
+            "屈服强度": [(16, 420), (40, 410), (63, 390), (80, 370), (100, 370), (150, 350)],
+            "抗拉强度": [(100, (520, 680)), (150, (500, 650))],
+            "断后伸长率": [(40, 20), (150, 19)],
+        },
+        "Q460": {
+            "屈服强度": [(16, 460), (40, 450), (63, 430), (80, 410), (100, 410), (150, 390)],
+            "抗拉强度": [(100, (550, 720)), (150, (530, 700))],
+            "断后伸长率": [(40, 18), (150, 17)],
+        },
+    },
+}
+
+GRADE_PATTERN = re.compile(r"(?<![0-9A-Za-z])Q(\d{3})(?!\d)", re.IGNORECASE)
+THICKNESS_VALUE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:mm|毫米)?\s*$", re.IGNORECASE)  # 厚度字段的值，如"20"、"20mm"
+EXPLICIT_THICKNESS_PATTERN = re.compile(
+    r"(?:δ|(?<![0-9A-Za-z])t|厚度?)\s*[=:]\s*(\d+(?:\.\d+)?)\s*(?:mm|毫米)?(?![0-9A-Za-z.×x*])", re.IGNORECASE
+)  # 其他字段中明确标注的厚度，如"δ=20mm"、"t=20"、"厚度:20mm"
+NUMBER_PATTERN = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+
+class ThresholdTable:
+    """按牌号索引、按厚度分档的标准阈值表
+
+    每个牌号对应一组厚度分档上限和两个限值矩阵（分档数 x 指标数），缺失的限值为NaN。
+    """
+
+    def __init__(self, standard_limits=STANDARD_LIMITS):
+        self._index = {}
+        for (standard, standard_name), grades in standard_limits.items():
+            for grade, metric_limits in grades.items():
+                self._index[grade] = (standard, standard_name) + self._build_bands(metric_limits)
+
+    @staticmethod
+    def _build_bands(metric_limits):
+        """合并各指标的厚度分档，生成分档上限数组和最小值、最大值矩阵"""
+        bounds = sorted({upper for limits in metric_limits.values() for upper, _ in limits})
+        minimums = np.full((len(bounds), len(METRICS)), np.nan)
+        maximums = np.full((len(bounds), len(METRICS)), np.nan)
+        for column, metric in enumerate(METRICS):
+            limits = metric_limits.get(metric, [])
+            for row, upper in enumerate(bounds):
+                # 取覆盖该分档的第一个限值区间
+                value = next((value for limit_upper, value in limits if upper <= limit_upper), None)
+                if value is None:
+                    continue
+                if isinstance(value, tuple):
+                    minimums[row, column], maximums[row, column] = value
+                else:
+                    minimums[row, column] = value
+        return np.array(bounds, dtype=float), minimums, maximums
+
+    def grades(self):
+        """返回表中覆盖的全部牌号"""
+        return sorted(self._index)
+
+    def lookup(self, grade, thickness):
+        """查找牌号在指定厚度下的限值，返回 (标准号, 标准名, 最小值数组, 最大值数组)；未覆盖时返回None"""
+        entry = self._index.get(grade)
+        if entry is None or thickness is None or thickness <= 0:
+            return None
+        standard, standard_name, bounds, minimums, maximums = entry
+        row = int(np.searchsorted(bounds, thickness, side="left"))
+        if row >= len(bounds):
+            return None
+        return standard, standard_name, minimums[row], maximums[row]
+
+
+THRESHOLD_TABLE = ThresholdTable()
+
+
+def evaluate_metrics(measured, minimums, maximums):
+    """逐项比较实测值与限值，返回 (已判定掩码, 合格掩码)；实测值或两个限值都缺失的指标不参与判定"""
+    measured = np.asarray(measured, dtype=float)
+    has_limit = ~(np.isnan(minimums) & np.isnan(maximums))
+    evaluated = ~np.isnan(measured) & has_limit
+    with np.errstate(invalid="ignore"):
+        passed = (np.isnan(minimums) | (measured >= minimums)) & (np.isnan(maximums) | (measured <= maximums))
+    return evaluated, passed & evaluated
+
+
+def _first_dict(data, keys):
+    for key in keys:
+        if isinstance(data.get(key), dict) and data[key]:
+            return data[key]
+    return None
+
+
+def _parse_number(value):
+    """从数值或"420.5 MPa"、"28%"这类文本中取出数值，无法解析时返回NaN"""
+    if isinstance(value, bool):
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_PATTERN.search(unicodedata.normalize("NFKC", str(value)))
+    return float(match.group()) if match else math.nan
+
+
+def _find_metric_value(record, metric):
+    """按别名在一条测试数据中查找指标值；字段名可能带单位，如"抗拉强度(MPa)" """
+    for alias in METRIC_ALIASES[metric]:
+        for key, value in record.items():
+            name = unicodedata.normalize("NFKC", str(key)).strip()
+            if name == alias or (len(alias) > 1 and name.startswith(alias) and not name[len(alias)].isalnum()):
+                return _parse_number(value)
+    return math.nan
+
+
+def extract_measured_values(report_json):
+    """从测试数据中取出各指标的实测值数组；平均值中缺少的指标使用详细数据各试样的均值"""
+    test_data = _first_dict(report_json, TEST_DATA_KEYS)
+    if test_data is None:
+        return None
+
+    measured = np.full(len(METRICS), np.nan)
+    average = _first_dict(test_data, AVERAGE_KEYS)
+    if average is not None:
+        measured[:] = [_find_metric_value(average, metric) for metric in METRICS]
+
+    missing = np.isnan(measured)
+    if missing.any():
+        details = next((test_data[key] for key in DETAIL_KEYS if isinstance(test_data.get(key), list)), None)
+        rows = [[_find_metric_value(item, metric) for metric in METRICS] for item in details or [] if isinstance(item, dict)]
+        if rows:
+            samples = np.array(rows, dtype=float)
+            counts = (~np.isnan(samples)).sum(axis=0)
+            sums = np.nansum(samples, axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+            measured[missing] = means[missing]
+    return measured
+
+
+def _iter_strings(value):
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from _iter_strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_strings(item)
+    elif isinstance(value, str):
+        yield unicodedata.normalize("NFKC", value)
+
+
+def extract_grade(report_json):
+    """从产品信息（找不到时从整个报告）中识别钢材牌号，如"Q235B"识别为"Q235" """
+    product_info = _first_dict(report_json, PRODUCT_INFO_KEYS) or {}
+    for source in (product_info, report_json):
+        for text in _iter_strings(source):
+            match = GRADE_PATTERN.search(text)
+            if match:
+                return f"Q{match.group(1)}"
+    return None
+
+
+def _is_thickness_key(key):
+    name = unicodedata.normalize("NFKC", str(key))
+    return "厚" in name and not any(word in name for word in THICKNESS_KEY_EXCLUDES)
+
+
+def extract_thickness(report_json):
+    """解析产品信息中的厚度（mm）：只采用名称含"厚"的字段，或其他字段中明确标注的"δ=20mm"、"t=20"
+
+    标距、宽度、规格尺寸中的数值不作为厚度；找不到厚度、厚度字段的值无法解析（如"10×2000"）
+    或得到多个不同的厚度时返回None，由调用方回退到RAG+LLM分析。
+    """
+    product_info = _first_dict(report_json, PRODUCT_INFO_KEYS)
+    if product_info is None:
+        return None
+
+    values = set()
+    for key, value in product_info.items():
+        if not _is_thickness_key(key):
+            continue
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            number = float(value)
+        else:
+            match = THICKNESS_VALUE_PATTERN.match(unicodedata.normalize("NFKC", str(value)))
+            if match is None:
+                return None
+            number = float(match.group(1))
+        if number <= 0:
+            return None
+        values.add(number)
+
+    for text in _iter_strings(product_info):
+        values.update(float(match.group(1)) for match in EXPLICIT_THICKNESS_PATTERN.finditer(text))
+    return values.pop() if len(values) == 1 else None
+
+
+def _format_number(value, unit=""):
+    separator = " " if unit and unit != "%" else ""
+    return f"{value:g}{separator}{unit}"
+
+
+def _format_requirement(minimum, maximum, unit):
+    if not math.isnan(minimum) and not math.isnan(maximum):
+        return f"{_format_number(minimum)}～{_format_number(maximum, unit)}"
+    if not math.isnan(minimum):
+        return f"≥{_format_number(minimum, unit)}"
+    return f"≤{_format_number(maximum, unit)}"
+
+
+def evaluate_report(report_json, table=THRESHOLD_TABLE):
+    """按阈值表判定报告各项指标，返回判定结果字典
+
+    只有三项指标全部判定且合格时才判为合格；存在不合格项时判为不合格，并在unevaluated中列出未能判定的指标。
+    牌号未覆盖、缺少厚度或实测值，以及部分指标未能判定且已判定的指标都合格时返回None。
+    """
+    if not report_json or not isinstance(report_json, dict):
+        return None
+    grade = extract_grade(report_json)
+    thickness = extract_thickness(report_json)
+    limits = table.lookup(grade, thickness)
+    if limits is None:
+        return None
+    measured = extract_measured_values(report_json)
+    if measured is None:
+        return None
+
+    standard, standard_name, minimums, maximums = limits
+    evaluated, passed = evaluate_metrics(measured, minimums, maximums)
+    if not evaluated.any():
+        return None
+    unevaluated = [METRICS[column] for column in np.flatnonzero(~evaluated)]
+    if unevaluated and passed[evaluated].all():
+        # 部分指标无法判定时不能给出合格结论
+        return None
+
+    metrics = []
+    for column in np.flatnonzero(evaluated):
+        metric = METRICS[column]
+        unit = METRIC_UNITS[metric]
+        metrics.append({
+            "metric": metric,
+            "value": float(measured[column]),
+            "unit": unit,
+            "requirement": _format_requirement(minimums[column], maximums[column], unit),
+            "passed": bool(passed[column]),
+        })
+    return {
+        "standard": standard,
+        "standard_name": standard_name,
+        "grade": grade,
+        "thickness": thickness,
+        "metrics": metrics,
+        "unevaluated": unevaluated,
+        "passed": not unevaluated and all(item["passed"] for item in metrics),
+    }
+
+
+def format_rule_conclusion(evaluation, product_type, thickness):
+    """将判定结果按符合性结论模板输出为文本"""
+    source = f"{evaluation['standard']} {evaluation['standard_name']}（{evaluation['grade']}，厚度{_format_number(evaluation['thickness'])}mm）"
+    lead = f"通过本次拉伸试验，测定了本批次{product_type}各项力学性能指标，结果表明{product_type} {thickness} "
+
+    if evaluation["passed"]:
+        lines = [lead + "的各项指标符合相关中国标准要求："]
+        for item in evaluation["metrics"]:
+            label = "指标符合" if item["metric"] != "断后伸长率" else "符合"
+            lines.append(f"• {item['metric']}{label}：{source} - {item['requirement']}（实测{_format_number(item['value'], item['unit'])}）")
+        return "\n".join(lines)
+
+    lines = [lead + "的部分指标不符合相关中国标准要求："]
+    for item in evaluation["metrics"]:
+        if not item["passed"]:
+            lines.append(f"• {item['metric']}不符合：{source} - 要求{item['requirement']}，实测{_format_number(item['value'], item['unit'])}")
+    compliant = [item["metric"] for item in evaluation["metrics"] if item["passed"]]
+    if compliant:
+        lines.append(f"• 符合的指标：{'、'.join(compliant)}")
+    if evaluation.get("unevaluated"):
+        lines.append(f"• 未能判定的指标（报告中缺少实测值）：{'、'.join(evaluation['unevaluated'])}")
+    return "\n".join(lines)
@@ -0,0 +1,1368 @@
+"""PDF测试报告提取核心：页面渲染、视觉/文本模型调用和JSON提取
+
+本模块只依赖标准库即可导入，PyMuPDF、requests、json_repair在首次使用时才加载，
+不会引入gradio和lightrag，适合脚本和短生命周期的批处理worker直接调用。
+导入耗时（python -X importtime -c "import pdf_extraction"）实测约40～65ms，随机器负载波动，
+其中大部分是logging、sqlite3、concurrent.futures等标准库模块；修改导入时请重新测量，避免引入新的重型依赖。
+
+命令行用法：
+    python pdf_extraction.py report.pdf [-o result.json] [--concurrency N] [--no-text-layer] [--no-cache] [--no-triage] [--stitch MODE] [--render-workers N]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pdf_metrics import STAGE_DURATION, get_logger, span, traced
+from pdf_render_pool import get_render_pool, shutdown_render_pool
+from pdf_retry import (
+    BREAKER_ENABLED, MAX_RETRIES,
+    ApiResponseError, get_circuit_breaker, retry_api_call,
+)
+
+logger = get_logger("extraction")
+
+# 配置参数
+WORKING_DIR = "./"
+API_KEY = "sk-xxx"
+BASE_URL = "http://127.0.0.1:10010/v1"
+VL_MODEL = "qwen25-vl-72b"
+TEXT_MODEL = VL_MODEL  # 文本层快速路径使用的纯文本模型，可配置为更便宜的文本模型
+
+# 重试和熔断配置见pdf_retry模块
+
+# HTTP客户端配置
+HTTP_POOL_MAXSIZE = 32  # 连接池大小，应不小于并发会话数 × VISION_CONCURRENCY
+HTTP_CONNECT_TIMEOUT = 10  # 建立连接超时（秒）
+HTTP_KEEPALIVE_EXPIRY = 60  # 空闲keep-alive连接保留时间（秒，仅HTTP/2客户端）
+HTTP2_ENABLED = False  # 使用httpx的HTTP/2客户端（需要安装 httpx[http2]）
+MODEL_API_TIMEOUT = 60  # 模型调用读取超时（秒）
+
+# 视觉API并发配置
+VISION_CONCURRENCY = 4  # 同时在途的视觉API请求上限，设为1即逐页串行处理
+
+# 页面渲染配置
+RENDER_ZOOM = 2  # 页面渲染缩放倍数上限
+RENDER_MAX_PIXELS = 12845056  # 单页像素预算，与视觉模型的最大输入分辨率（Qwen2.5-VL默认max_pixels）一致，超出部分模型会缩放丢弃
+RENDER_FORMAT = "png"  # 图像编码格式: png / jpeg / webp
+RENDER_QUALITY = 85  # jpeg / webp 编码质量
+RENDER_GRAYSCALE_SCANNED = True  # 扫描页（无文本层的纯图像页面）按灰度渲染
+RENDER_CROP_TO_CONTENT = False  # 裁剪到页面内容的边界框，去除空白页边
+RENDER_CROP_MARGIN = 10  # 裁剪时保留的页边距（PDF点）
+# 多进程渲染池配置见pdf_render_pool模块
+
+# 文本层快速路径配置
+TEXT_LAYER_ENABLED = True  # 原生PDF优先使用文本层和表格提取，失败时回退到图像识别
+TEXT_LAYER_MIN_CHARS = 200  # 页面文本少于该字符数时视为没有可用文本层
+
+# 页面分诊配置
+PAGE_TRIAGE_ENABLED = True  # 调用模型前先在本地给页面打分，跳过封面、签字页和空白页
+PAGE_TRIAGE_MIN_SCORE = 1.0  # 得分低于该值的页面不送入模型
+PAGE_TRIAGE_KEYWORDS = (
+    "最大力", "抗拉强度", "屈服强度", "断后伸长率", "伸长率", "弹性模量", "拉伸", "试样", "MPa",
+    "tensile", "yield", "elongation", "max force",
+)  # 数据页的关键词，每命中一个计1分
+PAGE_TRIAGE_TABLE_MIN_LINES = 8  # 页面上的直线和矩形数不少于该值时视为有表格
+PAGE_TRIAGE_MIN_ENTROPY = 1.0  # 没有文字的页面缩略图的灰度熵（比特）低于该值时视为空白页
+
+# 多页报告拼接配置
+REPORT_STITCH_MODE = "merge"  # "merge": 逐页提取，首个完整页面之后仍含测试数据的页面按字段合并；"off": 只使用首个完整页面；"multi_image": 前几页合并为一次视觉请求（需显式启用）
+STITCH_MAX_PAGES = 4  # 合并请求或按字段合并时最多使用的页数
+
+# 大文档内存配置
+PAGE_RESULT_SPILL_PAGES = 50  # analyze_pdf的逐页结果超过该页数后写入临时文件，不再全部保存在内存中
+PAGE_RESULT_SPILL_DIR = None  # 溢出临时文件所在目录，None使用系统临时目录
+FITZ_STORE_SHRINK_INTERVAL = 16  # 每处理该数量的页面清空一次MuPDF资源缓存（解码后的图像、字体），扫描件的内存不随页数增长
+
+# 页面结果缓存配置
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_PATH = os.path.join(WORKING_DIR, "pdf_result_cache.sqlite3")
+RESULT_CACHE_MAX_BYTES = 200 * 1024 * 1024  # 缓存内容总大小上限
+RESULT_CACHE_MAX_AGE = 30 * 24 * 3600  # 缓存条目最长保留时间（秒）
+
+# 报告信息提取提示词
+REPORT_QUESTION = "请详细分析这份拉伸测试报告，提取出产品的关键信息，比如产品型号、参数等，以及所有的关键数据，可能的维度包括但不限于最大力、屈服强度、抗拉强度、断后伸长率等，并以JSON格式返回。"
+
+# 结构化输出配置
+JSON_RESPONSE_FORMAT = None  # 请求模型服务约束输出格式：None 不约束；"json_object" 只输出JSON；"json_schema" 按REPORT_JSON_SCHEMA输出
+JSON_REPAIR_MAX_CHARS = 20000  # 超过该长度的对象不再交给json_repair修复（修复耗时约每千字符0.6ms）
+REPORT_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "产品信息": {"type": "object"},
+        "测试数据": {
+            "type": "object",
+            "properties": {
+                "详细数据": {"type": "array", "items": {"type": "object"}},
+                "平均值": {"type": "object"},
+            },
+        },
+    },
+    "required": ["产品信息", "测试数据"],
+}
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+def _create_http_client():
+    """创建带连接池和keep-alive的HTTP客户端，HTTP/2不可用时退回requests"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    if HTTP2_ENABLED:
+        try:
+            import httpx
+            client = httpx.Client(
+                http2=True,
+                headers=headers,
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_MAXSIZE,
+                    max_keepalive_connections=HTTP_POOL_MAXSIZE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                )
+            )
+            logger.info("[HTTP] 已创建HTTP/2共享客户端")
+            return client
+        except ImportError as e:
+            logger.warning(f"[HTTP] HTTP/2不可用，使用HTTP/1.1连接池: {str(e)}")
+    
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    logger.info(f"[HTTP] 已创建共享HTTP客户端，连接池大小: {HTTP_POOL_MAXSIZE}")
+    return session
+
+def get_http_client():
+    """获取所有模型调用共享的HTTP客户端"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = _create_http_client()
+    return _http_client
+
+def close_http_client():
+    """关闭共享HTTP客户端并释放连接"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+def post_model_api(path, payload, timeout=MODEL_API_TIMEOUT):
+    """通过共享HTTP客户端向模型服务发送POST请求，返回解析后的JSON"""
+    import requests
+    
+    client = get_http_client()
+    api_url = f"{BASE_URL}{path}"
+    breaker = get_circuit_breaker(BASE_URL) if BREAKER_ENABLED else None
+    if breaker is not None:
+        breaker.before_call()
+    try:
+        with span("model_api", path=path):
+            if isinstance(client, requests.Session):
+                response = client.post(api_url, json=payload, timeout=(HTTP_CONNECT_TIMEOUT, timeout))
+            else:
+                import httpx
+                response = client.post(api_url, json=payload, timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT))
+            response.raise_for_status()
+    except Exception as e:
+        if breaker is not None:
+            breaker.record_error(e)
+        raise
+    except BaseException:
+        if breaker is not None:
+            breaker.release()
+        raise
+    if breaker is not None:
+        breaker.record_success()
+    
+    result = response.json()
+    
+    # 检查API响应是否包含错误
+    if "error" in result:
+        raise ApiResponseError(f"API返回错误: {result['error']}")
+    
+    return result
+
+@retry_api_call(max_retries=MAX_RETRIES)
+def open_model_stream(path, payload, timeout=MODEL_API_TIMEOUT):
+    """发送流式POST请求并等待响应头返回，返回响应对象；连接失败、429、5xx等按共享的重试策略重试"""
+    import requests
+
+    client = get_http_client()
+    api_url = f"{BASE_URL}{path}"
+    breaker = get_circuit_breaker(BASE_URL) if BREAKER_ENABLED else None
+    if breaker is not None:
+        breaker.before_call()
+    response = None
+    try:
+        # 流式请求只计到响应头返回，生成耗时由调用方统计
+        with span("model_api_stream", path=path):
+            if isinstance(client, requests.Session):
+                response = client.post(api_url, json=payload, timeout=(HTTP_CONNECT_TIMEOUT, timeout), stream=True)
+            else:
+                import httpx
+                request = client.build_request("POST", api_url, json=payload, timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT))
+                response = client.send(request, stream=True)
+            response.raise_for_status()
+    except BaseException as e:
+        if breaker is not None:
+            if isinstance(e, Exception):
+                breaker.record_error(e)
+            else:
+                breaker.release()
+        if response is not None:
+            response.close()
+        raise
+    if breaker is not None:
+        breaker.record_success()
+    return response
+
+def stream_model_api(path, payload, timeout=MODEL_API_TIMEOUT):
+    """以流式方式发送POST请求，逐个产出服务端推送（SSE）的JSON事件，timeout为相邻两块数据的最长间隔
+
+    建立请求（收到响应头之前）的失败按重试策略重试，开始接收数据后的失败直接抛出。
+    """
+    response = open_model_stream(path, dict(payload, stream=True), timeout)
+    lines = response.iter_lines()
+
+    try:
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            if "error" in event:
+                raise ApiResponseError(f"API返回错误: {event['error']}")
+            yield event
+    finally:
+        response.close()
+
+def apply_response_format(payload):
+    """按JSON_RESPONSE_FORMAT为提取请求添加response_format参数，返回payload本身"""
+    if JSON_RESPONSE_FORMAT == "json_object":
+        payload["response_format"] = {"type": "json_object"}
+    elif JSON_RESPONSE_FORMAT == "json_schema":
+        payload["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "tensile_report", "schema": REPORT_JSON_SCHEMA},
+        }
+    return payload
+
+_JSON_TOKEN_PATTERN = re.compile(r'[{}\[\]"]')
+_JSON_STRING_REST_PATTERN = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_JSON_STRING_PATTERN = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*")', re.DOTALL)
+_JSON_TRAILING_COMMA_PATTERN = re.compile(r',\s*[}\]]')
+_JSON_OBJECT_START_PATTERN = re.compile(r'\{\s*"')
+
+def remove_trailing_commas(text):
+    """删除对象和数组末尾多余的逗号，字符串内的内容保持不变"""
+    import bisect
+    import itertools
+
+    positions = [match.start() for match in _JSON_TRAILING_COMMA_PATTERN.finditer(text)]
+    if not positions:
+        return text
+    # 按字符串切分后奇数位是字符串，按各段的结束位置判断每个逗号是否在字符串之外
+    ends = list(itertools.accumulate(map(len, _JSON_STRING_PATTERN.split(text))))
+    pieces = []
+    previous = 0
+    for position in positions:
+        if bisect.bisect_right(ends, position) % 2 == 0:
+            pieces.append(text[previous:position])
+            previous = position + 1
+    pieces.append(text[previous:])
+    return "".join(pieces)
+
+def _loads_allowing_trailing_commas(text):
+    """json.loads，解析器停在尾逗号之后时去掉尾逗号再解析一次（尾逗号是模型输出中最常见的格式错误）；其他错误照常抛出ValueError"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        if e.pos >= len(text) or text[e.pos] not in "}]" or not text[:e.pos].rstrip().endswith(","):
+            raise
+    return json.loads(remove_trailing_commas(text))
+
+def find_json_spans(text):
+    """单遍扫描文本，返回所有顶层JSON对象的 (起点, 终点, 是否完整) 列表
+
+    按括号配对跟踪嵌套深度，只在对象内部识别字符串（整段跳过，含转义），因此说明文字中的引号和
+    字符串值中的括号都不会打乱配对。响应被截断时，最后一个未闭合的对象以完整标记False返回。
+    """
+    spans = []
+    stack = []
+    start = None
+    position = 0
+    while True:
+        match = _JSON_TOKEN_PATTERN.search(text, position)
+        if match is None:
+            break
+        char = match.group()
+        index = match.start()
+        position = index + 1
+        if char == '"':
+            if stack:
+                string_end = _JSON_STRING_REST_PATTERN.match(text, position)
+                if string_end is None:
+                    break  # 字符串未闭合，响应被截断
+                position = string_end.end()
+        elif char == "{":
+            if not stack:
+                start = index
+            stack.append("}")
+        elif char == "[":
+            if stack:
+                stack.append("]")
+        elif stack:
+            stack.pop()
+            if not stack:
+                spans.append((start, index + 1, True))
+    if stack:
+        spans.append((start, len(text), False))
+    return spans
+
+@traced("json_extract")
+def extract_json_from_response(response_text):
+    """从LLM响应中提取JSON内容
+
+    整个响应就是JSON时（如启用了JSON_RESPONSE_FORMAT）直接解析；其次尝试```json代码块，以及第一个"{"
+    （说明文字中有大括号时再从第一个'{"'）到最后一个"}"之间的内容；
+    否则单遍扫描出所有顶层对象，从最长的开始尝试解析。以上解析失败时都会去掉尾逗号再试一次；
+    仍失败（如被截断）时，只对最长的对象做一次json_repair修复，长度超过JSON_REPAIR_MAX_CHARS时不修复。
+    """
+    try:
+        logger.debug("[格式化] 开始提取JSON内容...")
+        if not response_text:
+            return None
+        
+        # 尝试直接解析整个响应
+        stripped = response_text.strip()
+        if stripped.startswith("{"):
+            try:
+                json_data = json.loads(stripped)
+                logger.debug("[格式化] 直接解析JSON成功")
+                return json_data
+            except ValueError:
+                pass
+        
+        # 常见响应只包含一个JSON：依次尝试```json代码块和第一个"{"到最后一个"}"之间的内容
+        candidates = []
+        fence = response_text.find("```json")
+        if fence != -1:
+            body_start = response_text.find("\n", fence) + 1
+            body_end = response_text.find("```", body_start)
+            if body_start and body_end != -1:
+                candidates.append(response_text[body_start:body_end])
+        first, last = response_text.find("{"), response_text.rfind("}")
+        if first != -1 and last > first:
+            candidates.append(response_text[first:last + 1])
+            object_start = _JSON_OBJECT_START_PATTERN.search(response_text, first)
+            if object_start is not None and first < object_start.start() < last:
+                candidates.append(response_text[object_start.start():last + 1])
+        for candidate in candidates:
+            try:
+                json_data = _loads_allowing_trailing_commas(candidate)
+            except ValueError:
+                continue
+            if isinstance(json_data, dict):
+                logger.debug("[格式化] 从响应中提取JSON成功")
+                return json_data
+        
+        # 按长度从大到小尝试各个完整的顶层对象
+        spans = sorted(find_json_spans(response_text), key=lambda item: item[0] - item[1])
+        for start, end, complete in spans:
+            if not complete:
+                continue
+            try:
+                json_data = _loads_allowing_trailing_commas(response_text[start:end])
+                logger.debug("[格式化] 从响应中提取JSON成功")
+                return json_data
+            except ValueError:
+                continue
+        
+        # 没有可直接解析的对象时，只修复最长的一个（包括被截断的对象）
+        if spans:
+            start, end, _ = spans[0]
+            candidate = response_text[start:end]
+            if len(candidate) > JSON_REPAIR_MAX_CHARS:
+                logger.warning(f"[格式化] 待修复的JSON长度 {len(candidate)} 字符，超过 {JSON_REPAIR_MAX_CHARS} 字符，不做修复")
+                return None
+            import json_repair
+            
+            json_data = json_repair.loads(candidate)
+            if isinstance(json_data, dict) and json_data:
+                logger.debug("[格式化] JSON修复后解析成功")
+                return json_data
+        
+        logger.warning("[格式化] 无法提取JSON，返回原文本")
+        return None
+        
+    except Exception as e:
+        logger.warning(f"[格式化] JSON提取异常: {str(e)}")
+        return None
+
+# 报告JSON中产品信息、测试数据部分可能使用的key名称
+PRODUCT_INFO_KEYS = ["产品信息", "基本信息", "试验信息", "材料信息", "产品基本信息"]
+TEST_DATA_KEYS = ["测试数据", "试验数据", "检测数据", "测量数据", "实验数据"]
+
+def is_report_json_usable(json_data):
+    """判断提取的JSON是否同时包含非空的产品信息和测试数据部分"""
+    if not json_data or not isinstance(json_data, dict):
+        return False
+    has_product_info = any(isinstance(json_data.get(key), dict) and json_data[key] for key in PRODUCT_INFO_KEYS)
+    has_test_data = any(isinstance(json_data.get(key), dict) and json_data[key] for key in TEST_DATA_KEYS)
+    return has_product_info and has_test_data
+
+def validate_report_json(json_data):
+    """校验提取结果：至少包含产品信息或测试数据中的一个非空部分"""
+    if not json_data or not isinstance(json_data, dict):
+        return False
+    return any(isinstance(json_data.get(key), dict) and json_data[key] for key in PRODUCT_INFO_KEYS + TEST_DATA_KEYS)
+
+def has_test_data(json_data):
+    """判断提取的JSON是否包含非空的测试数据部分"""
+    return isinstance(json_data, dict) and any(isinstance(json_data.get(key), dict) and json_data[key] for key in TEST_DATA_KEYS)
+
+def _is_empty_value(value):
+    return value is None or value == "" or value == [] or value == {}
+
+def _merge_values(base, extra):
+    """合并同一字段的两个值：字典逐键合并，列表按顺序追加并去重，标量保留先出现的非空值"""
+    if isinstance(base, dict) and isinstance(extra, dict):
+        merged = dict(base)
+        for key, value in extra.items():
+            merged[key] = _merge_values(merged[key], value) if key in merged else value
+        return merged
+    if isinstance(base, list) and isinstance(extra, list):
+        merged = list(base)
+        seen = {json.dumps(item, ensure_ascii=False, sort_keys=True) for item in base}
+        for item in extra:
+            marker = json.dumps(item, ensure_ascii=False, sort_keys=True)
+            if marker not in seen:
+                seen.add(marker)
+                merged.append(item)
+        return merged
+    return extra if _is_empty_value(base) else base
+
+def merge_report_json(page_jsons):
+    """按页码顺序对各页提取的报告JSON做字段级合并
+
+    不同页面对同一部分使用不同key名称时（如"测试数据"与"试验数据"），统一到最先出现的名称；
+    跨页表格的行按顺序拼接并去除重复行，其余字段保留最先出现的非空值。
+    """
+    merged = {}
+    section_names = {}
+    for json_data in page_jsons:
+        if not isinstance(json_data, dict):
+            continue
+        for key, value in json_data.items():
+            for aliases in (PRODUCT_INFO_KEYS, TEST_DATA_KEYS):
+                if key in aliases:
+                    key = section_names.setdefault(id(aliases), key)
+                    break
+            merged[key] = _merge_values(merged[key], value) if key in merged else value
+    return merged
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256摘要"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def slim_model_response(result):
+    """只保留模型响应中第一条回复的消息内容，丢弃usage等字段；不是正常响应时原样返回"""
+    try:
+        content = result["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return result
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+def release_fitz_store(processed_pages):
+    """每处理FITZ_STORE_SHRINK_INTERVAL页清空一次MuPDF的全局资源缓存"""
+    if FITZ_STORE_SHRINK_INTERVAL and processed_pages and processed_pages % FITZ_STORE_SHRINK_INTERVAL == 0:
+        import fitz  # PyMuPDF
+        fitz.TOOLS.store_shrink(100)
+
+class PageResultSpool:
+    """按页码顺序保存逐页结果的只读序列
+
+    结果数不超过spill_pages时保存在内存中；超过后全部转存到匿名临时文件（每行一个JSON），
+    内存中只保留各行的偏移量，迭代和下标访问时再从文件读取。用完后调用close()（或用with）删除临时文件。
+    """
+
+    def __init__(self, spill_pages=PAGE_RESULT_SPILL_PAGES, spill_dir=PAGE_RESULT_SPILL_DIR):
+        self.spill_pages = spill_pages
+        self.spill_dir = spill_dir
+        self._items = []
+        self._file = None
+        self._offsets = []
+
+    def append(self, item):
+        if self._file is None:
+            self._items.append(item)
+            if self.spill_pages is not None and len(self._items) > self.spill_pages:
+                self._spill()
+            return
+        self._write(item)
+
+    def _spill(self):
+        import tempfile
+
+        self._file = tempfile.TemporaryFile(mode="w+b", dir=self.spill_dir, prefix="pdf_pages_")
+        for item in self._items:
+            self._write(item)
+        self._items = []
+        logger.info(f"[后台] 逐页结果超过 {self.spill_pages} 页，转存到临时文件")
+
+    def _write(self, item):
+        self._file.seek(0, os.SEEK_END)
+        self._offsets.append(self._file.tell())
+        self._file.write(json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    @property
+    def spilled(self):
+        return self._file is not None
+
+    def __len__(self):
+        return len(self._offsets) if self._file is not None else len(self._items)
+
+    def __getitem__(self, index):
+        if self._file is None:
+            return self._items[index]
+        self._file.seek(self._offsets[index])
+        return json.loads(self._file.readline())
+
+    def __iter__(self):
+        if self._file is None:
+            yield from self._items
+            return
+        for index in range(len(self._offsets)):
+            yield self[index]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._offsets = []
+        self._items = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ResultCache:
+    """以内容哈希为键的模型结果缓存（SQLite持久化）
+
+    默认用于页面分析结果：缓存键由文件哈希、页码、提示词、视觉模型和渲染参数共同决定，
+    值为模型返回的choices消息内容。按存活时间和总大小淘汰旧条目。
+    """
+
+    def __init__(self, db_path=RESULT_CACHE_PATH, max_bytes=RESULT_CACHE_MAX_BYTES, max_age=RESULT_CACHE_MAX_AGE, table="page_results"):
+        self.db_path = db_path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_accessed ON {self.table} (accessed_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def make_key(*parts):
+        """根据影响结果的全部参数生成缓存键，参数须可JSON序列化"""
+        key_source = json.dumps(list(parts), ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """读取缓存内容，未命中或已过期时返回None"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(f"SELECT content, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            content, created_at = row
+            if self.max_age and now - created_at > self.max_age:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            return content
+
+    def put(self, key, content):
+        """写入缓存内容并按需淘汰旧条目"""
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, content, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        """删除过期条目，并在超出大小上限时按最近访问时间淘汰最旧的条目"""
+        if self.max_age:
+            conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.max_age,))
+        if not self.max_bytes:
+            return
+        total_size = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at").fetchall():
+            if total_size <= self.max_bytes:
+                break
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            total_size -= size
+            evicted += 1
+        logger.info(f"[缓存] 超出大小上限，已淘汰 {evicted} 条缓存")
+
+    def clear(self):
+        """清空全部缓存"""
+        with self._lock, self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+class PDFExtractor:
+    """PDF测试报告提取器：逐页渲染或读取文本层，调用模型提取报告JSON"""
+
+    def __init__(self, use_cache=RESULT_CACHE_ENABLED):
+        self.result_cache = ResultCache() if use_cache else None
+    
+    @traced("vision_api")
+    @retry_api_call(max_retries=MAX_RETRIES)
+    def call_vision_api_with_base64(self, base64_image, question, mime_type="image/png"):
+        """使用base64编码的图像调用视觉API"""
+        logger.debug("[后台] 正在调用视觉API...")
+        api_url = f"{BASE_URL}/chat/completions"
+
+        image_url = f"data:{mime_type};base64,{base64_image}"
+        logger.debug(f"[后台] API URL: {api_url}")
+        logger.debug(f"[后台] 使用模型: {VL_MODEL}")
+        logger.debug(f"[后台] 图像大小: {len(base64_image)} 字符")
+
+        payload = {
+            "model": VL_MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "image_url", "image_url": {"url": image_url}},
+                        {"type": "text", "text": question}
+                    ]
+                }
+            ],
+            "max_tokens": 2048
+        }
+
+        logger.debug("[后台] 发送API请求...")
+        request_start = time.perf_counter()
+        result = post_model_api("/chat/completions", apply_response_format(payload))
+        logger.debug(f"[后台] API请求成功，耗时 {(time.perf_counter() - request_start) * 1000:.0f}ms")
+        
+        return result
+
+    @traced("vision_api_pages")
+    @retry_api_call(max_retries=MAX_RETRIES)
+    def call_vision_api_with_pages(self, page_parts, question):
+        """将多页内容（图像或文本层文本）放入同一条消息调用视觉API
+
+        page_parts为按页码排列的 (页码, 类型, 内容, mime_type) 列表，类型为"image"或"text"。
+        """
+        logger.debug(f"[后台] 正在调用视觉API（{len(page_parts)}页合并请求）...")
+        content = []
+        for page_number, kind, data, mime_type in page_parts:
+            if kind == "text":
+                content.append({"type": "text", "text": f"第{page_number}页文本：\n{data}"})
+            else:
+                content.append({"type": "text", "text": f"第{page_number}页图像："})
+                content.append({"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{data}"}})
+        content.append({
+            "type": "text",
+            "text": f"以上是同一份测试报告的连续{len(page_parts)}页，表格可能跨页延续，请将各页内容合并为一份完整的报告。\n{question}"
+        })
+        
+        payload = {
+            "model": VL_MODEL,
+            "messages": [{"role": "user", "content": content}],
+            "max_tokens": 4096
+        }
+        
+        request_start = time.perf_counter()
+        result = post_model_api("/chat/completions", apply_response_format(payload), timeout=MODEL_API_TIMEOUT * 2)
+        logger.debug(f"[后台] 合并请求成功，耗时 {(time.perf_counter() - request_start) * 1000:.0f}ms")
+        
+        return result
+
+    @traced("text_api")
+    @retry_api_call(max_retries=MAX_RETRIES)
+    def call_text_api(self, page_text, question):
+        """使用页面文本层内容调用纯文本模型"""
+        logger.debug("[后台] 正在调用文本API...")
+        logger.debug(f"[后台] 使用模型: {TEXT_MODEL}")
+        logger.debug(f"[后台] 页面文本长度: {len(page_text)} 字符")
+        
+        payload = {
+            "model": TEXT_MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"以下是从PDF测试报告某一页中提取的文本和表格内容：\n\n{page_text}\n\n{question}"
+                }
+            ],
+            "max_tokens": 2048,
+            "temperature": 0.1
+        }
+        
+        logger.debug("[后台] 发送文本API请求...")
+        result = post_model_api("/chat/completions", apply_response_format(payload))
+        logger.debug("[后台] 文本API请求成功")
+        
+        return result
+
+    @traced("text_layer")
+    def extract_page_text(self, page):
+        """提取页面文本层和表格，返回结构化文本；文本层不足时返回None"""
+        text = page.get_text("text").strip()
+        if len(text) < TEXT_LAYER_MIN_CHARS:
+            return None
+        
+        parts = ["【页面文本】", text]
+        try:
+            tables = page.find_tables().tables
+        except Exception as table_error:
+            # 旧版PyMuPDF没有find_tables，或表格识别失败时只使用纯文本
+            logger.warning(f"[后台] 表格提取失败，仅使用页面文本: {str(table_error)}")
+            tables = []
+        
+        for index, table in enumerate(tables, start=1):
+            rows = table.extract()
+            if not rows:
+                continue
+            parts.append(f"【表格{index}】")
+            for row in rows:
+                parts.append(" | ".join("" if cell is None else str(cell).replace("\n", " ") for cell in row))
+        
+        return "\n".join(parts)
+
+    def _text_result_usable(self, page_num, future):
+        """判断文本层快速路径的结果是否通过校验"""
+        try:
+            result = future.result()
+            content = result["choices"][0]["message"]["content"]
+        except Exception as text_error:
+            logger.warning(f"[后台] 第{page_num + 1}页: 文本API调用失败: {str(text_error)}")
+            return False
+        return validate_report_json(extract_json_from_response(content))
+
+    def render_page_image(self, page):
+        """按渲染配置将页面渲染为图像并进行Base64编码
+
+        返回 (base64_image, mime_type, stats)，stats中记录渲染尺寸、载荷大小和各阶段耗时。
+        """
+        import fitz  # PyMuPDF
+        
+        with span("render") as render_span:
+            # 裁剪到内容边界框
+            clip = page.rect
+            if RENDER_CROP_TO_CONTENT:
+                content_rect = fitz.Rect()
+                for _, bbox in page.get_bboxlog():
+                    content_rect |= fitz.Rect(bbox)
+                if not content_rect.is_empty:
+                    clip = (content_rect + (-RENDER_CROP_MARGIN, -RENDER_CROP_MARGIN, RENDER_CROP_MARGIN, RENDER_CROP_MARGIN)) & page.rect
+            
+            # 按像素预算确定缩放倍数
+            zoom = RENDER_ZOOM
+            if RENDER_MAX_PIXELS and clip.width * clip.height * zoom * zoom > RENDER_MAX_PIXELS:
+                zoom = (RENDER_MAX_PIXELS / (clip.width * clip.height)) ** 0.5
+            
+            # 扫描页按灰度渲染
+            is_scanned = not page.get_text("text").strip() and bool(page.get_images())
+            colorspace = fitz.csGRAY if RENDER_GRAYSCALE_SCANNED and is_scanned else fitz.csRGB
+            
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=colorspace, clip=clip, alpha=False)
+        render_ms = render_span.elapsed * 1000
+        
+        # 编码图像
+        with span("encode", format=RENDER_FORMAT.lower()) as encode_span:
+            image_format = RENDER_FORMAT.lower()
+            if image_format in ("jpeg", "jpg"):
+                img_bytes = pix.tobytes("jpeg", jpg_quality=RENDER_QUALITY)
+                mime_type = "image/jpeg"
+            elif image_format == "webp":
+                from io import BytesIO
+                from PIL import Image
+                mode = "L" if pix.n == 1 else "RGB"
+                buffer = BytesIO()
+                Image.frombytes(mode, (pix.width, pix.height), pix.samples).save(buffer, format="WEBP", quality=RENDER_QUALITY)
+                img_bytes = buffer.getvalue()
+                mime_type = "image/webp"
+            else:
+                img_bytes = pix.tobytes("png")
+                mime_type = "image/png"
+            # 编码后立即释放像素缓冲区和图像字节，大页面的内存占用只保留Base64载荷
+            width, height = pix.width, pix.height
+            pix = None
+            image_bytes = len(img_bytes)
+            base64_image = base64.b64encode(img_bytes).decode('utf-8')
+            img_bytes = None
+        encode_ms = encode_span.elapsed * 1000
+        
+        stats = {
+            "zoom": round(zoom, 3),
+            "width": width,
+            "height": height,
+            "grayscale": colorspace is fitz.csGRAY,
+            "mime_type": mime_type,
+            "image_bytes": image_bytes,
+            "payload_chars": len(base64_image),
+            "render_ms": round(render_ms, 1),
+            "encode_ms": round(encode_ms, 1),
+        }
+        logger.debug(
+            f"[后台] 第{page.number + 1}页: 渲染 {stats['width']}x{stats['height']} ({mime_type}{'，灰度' if stats['grayscale'] else ''})，"
+            f"图像大小 {image_bytes} 字节，Base64载荷 {len(base64_image)} 字符，"
+            f"渲染耗时 {stats['render_ms']}ms，编码耗时 {stats['encode_ms']}ms"
+        )
+        return base64_image, mime_type, stats
+
+    def triage_page(self, page, scanned_document=False):
+        """根据文本密度、表格线、关键词和图像熵给页面打分，返回分诊信息字典
+
+        扫描件（整份文档都没有文本层）只能按缩略图的灰度熵区分空白页；
+        有文本层的文档中没有任何文字的页面可能是嵌入的扫描数据表，同样按灰度熵打分，不直接丢弃。
+        """
+        import fitz  # PyMuPDF
+        
+        text = page.get_text("text")
+        text_chars = len("".join(text.split()))
+        lowered = text.lower()
+        keyword_hits = [keyword for keyword in PAGE_TRIAGE_KEYWORDS if keyword.lower() in lowered]
+        table_lines = sum(1 for drawing in page.get_drawings() for item in drawing["items"] if item[0] in ("l", "re"))
+        has_table = table_lines >= PAGE_TRIAGE_TABLE_MIN_LINES
+        
+        entropy = None
+        if text_chars < TEXT_LAYER_MIN_CHARS:
+            # 缩略图灰度直方图的熵：空白页接近0，扫描的表格或照片较高
+            pix = page.get_pixmap(matrix=fitz.Matrix(0.25, 0.25), colorspace=fitz.csGRAY, alpha=False)
+            samples = pix.samples
+            histogram = [0] * 256
+            for value in samples:
+                histogram[value] += 1
+            total = len(samples) or 1
+            entropy = sum(-count / total * math.log2(count / total) for count in histogram if count)
+        
+        if scanned_document or text_chars == 0:
+            score = 1.0 if entropy is not None and entropy >= PAGE_TRIAGE_MIN_ENTROPY else 0.0
+        else:
+            score = len(keyword_hits) + (1.0 if has_table else 0.0) + 0.5 * min(text_chars / 500, 1.0)
+        
+        return {
+            "page": page.number + 1,
+            "score": round(score, 2),
+            "keep": score >= PAGE_TRIAGE_MIN_SCORE,
+            "text_chars": text_chars,
+            "keywords": keyword_hits,
+            "table_lines": table_lines,
+            "entropy": None if entropy is None else round(entropy, 2),
+        }
+
+    @traced("triage")
+    def triage_document(self, doc):
+        """对文档所有页面分诊，返回按得分从高到低排列的待分析页码（从0开始）
+
+        没有任何页面达到阈值时保留全部页面，避免分诊失误导致整份报告无结果。
+        """
+        scanned_document = all(not page.get_text("text").strip() for page in doc)
+        start = time.perf_counter()
+        decisions = []
+        for page in doc:
+            decisions.append(self.triage_page(page, scanned_document))
+            release_fitz_store(len(decisions))
+        triage_ms = (time.perf_counter() - start) * 1000
+        
+        for decision in decisions:
+            logger.debug(
+                f"[分诊] 第{decision['page']}页: 得分 {decision['score']}，{'保留' if decision['keep'] else '跳过'}"
+                f"（文字 {decision['text_chars']} 字，关键词 {decision['keywords'] or '无'}，表格线 {decision['table_lines']}，"
+                f"熵 {decision['entropy'] if decision['entropy'] is not None else '-'}）"
+            )
+        
+        kept = [decision for decision in decisions if decision["keep"]]
+        if not kept:
+            logger.info(f"[分诊] 没有页面达到阈值，保留全部 {len(decisions)} 页")
+            kept = decisions
+        ranked = [decision["page"] - 1 for decision in sorted(kept, key=lambda item: (-item["score"], item["page"]))]
+        skipped = len(decisions) - len(ranked)
+        logger.info(
+            f"[分诊] {'扫描件' if scanned_document else '文本文档'}共 {len(decisions)} 页，保留 {len(ranked)} 页，"
+            f"跳过 {skipped} 页（节省 {skipped} 次模型调用），分诊耗时 {triage_ms:.1f}ms"
+        )
+        return ranked
+
+    def select_pages(self, doc, use_triage=None):
+        """返回待分析的页码列表（从0开始）：启用分诊时按得分从高到低排列，否则为全部页面；分诊出错时退回全部页面"""
+        if use_triage is None:
+            use_triage = PAGE_TRIAGE_ENABLED
+        if not use_triage:
+            return list(range(len(doc)))
+        try:
+            return self.triage_document(doc)
+        except Exception as triage_error:
+            logger.warning(f"[分诊] 页面分诊失败，分析全部页面: {str(triage_error)}")
+            return list(range(len(doc)))
+
+    @staticmethod
+    def _render_params(use_text_layer):
+        """影响页面结果的渲染参数，作为结果缓存key的一部分"""
+        return {
+            "zoom": RENDER_ZOOM,
+            "max_pixels": RENDER_MAX_PIXELS,
+            "format": RENDER_FORMAT,
+            "quality": RENDER_QUALITY,
+            "grayscale_scanned": RENDER_GRAYSCALE_SCANNED,
+            "crop": RENDER_CROP_TO_CONTENT,
+            "text_layer": use_text_layer,
+        }
+
+    def _image_page_numbers(self, doc, page_numbers, cache, file_hash, question, render_params, use_text_layer):
+        """预判需要图像识别的页面：未命中结果缓存且没有可用的文本层"""
+        image_pages = []
+        for page_num in page_numbers:
+            if cache is not None and cache.get(cache.make_key(file_hash, page_num, question, VL_MODEL, render_params)) is not None:
+                continue
+            if use_text_layer and len(doc.load_page(page_num).get_text("text").strip()) >= TEXT_LAYER_MIN_CHARS:
+                continue
+            image_pages.append(page_num)
+        return image_pages
+
+    def _store_page_result(self, page_num, cache_key, result):
+        """将成功的页面结果写入缓存，缓存失败不影响分析流程"""
+        choices = result.get("choices") or []
+        if not choices or not choices[0].get("message", {}).get("content"):
+            return
+        try:
+            self.result_cache.put(cache_key, choices[0]["message"]["content"])
+        except Exception as cache_error:
+            logger.warning(f"[缓存] 第{page_num + 1}页: 写入缓存失败: {str(cache_error)}")
+
+    def _collect_page_result(self, page_num, future, cache_key=None):
+        """等待单页的视觉API调用完成并整理为页结果，成功结果写入缓存"""
+        try:
+            result = future.result()
+            logger.debug(f"[后台] 第{page_num + 1}页: 分析完成")
+            if cache_key and self.result_cache is not None and not result.get("cached"):
+                self._store_page_result(page_num, cache_key, result)
+            return {
+                "page": page_num + 1,
+                "result": slim_model_response(result)
+            }
+        except Exception as api_error:
+            logger.warning(f"[后台] 第{page_num + 1}页: API调用最终失败: {str(api_error)}")
+            # 继续处理其他页面，但记录错误
+            return {
+                "page": page_num + 1,
+                "result": {"error": f"API调用失败: {str(api_error)}"}
+            }
+
+    def iter_pdf_pages(self, pdf_path, question, max_concurrency=None, use_cache=True, use_text_layer=None, progress_callback=None, page_numbers=None, use_triage=None):
+        """按page_numbers给定的顺序逐页产出PDF分析结果的生成器
+
+        页面渲染在当前线程中按顺序进行，模型调用提交到线程池并发执行，
+        在途请求数不超过max_concurrency（默认VISION_CONCURRENCY）。
+        命中结果缓存的页面不再渲染和调用API，直接产出缓存的消息内容。
+        启用文本层快速路径时（默认TEXT_LAYER_ENABLED），有文本层的页面先用
+        纯文本模型提取，结果未通过校验时再回退到图像识别。
+        启用多进程渲染池时（见pdf_render_pool），需要图像识别的页面预先交给渲染池并行渲染。
+        调用方提前关闭生成器时，尚未开始的请求会被取消，剩余页面不再渲染。
+        page_numbers指定要分析的页码（从0开始）及顺序；未指定且启用页面分诊时（默认PAGE_TRIAGE_ENABLED）
+        只分析分诊保留的页面，并按得分从高到低的顺序提交，调用方提前结束时最可能是数据页的页面已先分析。
+        progress_callback(已完成页数, 待分析页数) 在每页结果产出前调用。
+        """
+        if max_concurrency is None:
+            max_concurrency = VISION_CONCURRENCY
+        max_concurrency = max(1, int(max_concurrency))
+        if use_text_layer is None:
+            use_text_layer = TEXT_LAYER_ENABLED
+        
+        import fitz  # PyMuPDF
+        
+        logger.info(f"[后台] 开始分析PDF文件: {pdf_path}")
+        doc = fitz.open(pdf_path)
+        if page_numbers is None:
+            page_numbers = self.select_pages(doc, use_triage)
+        page_numbers = list(page_numbers)
+        total_pages = len(page_numbers)
+        logger.info(f"[后台] PDF总页数: {len(doc)}，待分析 {total_pages} 页，最大并发请求数: {max_concurrency}")
+        cache = self.result_cache if use_cache else None
+        file_hash = hash_file(pdf_path) if cache is not None else None
+        render_params = self._render_params(use_text_layer)
+        executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="vision-api")
+        pending = deque()
+        yielded_pages = 0
+        processed_pages = 0
+        cache_hits = 0
+        text_pages = 0
+        image_totals = {"pages": 0, "payload_chars": 0, "render_ms": 0.0, "encode_ms": 0.0}
+        # 生成器跨越yield，不能用span（上下文会泄漏给调用方），结束时直接计入直方图
+        pages_start = time.perf_counter()
+        
+        rendered_pages = None
+        next_rendered = None
+        # 渲染池按page_numbers的顺序产出，按页面在其中的位置比较先后
+        page_order = {page_num: index for index, page_num in enumerate(page_numbers)}
+        
+        def submit_image_request(page_num, rendered=None):
+            # 将页面渲染为图像（或使用渲染池的结果）并提交视觉API分析任务（带重试机制）
+            if rendered is None:
+                logger.debug(f"[后台] 第{page_num + 1}页: 开始渲染图像...")
+                rendered = self.render_page_image(doc.load_page(page_num))
+            base64_image, mime_type, stats = rendered
+            image_totals["pages"] += 1
+            for key in ("payload_chars", "render_ms", "encode_ms"):
+                image_totals[key] += stats[key]
+            logger.debug(f"[后台] 第{page_num + 1}页: 开始API分析...")
+            return executor.submit(self.call_vision_api_with_base64, base64_image, question, mime_type)
+        
+        def take_rendered(page_num):
+            # 取出渲染池中本页的结果；预判与实际不一致（如其间写入了缓存）时跳过多余的页面，没有时返回None
+            nonlocal next_rendered
+            while rendered_pages is not None:
+                if next_rendered is None:
+                    next_rendered = next(rendered_pages, None)
+                    if next_rendered is None:
+                        return None
+                if page_order[next_rendered[0]] > page_order[page_num]:
+                    return None
+                rendered_num, rendered = next_rendered
+                next_rendered = None
+                if rendered_num == page_num:
+                    return rendered
+            return None
+        
+        def next_page_result():
+            page_num, future, cache_key, from_text_layer = pending.popleft()
+            if from_text_layer and not self._text_result_usable(page_num, future):
+                logger.warning(f"[后台] 第{page_num + 1}页: 文本层提取结果未通过校验，回退到图像识别")
+                future = submit_image_request(page_num)
+            result_item = self._collect_page_result(page_num, future, cache_key)
+            if progress_callback is not None:
+                progress_callback(yielded_pages, total_pages)
+            return result_item
+        
+        try:
+            if get_render_pool(total_pages) is not None:
+                image_pages = self._image_page_numbers(doc, page_numbers, cache, file_hash, question, render_params, use_text_layer)
+                render_pool = get_render_pool(len(image_pages))
+                if render_pool is not None:
+                    logger.info(f"[后台] {len(image_pages)} 页需要图像识别，交给渲染池并行渲染")
+                    rendered_pages = render_pool.iter_pages(pdf_path, image_pages)
+            
+            for page_num in page_numbers:
+                # 在途请求已满时先产出最早提交的页面，既限制并发又保证页序
+                while len(pending) >= max_concurrency:
+                    yielded_pages += 1
+                    yield next_page_result()
+                
+                logger.debug(f"[后台] 正在处理第 {page_num + 1}/{len(doc)} 页...")
+                
+                # 命中缓存时跳过渲染和API调用
+                cache_key = None
+                if cache is not None:
+                    cache_key = cache.make_key(file_hash, page_num, question, VL_MODEL, render_params)
+                    cached_content = cache.get(cache_key)
+                    if cached_content is not None:
+                        logger.debug(f"[后台] 第{page_num + 1}页: 命中结果缓存")
+                        cache_hits += 1
+                        future = Future()
+                        future.set_result({
+                            "choices": [{"message": {"role": "assistant", "content": cached_content}}],
+                            "cached": True
+                        })
+                        pending.append((page_num, future, cache_key, False))
+                        continue
+                
+                page = doc.load_page(page_num)
+                processed_pages += 1
+                release_fitz_store(processed_pages)
+                
+                # 有文本层的页面优先走纯文本快速路径
+                page_text = self.extract_page_text(page) if use_text_layer else None
+                if page_text is not None:
+                    logger.info(f"[后台] 第{page_num + 1}页: 使用文本层快速路径，文本长度 {len(page_text)} 字符")
+                    text_pages += 1
+                    future = executor.submit(self.call_text_api, page_text, question)
+                    pending.append((page_num, future, cache_key, True))
+                    continue
+                
+                # 渲染下一页时本页请求已在进行中
+                pending.append((page_num, submit_image_request(page_num, take_rendered(page_num)), cache_key, False))
+            
+            while pending:
+                yielded_pages += 1
+                yield next_page_result()
+            
+            logger.info(f"[后台] PDF分析完成，共分析 {total_pages} 页，其中缓存命中 {cache_hits} 页，文本层快速路径 {text_pages} 页")
+            if image_totals["pages"]:
+                logger.info(
+                    f"[后台] 图像识别 {image_totals['pages']} 页，平均载荷 {image_totals['payload_chars'] // image_totals['pages']} 字符，"
+                    f"平均渲染 {image_totals['render_ms'] / image_totals['pages']:.1f}ms，平均编码 {image_totals['encode_ms'] / image_totals['pages']:.1f}ms"
+                )
+        finally:
+            if yielded_pages < total_pages:
+                logger.info(f"[后台] 提前结束分析：已返回 {yielded_pages} 页，不再处理剩余 {total_pages - yielded_pages} 页")
+            # 取消尚未开始的请求，不等待已在进行中的请求
+            executor.shutdown(wait=False, cancel_futures=True)
+            if rendered_pages is not None:
+                rendered_pages.close()
+            doc.close()
+            STAGE_DURATION.observe(time.perf_counter() - pages_start, stage="pdf_pages")
+
+    @traced("analyze_pdf")
+    def analyze_pdf(self, pdf_path, question, max_concurrency=None, use_text_layer=None):
+        """分析PDF文件的每一页，按页码顺序返回全部结果
+
+        结果为PageResultSpool（可迭代、可按下标访问），超过PAGE_RESULT_SPILL_PAGES页后转存到临时文件，
+        数百页的文档也不会把全部页面结果留在内存中；出错时返回{"error": ...}。
+        """
+        import fitz  # PyMuPDF
+        
+        results = PageResultSpool()
+        try:
+            with fitz.open(pdf_path) as doc:
+                page_numbers = sorted(self.select_pages(doc))
+            for result_item in self.iter_pdf_pages(pdf_path, question, max_concurrency, use_text_layer=use_text_layer, page_numbers=page_numbers):
+                results.append(result_item)
+            return results
+        except Exception as e:
+            results.close()
+            error_msg = f"处理PDF时出错: {str(e)}"
+            logger.warning(f"[后台] 错误: {error_msg}")
+            return {"error": error_msg}
+
+    @traced("stitch_report")
+    def extract_stitched_report(self, pdf_path, question=REPORT_QUESTION, use_cache=True, use_text_layer=None, max_pages=None, page_numbers=None):
+        """将报告的max_pages页（默认STITCH_MAX_PAGES）合并为一次模型请求提取报告
+
+        page_numbers为按优先级排列的候选页码（从0开始，如页面分诊的排序结果），取前max_pages页并按页序放入请求；
+        未指定时使用前max_pages页。有文本层的页面以文本形式放入请求，其余页面渲染为图像。
+        返回页面报告字典（page、pages、raw、json），模型调用失败或响应格式错误时返回None。
+        """
+        import fitz  # PyMuPDF
+        
+        if max_pages is None:
+            max_pages = STITCH_MAX_PAGES
+        if use_text_layer is None:
+            use_text_layer = TEXT_LAYER_ENABLED
+        
+        with fitz.open(pdf_path) as doc:
+            if page_numbers is None:
+                page_numbers = range(len(doc))
+            selected = sorted(page_numbers[:max_pages])
+            pages = [page_num + 1 for page_num in selected]
+            cache = self.result_cache if use_cache else None
+            cache_key = None
+            if cache is not None:
+                cache_key = cache.make_key(hash_file(pdf_path), "stitched", selected, question, VL_MODEL, self._render_params(use_text_layer))
+                content = cache.get(cache_key)
+                if content is not None:
+                    logger.info(f"[后台] 第{'、'.join(map(str, pages))}页合并结果命中缓存")
+                    return {"page": pages[0], "pages": pages, "raw": content, "json": extract_json_from_response(content)}
+            
+            page_texts = {
+                page_num: self.extract_page_text(doc.load_page(page_num)) if use_text_layer else None
+                for page_num in selected
+            }
+            image_pages = [page_num for page_num in selected if page_texts[page_num] is None]
+            # 多页图像在渲染池中并行渲染，未启用渲染池时逐页渲染
+            render_pool = get_render_pool(len(image_pages))
+            if render_pool is not None:
+                images = dict(render_pool.iter_pages(pdf_path, image_pages))
+            else:
+                images = {page_num: self.render_page_image(doc.load_page(page_num)) for page_num in image_pages}
+            
+            page_parts = []
+            for page_num in selected:
+                if page_texts[page_num] is not None:
+                    page_parts.append((page_num + 1, "text", page_texts[page_num], None))
+                else:
+                    base64_image, mime_type, _ = images[page_num]
+                    page_parts.append((page_num + 1, "image", base64_image, mime_type))
+        
+        try:
+            result = self.call_vision_api_with_pages(page_parts, question)
+            content = result["choices"][0]["message"]["content"]
+        except Exception as api_error:
+            logger.warning(f"[后台] 第{'、'.join(map(str, pages))}页合并请求失败: {str(api_error)}")
+            return None
+        
+        if cache_key is not None and content:
+            try:
+                cache.put(cache_key, content)
+            except Exception as cache_error:
+                logger.warning(f"[缓存] 写入合并请求结果失败: {str(cache_error)}")
+        return {"page": pages[0], "pages": pages, "raw": content, "json": extract_json_from_response(content)}
+
+    @traced("extract_report")
+    def extract_report(self, pdf_path, question=REPORT_QUESTION, max_concurrency=None, use_cache=True, use_text_layer=None, progress_callback=None, stitch_mode=None, use_triage=None):
+        """分析PDF并返回报告信息
+
+        启用页面分诊时（use_triage，默认PAGE_TRIAGE_ENABLED）只分析分诊保留的页面，并按得分从高到低的顺序分析。
+        stitch_mode（默认REPORT_STITCH_MODE）决定多页报告的处理方式：
+        "multi_image" 先将得分最高的STITCH_MAX_PAGES页合并为一次请求，结果不完整时退回逐页提取并按字段合并；
+        "merge" 逐页提取，从第一个完整页面起把之后仍含测试数据的页面按字段合并进来（最多STITCH_MAX_PAGES页，合并时按页序排列）；
+        "off" 一旦某页提取出完整的报告JSON即停止分析剩余页面。
+        没有完整报告时退回到第一个成功页面的结果。返回字典包含 page、pages、raw、json（均可能为None）、
+        errors（失败页面的错误信息列表）和 format_error（是否出现格式错误的响应）。
+        打开或渲染PDF失败时抛出异常。progress_callback含义同iter_pdf_pages。
+        """
+        import fitz  # PyMuPDF
+        
+        if stitch_mode is None:
+            stitch_mode = REPORT_STITCH_MODE
+        report = {"page": None, "pages": None, "raw": None, "json": None, "errors": [], "format_error": False}
+        
+        with fitz.open(pdf_path) as doc:
+            page_numbers = self.select_pages(doc, use_triage)
+        
+        if stitch_mode == "multi_image" and len(page_numbers) > 1:
+            stitched = self.extract_stitched_report(
+                pdf_path, question, use_cache=use_cache, use_text_layer=use_text_layer, page_numbers=page_numbers
+            )
+            if stitched is not None and is_report_json_usable(stitched["json"]):
+                logger.info(f"[后台] 第{'、'.join(map(str, stitched['pages']))}页合并请求已获得完整报告信息")
+                report.update(stitched)
+                return report
+            logger.info("[后台] 合并请求未获得完整报告，改为逐页提取并按字段合并")
+        
+        merge_pages = stitch_mode in ("multi_image", "merge")
+        merged_reports = []
+        first_success = None
+        pages = self.iter_pdf_pages(
+            pdf_path, question, max_concurrency,
+            use_cache=use_cache, use_text_layer=use_text_layer, progress_callback=progress_callback,
+            page_numbers=page_numbers
+        )
+        try:
+            for result_item in pages:
+                result = result_item["result"]
+                if isinstance(result, dict) and "error" in result:
+                    report["errors"].append(f"第{result_item['page']}页: {result['error']}")
+                    continue
+                
+                if not ("choices" in result and len(result["choices"]) > 0):
+                    logger.warning(f"[后台] 第{result_item['page']}页: 分析结果格式错误")
+                    report["format_error"] = True
+                    continue
+                
+                raw_report_info = result["choices"][0]["message"]["content"]
+                logger.info(f"[后台] 第{result_item['page']}页: 提取原始报告信息成功，长度: {len(raw_report_info)} 字符")
+                
+                # 提取JSON内容
+                json_data = extract_json_from_response(raw_report_info)
+                page_report = {"page": result_item["page"], "pages": [result_item["page"]], "raw": raw_report_info, "json": json_data}
+                if first_success is None:
+                    first_success = page_report
+                if merge_pages:
+                    if not merged_reports:
+                        if is_report_json_usable(json_data):
+                            merged_reports.append(page_report)
+                        continue
+                    # 完整页面之后仍含测试数据的页面视为跨页延续的表格
+                    if not has_test_data(json_data):
+                        break
+                    merged_reports.append(page_report)
+                    if len(merged_reports) >= STITCH_MAX_PAGES:
+                        break
+                    continue
+                if is_report_json_usable(json_data):
+                    logger.info(f"[后台] 第{result_item['page']}页: 已获得完整报告信息，停止分析剩余页面")
+                    report.update(page_report)
+                    return report
+        finally:
+            pages.close()
+        
+        if merged_reports:
+            # 页面按分诊得分的顺序分析，合并时恢复为阅读顺序
+            merged_reports.sort(key=lambda page_report: page_report["page"])
+            page_numbers = [page_report["page"] for page_report in merged_reports]
+            logger.info(f"[后台] 按字段合并第{'、'.join(map(str, page_numbers))}页的报告信息")
+            report.update({
+                "page": page_numbers[0],
+                "pages": page_numbers,
+                "raw": "\n\n".join(page_report["raw"] for page_report in merged_reports),
+                "json": merge_report_json([page_report["json"] for page_report in merged_reports])
+            })
+        elif first_success is not None:
+            report.update(first_success)
+        return report
+
+
+def main(argv=None):
+    """命令行入口：提取单个PDF的报告JSON，不加载gradio和lightrag"""
+    parser = argparse.ArgumentParser(description="提取PDF拉伸测试报告中的产品信息和测试数据")
+    parser.add_argument("pdf_path", help="PDF文件路径")
+    parser.add_argument("-o", "--output", help="结果JSON输出路径，默认打印到标准输出")
+    parser.add_argument("--concurrency", type=int, default=VISION_CONCURRENCY, help="同时在途的模型请求上限")
+    parser.add_argument("--no-text-layer", action="store_true", help="禁用文本层快速路径，始终使用图像识别")
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入页面结果缓存")
+    parser.add_argument("--no-triage", action="store_true", help="不做页面分诊，所有页面都送入模型")
+    parser.add_argument("--stitch", choices=["multi_image", "merge", "off"], default=REPORT_STITCH_MODE, help="多页报告的拼接方式")
+    parser.add_argument("--render-workers", type=int, default=0, help="使用N个进程的渲染池并行渲染页面，0为在当前进程中渲染")
+    args = parser.parse_args(argv)
+    
+    if args.render_workers > 0:
+        import pdf_render_pool
+        pdf_render_pool.RENDER_POOL_ENABLED = True
+        pdf_render_pool.RENDER_POOL_WORKERS = args.render_workers
+    
+    extractor = PDFExtractor(use_cache=RESULT_CACHE_ENABLED and not args.no_cache)
+    report = extractor.extract_report(
+        args.pdf_path,
+        max_concurrency=args.concurrency,
+        use_text_layer=False if args.no_text_layer else None,
+        stitch_mode=args.stitch,
+        use_triage=False if args.no_triage else None
+    )
+    close_http_client()
+    shutdown_render_pool()
+    
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output, flush=True)
+    return 0 if report["raw"] is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
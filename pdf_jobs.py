@@ -0,0 +1,154 @@
+"""后台任务队列：固定数量的工作线程执行PDF提取和符合性分析任务
+
+提交任务后立即返回任务对象（含任务ID），界面通过轮询任务的进度消息和中间结果流式展示进度，
+不必为整个分析过程占用一个界面工作线程。队列长度有上限，队满时拒绝新任务。
+"""
+import queue
+import threading
+import time
+import uuid
+
+from pdf_metrics import STAGE_DURATION, get_logger, span
+
+logger = get_logger("jobs")
+
+# 任务队列配置
+JOB_WORKERS = 4  # 同时执行的任务数，应与模型服务的承载能力匹配
+JOB_MAX_PENDING = 32  # 排队等待的任务上限，超出时拒绝提交
+JOB_RESULT_TTL = 3600  # 已结束任务的保留时间（秒）
+
+
+class JobQueueFullError(Exception):
+    """任务队列已满"""
+
+
+class Job:
+    """单个后台任务的状态、进度消息和结果"""
+
+    def __init__(self, kind, func, args, kwargs):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = "queued"
+        self.messages = []
+        self.partial = None
+        self.partial_version = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def report(self, message):
+        """追加一条进度消息，供任务函数调用"""
+        with self._lock:
+            self.messages.append(message)
+
+    def progress_since(self, seen):
+        """返回第seen条之后的新进度消息，以及任务是否已结束"""
+        with self._lock:
+            return self.messages[seen:], self._done.is_set()
+
+    def set_partial(self, value):
+        """更新任务的中间结果（如流式生成中的结论），供任务函数调用"""
+        with self._lock:
+            self.partial = value
+            self.partial_version += 1
+
+    def partial_since(self, version):
+        """返回最新的中间结果及其版本号；版本号与version相同表示没有新内容"""
+        with self._lock:
+            return self.partial, self.partial_version
+
+    def wait(self, timeout=None):
+        """阻塞等待任务结束，返回是否已结束"""
+        return self._done.wait(timeout)
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+        self._done.set()
+
+
+class JobQueue:
+    """有界任务队列和固定数量的工作线程"""
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, result_ttl=JOB_RESULT_TTL):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._threads = []
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+            logger.info(f"[任务] 任务队列已启动，工作线程数: {self.workers}")
+
+    def submit(self, kind, func, *args, **kwargs):
+        """提交任务并立即返回Job；func以job为第一个参数，可通过job.report()汇报进度
+
+        队列已满时抛出JobQueueFullError。
+        """
+        self._start()
+        self._prune()
+        job = Job(kind, func, args, kwargs)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise JobQueueFullError(f"任务队列已满（{self._queue.maxsize}个任务排队中）")
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+        logger.debug(f"[任务] 已提交任务 {job.id}（{kind}），当前排队 {self._queue.qsize()} 个")
+        return job
+
+    def get(self, job_id):
+        """按任务ID查找任务，不存在或已过期时返回None"""
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def pending_count(self):
+        """返回排队等待中的任务数"""
+        return self._queue.qsize()
+
+    def _prune(self):
+        """清理超过保留时间的已结束任务"""
+        deadline = time.time() - self.result_ttl
+        with self._jobs_lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < deadline]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _worker_loop(self):
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            STAGE_DURATION.observe(job.started_at - job.created_at, stage="job_queue_wait")
+            logger.info(f"[任务] 开始执行任务 {job.id}（{job.kind}），排队 {job.started_at - job.created_at:.1f} 秒")
+            try:
+                with span(f"job_{job.kind}"):
+                    result = job.func(job, *job.args, **job.kwargs)
+                job._finish("done", result=result)
+            except Exception as e:
+                logger.warning(f"[任务] 任务 {job.id} 执行失败: {str(e)}")
+                job._finish("failed", error=str(e))
+            finally:
+                self._queue.task_done()
+            logger.info(f"[任务] 任务 {job.id} 结束，状态: {job.status}，耗时 {job.finished_at - job.started_at:.1f} 秒")
@@ -0,0 +1,289 @@
+"""分级日志、阶段耗时追踪和Prometheus格式的指标导出
+
+- get_logger(name): 各模块统一使用的logger，级别由LOG_LEVEL（或环境变量PDF_LOG_LEVEL）控制，
+  生产环境设为WARNING即可关闭逐页进度日志。
+- span(stage, **labels) / traced(stage): 记录一个处理阶段的耗时，计入按阶段划分的直方图；
+  同一线程（或协程）内嵌套的阶段在DEBUG日志中显示为"父阶段 > 子阶段"。
+- render_prometheus() / write_metrics_file(path) / start_metrics_server(port): 以Prometheus文本格式导出
+  阶段耗时直方图、阶段失败次数以及pdf_retry中的重试计数和熔断器状态。
+
+本模块只依赖标准库，导入开销可忽略。
+"""
+import contextvars
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+# 日志配置
+LOG_LEVEL = os.environ.get("PDF_LOG_LEVEL", "INFO")  # DEBUG / INFO / WARNING / ERROR
+LOG_FORMAT = "%(message)s"  # 消息本身已带"[模块]"前缀
+
+# 指标配置
+METRICS_ENABLED = True
+METRICS_PORT = None  # 设为端口号时在 http://127.0.0.1:<port>/metrics 提供Prometheus格式指标
+METRICS_FILE = None  # 设为路径时进程退出前把指标写入该文件（可配合node_exporter的textfile采集）
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)  # 耗时直方图分桶（秒）
+
+_logging_configured = False
+
+
+def configure_logging(level=None):
+    """配置pdf日志的输出和级别，可重复调用以调整级别"""
+    global _logging_configured
+    root = logging.getLogger("pdf")
+    if not _logging_configured:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.propagate = False
+        _logging_configured = True
+    level = level or LOG_LEVEL
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return root
+
+
+def get_logger(name):
+    """获取模块logger（挂在"pdf"下，共享级别和输出）"""
+    if not _logging_configured:
+        configure_logging()
+    return logging.getLogger(f"pdf.{name}")
+
+
+logger = get_logger("metrics")
+
+
+class Histogram:
+    """按标签分组的累计直方图"""
+
+    def __init__(self, name, help_text, buckets=METRICS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """注册回调 callback(value, labels)，每次observe时调用（基准测试用它收集原始样本计算精确分位数）"""
+        self._listeners.append(callback)
+
+    def observe(self, value, **labels):
+        for callback in self._listeners:
+            callback(value, labels)
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self, reset=False):
+        """返回各标签组合的分桶计数；reset为True时同时清零（用于子进程把增量交给父进程）"""
+        with self._lock:
+            snapshot = {key: {"counts": list(series["counts"]), "sum": series["sum"], "count": series["count"]}
+                        for key, series in self._series.items()}
+            if reset:
+                self._series.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        """合并另一个进程的snapshot"""
+        with self._lock:
+            for key, other in snapshot.items():
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+                series["counts"] = [a + b for a, b in zip(series["counts"], other["counts"])]
+                series["sum"] += other["sum"]
+                series["count"] += other["count"]
+
+
+class CounterVec:
+    """按标签分组的计数器"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            snapshot = dict(self._values)
+            if reset:
+                self._values.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        with self._lock:
+            for key, value in snapshot.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+STAGE_DURATION = Histogram("pdf_stage_duration_seconds", "各处理阶段耗时（秒）")
+STAGE_ERRORS = CounterVec("pdf_stage_errors_total", "各处理阶段抛出异常的次数")
+
+_CO_COROUTINE = 0x80  # 即inspect.CO_COROUTINE，inspect导入约需7ms，这里直接判断代码标志
+_current_span = contextvars.ContextVar("pdf_current_span", default=None)
+
+
+class span:
+    """记录一个阶段耗时的上下文管理器：with span("render", kind="image"): ..."""
+
+    def __init__(self, stage, **labels):
+        self.stage = stage
+        self.labels = labels
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.path = f"{parent} > {self.stage}" if parent else self.stage
+        self._token = _current_span.set(self.path)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if METRICS_ENABLED:
+            STAGE_DURATION.observe(self.elapsed, stage=self.stage, **self.labels)
+            if exc_type is not None:
+                STAGE_ERRORS.inc(stage=self.stage, **self.labels)
+        if logger.isEnabledFor(logging.DEBUG):
+            status = "失败" if exc_type is not None else "完成"
+            logger.debug(f"[耗时] {self.path} {status}，{self.elapsed * 1000:.1f}ms")
+        return False
+
+
+def traced(stage, **labels):
+    """把整个函数（同步或异步）作为一个阶段计时的装饰器"""
+    def decorator(func):
+        if func.__code__.co_flags & _CO_COROUTINE:
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def collect_metrics(reset=True):
+    """导出本进程的阶段指标和重试计数（默认同时清零），供进程池worker随结果返回"""
+    from pdf_retry import get_retry_stats
+
+    return {
+        "durations": STAGE_DURATION.snapshot(reset),
+        "errors": STAGE_ERRORS.snapshot(reset),
+        "retries": get_retry_stats(reset)["counters"],
+    }
+
+
+def merge_metrics(metrics):
+    """合并collect_metrics的结果"""
+    from pdf_retry import merge_retry_counters
+
+    STAGE_DURATION.merge(metrics["durations"])
+    STAGE_ERRORS.merge(metrics["errors"])
+    merge_retry_counters(metrics["retries"])
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + list(extra or ())
+    if not items:
+        return ""
+    escaped = (f'{name}="{_escape_label(value)}"' for name, value in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _render_histogram(histogram, lines):
+    lines.append(f"# HELP {histogram.name} {histogram.help_text}")
+    lines.append(f"# TYPE {histogram.name} histogram")
+    for key, series in sorted(histogram.snapshot().items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), series["counts"]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{histogram.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+        lines.append(f"{histogram.name}_sum{_format_labels(key)} {series['sum']:.6f}")
+        lines.append(f"{histogram.name}_count{_format_labels(key)} {series['count']}")
+
+
+def render_prometheus():
+    """以Prometheus文本格式返回当前的全部指标"""
+    from pdf_retry import get_retry_stats
+
+    lines = []
+    _render_histogram(STAGE_DURATION, lines)
+    lines.append(f"# HELP {STAGE_ERRORS.name} {STAGE_ERRORS.help_text}")
+    lines.append(f"# TYPE {STAGE_ERRORS.name} counter")
+    for key, value in sorted(STAGE_ERRORS.snapshot().items()):
+        lines.append(f"{STAGE_ERRORS.name}{_format_labels(key)} {value}")
+
+    retry_stats = get_retry_stats()
+    lines.append("# HELP pdf_retry_events_total 模型调用重试事件计数")
+    lines.append("# TYPE pdf_retry_events_total counter")
+    for event, value in sorted(retry_stats["counters"].items()):
+        lines.append(f'pdf_retry_events_total{{event="{event}"}} {value}')
+    lines.append("# HELP pdf_circuit_breaker_state 熔断器状态（0=closed，1=half_open，2=open）")
+    lines.append("# TYPE pdf_circuit_breaker_state gauge")
+    state_values = {"closed": 0, "half_open": 1, "open": 2}
+    for endpoint, breaker in sorted(retry_stats["breakers"].items()):
+        lines.append(f'pdf_circuit_breaker_state{{endpoint="{endpoint}"}} {state_values[breaker["state"]]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path=None):
+    """把指标原子地写入文件，返回写入的路径"""
+    path = path or METRICS_FILE
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    """在后台线程中启动 /metrics 端点，返回HTTP服务器对象"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port or METRICS_PORT), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"[指标] 指标端点已启动: http://{host}:{server.server_port}/metrics")
+    return server
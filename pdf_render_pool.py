@@ -0,0 +1,182 @@
+"""多进程页面渲染池：在独立进程中并行栅格化和编码页面图像
+
+页面渲染（get_pixmap）和PNG/JPEG编码是CPU密集型操作，在请求线程中执行时与GIL和其他会话争用，
+单个进程的渲染吞吐量不随核数增长。启用渲染池后，待渲染的页面按页码区间分成若干任务交给进程池：
+- 每个worker进程对同一份文档只打开一次（按路径和修改时间缓存最近使用的RENDER_POOL_MAX_OPEN_DOCS份文档）；
+- 编码后的Base64载荷写入临时目录（Linux上默认位于/dev/shm，即共享内存），只通过pickle传回文件路径和渲染统计，
+  主进程按页序读取后立即删除文件；
+- 在途任务数以worker数的两倍为上限，调用方提前停止迭代时取消尚未开始的任务并清理临时目录。
+
+worker使用提交任务时pdf_extraction中的渲染配置（RENDER_*），各阶段耗时随任务结果交回主进程汇总。
+渲染池创建时即启动全部worker并预先导入PyMuPDF，应用启动时创建可避免在多个会话线程运行时才创建子进程；
+在进程池worker中（如pdf_batch的提取进程）不再嵌套创建渲染池。
+"""
+import os
+import threading
+from collections import OrderedDict, deque
+
+from pdf_metrics import collect_metrics, get_logger, merge_metrics
+
+logger = get_logger("render_pool")
+
+# 渲染池配置
+RENDER_POOL_ENABLED = False  # 启用多进程渲染池（扫描件多、并发会话多时使用；单核机器上在请求线程中渲染更快）
+RENDER_POOL_WORKERS = None  # 渲染进程数，None为CPU核数
+RENDER_POOL_CHUNK_PAGES = 4  # 每个渲染任务最多包含的页数，页数少时按worker数均分
+RENDER_POOL_MIN_PAGES = 2  # 待渲染页数少于该值时在当前线程中渲染
+RENDER_POOL_MAX_OPEN_DOCS = 4  # 每个worker缓存的已打开文档数
+RENDER_POOL_SPOOL_DIR = None  # 渲染结果的临时目录，None时优先使用/dev/shm，否则使用系统临时目录
+
+# 随任务传给worker的渲染配置（pdf_extraction中的同名变量）
+RENDER_SETTING_NAMES = (
+    "RENDER_ZOOM", "RENDER_MAX_PIXELS", "RENDER_FORMAT", "RENDER_QUALITY",
+    "RENDER_GRAYSCALE_SCANNED", "RENDER_CROP_TO_CONTENT", "RENDER_CROP_MARGIN", "FITZ_STORE_SHRINK_INTERVAL",
+)
+
+_worker_extractor = None
+_worker_docs = OrderedDict()
+_worker_rendered_pages = 0
+
+
+def _open_worker_document(pdf_path):
+    """worker内：返回已打开的文档，文件修改后重新打开，超出缓存数时关闭最久未用的文档"""
+    import fitz  # PyMuPDF
+
+    key = (pdf_path, os.path.getmtime(pdf_path))
+    doc = _worker_docs.pop(key, None)
+    if doc is None:
+        doc = fitz.open(pdf_path)
+    _worker_docs[key] = doc
+    while len(_worker_docs) > RENDER_POOL_MAX_OPEN_DOCS:
+        _, oldest = _worker_docs.popitem(last=False)
+        oldest.close()
+    return doc
+
+
+def _render_chunk(pdf_path, page_numbers, spool_dir, settings):
+    """进程池任务：渲染一组页面并把Base64载荷写入spool_dir，返回 ([(页码, 文件路径, mime_type, stats)], 阶段指标)"""
+    global _worker_extractor, _worker_rendered_pages
+    import pdf_extraction
+
+    for name, value in settings.items():
+        setattr(pdf_extraction, name, value)
+    if _worker_extractor is None:
+        _worker_extractor = pdf_extraction.PDFExtractor(use_cache=False)
+
+    doc = _open_worker_document(pdf_path)
+    rendered = []
+    for page_num in page_numbers:
+        base64_image, mime_type, stats = _worker_extractor.render_page_image(doc.load_page(page_num))
+        path = os.path.join(spool_dir, f"page_{page_num}.b64")
+        with open(path, "w", encoding="ascii") as f:
+            f.write(base64_image)
+        rendered.append((page_num, path, mime_type, stats))
+        _worker_rendered_pages += 1
+        pdf_extraction.release_fitz_store(_worker_rendered_pages)
+    return rendered, collect_metrics()
+
+
+def _warm_up_worker():
+    """进程池任务：预先导入PyMuPDF和pdf_extraction，首个渲染任务不再承担导入耗时"""
+    import importlib
+
+    for name in ("fitz", "pdf_extraction"):
+        importlib.import_module(name)
+
+
+def _default_spool_dir():
+    if RENDER_POOL_SPOOL_DIR:
+        return RENDER_POOL_SPOOL_DIR
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return None
+
+
+def _render_settings():
+    import pdf_extraction
+
+    return {name: getattr(pdf_extraction, name) for name in RENDER_SETTING_NAMES}
+
+
+class RenderPool:
+    """渲染进程池，iter_pages按页序产出渲染结果"""
+
+    def __init__(self, workers=None):
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        # 提交与worker数相同的预热任务，一次性启动全部worker
+        for future in [self._executor.submit(_warm_up_worker) for _ in range(self.workers)]:
+            future.result()
+        logger.info(f"[渲染池] 已启动 {self.workers} 个渲染进程")
+
+    def iter_pages(self, pdf_path, page_numbers, chunk_pages=None):
+        """渲染page_numbers中的页面（从0开始），按给定顺序产出 (页码, (base64_image, mime_type, stats))"""
+        import shutil
+        import tempfile
+
+        page_numbers = list(page_numbers)
+        if chunk_pages is None:
+            # 页数少时按worker数均分，保证每个worker都有任务
+            chunk_pages = max(1, min(RENDER_POOL_CHUNK_PAGES, -(-len(page_numbers) // self.workers)))
+        chunks = [page_numbers[i:i + chunk_pages] for i in range(0, len(page_numbers), chunk_pages)]
+        pdf_path = os.path.abspath(pdf_path)
+        settings = _render_settings()
+        spool_dir = tempfile.mkdtemp(prefix="pdf_render_", dir=_default_spool_dir())
+        pending = deque()
+        submitted = 0
+        try:
+            while pending or submitted < len(chunks):
+                # 在途任务不超过worker数的两倍，渲染结果不会在临时目录中无限堆积
+                while submitted < len(chunks) and len(pending) < self.workers * 2:
+                    pending.append(self._executor.submit(_render_chunk, pdf_path, chunks[submitted], spool_dir, settings))
+                    submitted += 1
+                rendered, metrics = pending.popleft().result()
+                merge_metrics(metrics)
+                for page_num, path, mime_type, stats in rendered:
+                    with open(path, encoding="ascii") as f:
+                        base64_image = f.read()
+                    os.remove(path)
+                    yield page_num, (base64_image, mime_type, stats)
+        finally:
+            for future in pending:
+                # 已在运行的任务结束后再清理一次它写入的文件
+                if not future.cancel():
+                    future.add_done_callback(lambda _: shutil.rmtree(spool_dir, ignore_errors=True))
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool(page_count=None):
+    """返回共享的渲染池（首次使用时启动）；未启用、待渲染页数不足RENDER_POOL_MIN_PAGES或当前已是子进程时返回None"""
+    global _render_pool
+    if not RENDER_POOL_ENABLED:
+        return None
+    if page_count is not None and page_count < RENDER_POOL_MIN_PAGES:
+        return None
+    import multiprocessing
+
+    # fork出的子进程会继承父进程的渲染池对象，但不能使用它
+    if multiprocessing.parent_process() is not None:
+        return None
+    if _render_pool is None:
+        with _render_pool_lock:
+            if _render_pool is None:
+                _render_pool = RenderPool(RENDER_POOL_WORKERS)
+    return _render_pool
+
+
+def shutdown_render_pool():
+    """关闭共享的渲染池"""
+    global _render_pool
+    with _render_pool_lock:
+        pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown()
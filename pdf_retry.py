@@ -0,0 +1,334 @@
+"""模型调用的重试策略和熔断器：按错误类型决定是否重试、带抖动的指数退避、遵循Retry-After、按端点熔断
+
+同步的retry_api_call和异步的async_retry_api_call共用同一套策略和计数器。异步版本用asyncio.sleep等待，
+不占用线程；同步版本只能在调用线程中等待，因此每次调用的总等待时间以RETRY_MAX_ELAPSED为上限，
+不可重试的错误和熔断中的端点立即失败，不再占着线程空等。只有超时、连接错误、429和5xx等已知的暂时性错误会重试，
+模型服务返回的错误内容（ApiResponseError）和其他未知异常直接失败，也不计入熔断。
+
+熔断器按端点（模型服务地址）维护：连续BREAKER_FAILURE_THRESHOLD次可重试错误（超时、连接失败、429、5xx）后打开，
+打开期间所有请求直接抛出CircuitOpenError；BREAKER_RESET_TIMEOUT秒后放行少量探测请求（半开），成功则关闭，失败则重新打开。
+探测请求被取消时归还名额；探测请求超过BREAKER_RESET_TIMEOUT秒仍无结果时视为丢失，放行新的探测请求。
+
+本模块只依赖标准库，可被pdf_extraction直接导入而不影响其导入耗时。
+"""
+import random
+import threading
+import time
+from collections import Counter
+
+from pdf_metrics import get_logger
+
+logger = get_logger("retry")
+
+# 重试配置
+MAX_RETRIES = 3  # 最大尝试次数（含首次）
+RETRY_DELAY = 2  # 秒，首次重试的退避基数
+BACKOFF_FACTOR = 2  # 指数退避因子
+RETRY_MAX_DELAY = 20  # 单次等待上限（秒），也是Retry-After的上限
+RETRY_MAX_ELAPSED = 30  # 一次调用在重试上累计等待的上限（秒），超出时放弃而不是继续等待
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})  # 可重试的HTTP状态码，其余4xx直接失败
+TRANSIENT_ERROR_TYPES = frozenset({
+    "httpx.TransportError", "openai.APIConnectionError", "aiohttp.ClientConnectionError",
+})  # 不继承OSError的第三方传输错误（"顶层包名.类名"，按类继承链匹配，本模块不导入这些库）
+
+# 熔断配置
+BREAKER_ENABLED = True
+BREAKER_FAILURE_THRESHOLD = 5  # 连续可重试错误达到该次数后熔断
+BREAKER_RESET_TIMEOUT = 30  # 熔断后经过该时间（秒）进入半开状态
+BREAKER_HALF_OPEN_MAX_CALLS = 1  # 半开状态下同时放行的探测请求数
+
+
+class ApiResponseError(ValueError):
+    """模型服务返回了错误内容或无法识别的响应；属于确定性错误，不重试也不计入熔断"""
+
+
+class CircuitOpenError(Exception):
+    """端点处于熔断状态时直接抛出，不发送请求也不重试"""
+
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"API调用失败: 模型服务 {endpoint} 熔断中，约 {retry_in:.0f} 秒后恢复探测")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+class CircuitBreaker:
+    """单个端点的熔断器，状态为 closed / open / half_open"""
+
+    def __init__(self, endpoint, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT,
+                 half_open_max_calls=BREAKER_HALF_OPEN_MAX_CALLS):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self._half_open_calls = 0
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """请求前检查：熔断中抛出CircuitOpenError，半开时只放行有限的探测请求"""
+        with self._lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    _count("breaker_rejections")
+                    raise CircuitOpenError(self.endpoint, remaining)
+                self.state = "half_open"
+                self._half_open_calls = 0
+                logger.info(f"[熔断] {self.endpoint} 进入半开状态，放行探测请求")
+            if self.state == "half_open":
+                if self._half_open_calls >= self.half_open_max_calls:
+                    if time.monotonic() - self._probe_started_at < self.reset_timeout:
+                        _count("breaker_rejections")
+                        raise CircuitOpenError(self.endpoint, 0)
+                    logger.warning(f"[熔断] {self.endpoint} 探测请求超过 {self.reset_timeout} 秒没有结果，放行新的探测请求")
+                    self._half_open_calls = 0
+                self._half_open_calls += 1
+                self._probe_started_at = time.monotonic()
+
+    def record_success(self):
+        """请求完成（包括不可重试的客户端错误，说明服务本身可用）"""
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"[熔断] {self.endpoint} 探测成功，恢复正常")
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        """请求因过载、超时或连接错误失败"""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.open_count += 1
+                    _count("breaker_opens")
+                    logger.warning(f"[熔断] {self.endpoint} 连续失败 {self.consecutive_failures} 次，熔断 {self.reset_timeout} 秒")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._half_open_calls = 0
+
+    def record_error(self, exc):
+        """请求抛出异常：过载、超时和连接错误计为失败
+
+        其他错误（如400参数错误、响应解析失败）说明服务本身可以响应，有意按成功处理，半开状态下的探测请求因此也会关闭熔断。
+        """
+        if isinstance(exc, CircuitOpenError):
+            return
+        if is_overload_error(exc):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def release(self):
+        """请求没有结果就结束（被取消或中断）时归还半开状态的探测名额，不改变熔断状态"""
+        with self._lock:
+            if self.state == "half_open" and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "open_count": self.open_count,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint):
+    """获取端点的熔断器，首次使用时创建"""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+    return breaker
+
+
+def _response_of(exc):
+    response = getattr(exc, "response", None)
+    return response if getattr(response, "status_code", None) is not None else None
+
+
+def _status_code(exc):
+    status_code = getattr(exc, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code
+    response = _response_of(exc)
+    return response.status_code if response is not None else None
+
+
+def _is_transient_transport_error(exc):
+    for cls in type(exc).__mro__:
+        if f"{cls.__module__.split('.')[0]}.{cls.__name__}" in TRANSIENT_ERROR_TYPES:
+            return True
+    return False
+
+
+def is_retryable_error(exc):
+    """判断错误是否值得重试：超时、连接错误、429和5xx重试；其余4xx、模型返回的错误内容、JSON解析和其他未知错误直接失败"""
+    if isinstance(exc, CircuitOpenError):
+        return False
+    status_code = _status_code(exc)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # requests的JSONDecodeError同时继承ValueError和OSError，先按解析错误处理
+    if isinstance(exc, (ValueError, TypeError, KeyError, AttributeError)):
+        return False
+    # 只有已知的传输错误和超时按暂时性错误重试：requests的超时和连接错误都是OSError，httpx/openai/aiohttp的传输错误按类型名识别
+    return isinstance(exc, (OSError, TimeoutError)) or _is_transient_transport_error(exc)
+
+
+def is_overload_error(exc):
+    """判断错误是否说明服务端过载或不可达，计入熔断器"""
+    return not isinstance(exc, CircuitOpenError) and is_retryable_error(exc)
+
+
+def get_retry_after(exc):
+    """读取429/503响应中的Retry-After头（秒数或HTTP日期），没有时返回None"""
+    response = _response_of(exc)
+    headers = getattr(response, "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def compute_retry_delay(attempt, exc, delay=RETRY_DELAY, backoff_factor=BACKOFF_FACTOR, max_delay=RETRY_MAX_DELAY):
+    """第attempt次失败后的等待时间：全抖动的指数退避，服务端给出Retry-After时不早于该时间"""
+    backoff = min(max_delay, delay * (backoff_factor ** attempt))
+    wait = random.uniform(0, backoff)
+    retry_after = get_retry_after(exc)
+    if retry_after is not None:
+        wait = max(wait, min(retry_after, max_delay))
+    return wait
+
+
+def _plan_retry(label, attempt, max_retries, exc, waited, delay, backoff_factor):
+    """记录一次失败并决定下一步：返回等待秒数，或返回None表示放弃"""
+    logger.warning(f"[重试] {label}失败 (尝试 {attempt + 1}/{max_retries}): {str(exc)}")
+    if not is_retryable_error(exc):
+        _count("non_retryable")
+        logger.warning(f"[重试] 错误不可重试（{type(exc).__name__}），放弃{label}")
+        return None
+    if attempt >= max_retries - 1:
+        _count("exhausted")
+        logger.warning(f"[重试] 所有重试都失败，放弃{label}")
+        return None
+    wait = compute_retry_delay(attempt, exc, delay, backoff_factor)
+    if waited + wait > RETRY_MAX_ELAPSED:
+        _count("exhausted")
+        logger.warning(f"[重试] 累计等待将超过 {RETRY_MAX_ELAPSED} 秒，放弃{label}")
+        return None
+    _count("retries")
+    logger.debug(f"[重试] 等待 {wait:.2f} 秒后重试...")
+    return wait
+
+
+def retry_api_call(max_retries=MAX_RETRIES, delay=RETRY_DELAY, backoff_factor=BACKOFF_FACTOR):
+    """API重试装饰器"""
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            waited = 0.0
+            for attempt in range(max_retries):
+                _count("attempts")
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    wait = _plan_retry("API调用", attempt, max_retries, e, waited, delay, backoff_factor)
+                    if wait is None:
+                        _count("failures")
+                        raise
+                    time.sleep(wait)
+                    waited += wait
+                    continue
+                _count("successes")
+                if attempt > 0:
+                    logger.debug(f"[重试] API调用在第 {attempt + 1} 次尝试后成功")
+                return result
+        return wrapper
+    return decorator
+
+
+def async_retry_api_call(max_retries=MAX_RETRIES, delay=RETRY_DELAY, backoff_factor=BACKOFF_FACTOR, endpoint=None):
+    """异步API重试装饰器，提供endpoint时每次尝试都经过该端点的熔断器"""
+    def decorator(func):
+        async def wrapper(*args, **kwargs):
+            import asyncio
+
+            breaker = get_circuit_breaker(endpoint) if BREAKER_ENABLED and endpoint else None
+            waited = 0.0
+            for attempt in range(max_retries):
+                _count("attempts")
+                try:
+                    if breaker is not None:
+                        breaker.before_call()
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    if breaker is not None:
+                        breaker.record_error(e)
+                    wait = _plan_retry("异步API调用", attempt, max_retries, e, waited, delay, backoff_factor)
+                    if wait is None:
+                        _count("failures")
+                        raise
+                    await asyncio.sleep(wait)
+                    waited += wait
+                    continue
+                except BaseException:
+                    # 被取消时归还探测名额，否则半开状态的熔断器会拒绝后续所有请求
+                    if breaker is not None:
+                        breaker.release()
+                    raise
+                if breaker is not None:
+                    breaker.record_success()
+                _count("successes")
+                if attempt > 0:
+                    logger.debug(f"[重试] 异步API调用在第 {attempt + 1} 次尝试后成功")
+                return result
+        return wrapper
+    return decorator
+
+
+def get_retry_stats(reset=False):
+    """返回重试计数（attempts/successes/retries/failures/non_retryable/exhausted/breaker_opens/breaker_rejections）和各端点熔断器状态
+
+    reset为True时同时清零计数（用于子进程把增量交给父进程，见merge_retry_counters）。
+    """
+    with _stats_lock:
+        counters = dict(_stats)
+        if reset:
+            _stats.clear()
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {"counters": counters, "breakers": {breaker.endpoint: breaker.snapshot() for breaker in breakers}}
+
+
+def merge_retry_counters(counters):
+    """把其他进程的重试计数累加到本进程"""
+    with _stats_lock:
+        _stats.update(counters)
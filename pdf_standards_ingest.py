@@ -0,0 +1,334 @@
+"""国家标准文档增量入库：将标准PDF解析、分块后写入符合性分析使用的LightRAG索引
+
+标准PDF通过文本层提取正文和表格（没有文本层的扫描页用视觉模型转录），按条款和表格切分为
+不超过STANDARD_CHUNK_CHARS的文本块，每块以内容哈希作为LightRAG文档ID，分批并发调用ainsert。
+入库清单记录每份标准的文件哈希、正文哈希和文本块ID：文件未变化的标准直接跳过，内容变化的标准
+只嵌入新增或修改的文本块，新块全部处理成功后再删除已失效的旧块。
+每次修改索引后写入新的索引版本戳（见pdf_analysis_app.get_rag_index_version），符合性分析缓存随之失效。
+
+命令行用法：
+    python pdf_standards_ingest.py standards/ [--batch-size N] [--concurrency N] [--force] [--prune] [--dry-run]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_extraction import WORKING_DIR, VISION_CONCURRENCY, close_http_client, hash_file
+from pdf_metrics import get_logger
+
+logger = get_logger("ingest")
+
+# 入库配置
+STANDARDS_MANIFEST_PATH = os.path.join(WORKING_DIR, "standards_manifest.json")  # 入库清单
+STANDARD_CHUNK_CHARS = 1000  # 文本块字符数上限，应小于LightRAG的chunk_token_size，避免再次切分
+INGEST_BATCH_SIZE = 8  # 每次ainsert提交的文本块数
+INGEST_CONCURRENCY = 2  # 同时进行的ainsert批次数
+EXTRACT_CONCURRENCY = 4  # 同时解析的标准PDF数
+
+# 扫描页转录提示词
+STANDARD_OCR_QUESTION = "请逐字转录这一页国家标准的全部内容，表格按行输出并用 | 分隔单元格，不要添加任何说明。"
+
+CLAUSE_PATTERN = re.compile(r"^\s*(?:\d+(?:\.\d+)*\s+\S|表\s*\d+|附\s*录\s*[A-Z]|【表格\d+】)")
+STANDARD_NUMBER_PATTERN = re.compile(r"GB(?:/T)?\s*\d+(?:\.\d+)?\s*[-—–]\s*\d{4}")
+CHINESE_TITLE_PATTERN = re.compile(r"[\u4e00-\u9fff\s、（）()]+")
+
+
+def load_manifest(path=STANDARDS_MANIFEST_PATH):
+    """读取入库清单：{标准PDF路径: {file_hash, content_hash, title, chunk_ids, ingested_at}}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=STANDARDS_MANIFEST_PATH):
+    """原子地写回入库清单，中途退出不会留下损坏的文件"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+
+def extract_standard_text(extractor, pdf_path):
+    """提取标准PDF的逐页文本：优先文本层和表格，没有文本的扫描页用视觉模型转录，返回页文本列表"""
+    import fitz  # PyMuPDF
+
+    page_texts = []
+    scanned_pages = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            text = extractor.extract_page_text(page) or page.get_text("text").strip()
+            page_texts.append(text)
+            if not text and page.get_images():
+                scanned_pages.append((page.number, extractor.render_page_image(page)))
+
+    if scanned_pages:
+        logger.info(f"[入库] {os.path.basename(pdf_path)}: {len(scanned_pages)} 页没有文本层，使用视觉模型转录")
+        with ThreadPoolExecutor(max_workers=VISION_CONCURRENCY, thread_name_prefix="standard-ocr") as executor:
+            futures = {
+                page_num: executor.submit(extractor.call_vision_api_with_base64, base64_image, STANDARD_OCR_QUESTION, mime_type)
+                for page_num, (base64_image, mime_type, _) in scanned_pages
+            }
+            for page_num, future in futures.items():
+                try:
+                    page_texts[page_num] = future.result()["choices"][0]["message"]["content"].strip()
+                except Exception as ocr_error:
+                    logger.warning(f"[入库] {os.path.basename(pdf_path)} 第{page_num + 1}页: 转录失败: {str(ocr_error)}")
+    return page_texts
+
+
+def detect_standard_title(pdf_path, page_texts):
+    """从首页识别标准号和中文标准名（如"GB/T 700-2006 碳素结构钢"），识别不到时使用文件名"""
+    name = os.path.splitext(os.path.basename(pdf_path))[0]
+    first_page = next((text for text in page_texts if text), "")
+    match = STANDARD_NUMBER_PATTERN.search(first_page)
+    if not match:
+        return name
+    number = re.sub(r"\s*[-—–]\s*", "-", match.group())
+    # 标准号之后第一行纯中文文字通常是标准名
+    for line in first_page[match.end():].splitlines():
+        line = line.strip()
+        if 2 <= len(line) <= 40 and CHINESE_TITLE_PATTERN.fullmatch(line):
+            return f"{number} {line}"
+    return f"{number} {name}"
+
+
+def chunk_standard_text(title, page_texts, max_chars=STANDARD_CHUNK_CHARS):
+    """按条款编号和表格切分标准正文，尽量把相邻的短条款合并到同一块，每块以标准名开头"""
+    header = f"【标准】{title}\n"
+    limit = max(100, max_chars - len(header))
+
+    sections = []
+    current = []
+    for text in page_texts:
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith("【页面文本】"):
+                continue
+            if CLAUSE_PATTERN.match(line) and current:
+                sections.append("\n".join(current))
+                current = []
+            current.append(line)
+    if current:
+        sections.append("\n".join(current))
+
+    chunks = []
+    buffer = ""
+    for section in sections:
+        # 超长条款按行切开
+        pieces = [section]
+        if len(section) > limit:
+            pieces = []
+            piece = ""
+            for line in section.split("\n"):
+                while len(line) > limit:
+                    if piece:
+                        pieces.append(piece)
+                        piece = ""
+                    pieces.append(line[:limit])
+                    line = line[limit:]
+                if piece and len(piece) + len(line) + 1 > limit:
+                    pieces.append(piece)
+                    piece = ""
+                piece = f"{piece}\n{line}" if piece else line
+            if piece:
+                pieces.append(piece)
+        for piece in pieces:
+            if buffer and len(buffer) + len(piece) + 1 > limit:
+                chunks.append(header + buffer)
+                buffer = ""
+            buffer = f"{buffer}\n{piece}" if buffer else piece
+    if buffer:
+        chunks.append(header + buffer)
+    return chunks
+
+
+def make_chunk_id(chunk):
+    """以文本块内容哈希作为LightRAG文档ID，内容不变的块在重建时不会重复嵌入"""
+    return "std-" + hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:32]
+
+
+def plan_document(extractor, pdf_path, entry, force=False):
+    """解析一份标准并与清单比对，返回入库计划；文件未变化时返回None
+
+    force时全部文本块都提交给LightRAG，索引中已处理的块会被LightRAG按ID跳过，只补齐缺失的块。
+    """
+    file_hash = hash_file(pdf_path)
+    if entry and entry.get("file_hash") == file_hash and not force:
+        return None
+
+    page_texts = extract_standard_text(extractor, pdf_path)
+    content_hash = hashlib.sha256("\n".join(page_texts).encode("utf-8")).hexdigest()
+    if entry and entry.get("content_hash") == content_hash and not force:
+        return {"path": pdf_path, "file_hash": file_hash, "content_hash": content_hash, "unchanged": True}
+
+    title = detect_standard_title(pdf_path, page_texts)
+    chunks = chunk_standard_text(title, page_texts)
+    chunk_ids = [make_chunk_id(chunk) for chunk in chunks]
+    old_ids = set(entry.get("chunk_ids", [])) if entry else set()
+    return {
+        "path": pdf_path,
+        "file_hash": file_hash,
+        "content_hash": content_hash,
+        "unchanged": False,
+        "title": title,
+        "chunks": dict(zip(chunk_ids, chunks)),
+        "new_ids": [chunk_id for chunk_id in dict.fromkeys(chunk_ids) if force or chunk_id not in old_ids],
+        "stale_ids": sorted(old_ids - set(chunk_ids)),
+    }
+
+
+async def ingest_standards(pdf_paths, batch_size=INGEST_BATCH_SIZE, concurrency=INGEST_CONCURRENCY,
+                           force=False, prune=False, dry_run=False, manifest_path=STANDARDS_MANIFEST_PATH):
+    """增量入库标准PDF，返回各类文档的计数"""
+    from pdf_analysis_app import analyzer, write_rag_index_stamp
+
+    manifest = load_manifest(manifest_path)
+    counts = {"unchanged": 0, "updated": 0, "failed": 0, "removed": 0, "chunks_inserted": 0, "chunks_deleted": 0}
+    pdf_paths = [os.path.abspath(path) for path in pdf_paths]
+
+    # 第一步：并行解析标准PDF并与清单比对
+    start = time.perf_counter()
+    extract_semaphore = asyncio.Semaphore(EXTRACT_CONCURRENCY)
+
+    async def plan(path):
+        async with extract_semaphore:
+            try:
+                return await asyncio.to_thread(plan_document, analyzer, path, manifest.get(path), force)
+            except Exception as e:
+                logger.warning(f"[入库] 解析失败 {path}: {str(e)}")
+                counts["failed"] += 1
+                return None
+
+    plans = [item for item in await asyncio.gather(*(plan(path) for path in pdf_paths)) if item is not None]
+    for item in plans:
+        if item["unchanged"]:
+            manifest[item["path"]]["file_hash"] = item["file_hash"]
+    changed = [item for item in plans if not item["unchanged"]]
+    counts["unchanged"] = len(pdf_paths) - len(changed) - counts["failed"]
+    new_total = sum(len(item["new_ids"]) for item in changed)
+    stale_total = sum(len(item["stale_ids"]) for item in changed)
+    logger.info(f"[入库] 共 {len(pdf_paths)} 份标准，未变化 {counts['unchanged']} 份，需更新 {len(changed)} 份，"
+                f"新增文本块 {new_total} 个，待删除旧文本块 {stale_total} 个，解析耗时 {time.perf_counter() - start:.1f} 秒")
+
+    removed = []
+    if prune:
+        current = set(pdf_paths)
+        removed = [path for path in manifest if path not in current and not os.path.exists(path)]
+        if removed:
+            logger.warning(f"[入库] {len(removed)} 份标准的源文件已不存在，将从索引中删除")
+
+    if dry_run:
+        for item in changed:
+            logger.info(f"[入库] 待更新: {item['title']}（新增 {len(item['new_ids'])} 块，删除 {len(item['stale_ids'])} 块）")
+        return counts
+
+    if not changed and not removed:
+        save_manifest(manifest, manifest_path)
+        return counts
+
+    rag = await analyzer.initialize_rag()
+    try:
+        # 第二步：所有新文本块分批并发插入
+        batches = []
+        for item in changed:
+            ids = item["new_ids"]
+            for offset in range(0, len(ids), batch_size):
+                batch_ids = ids[offset:offset + batch_size]
+                batches.append((batch_ids, [item["chunks"][chunk_id] for chunk_id in batch_ids], item["path"]))
+
+        insert_semaphore = asyncio.Semaphore(concurrency)
+        done = 0
+        insert_start = time.perf_counter()
+
+        async def insert(batch_ids, texts, path):
+            nonlocal done
+            async with insert_semaphore:
+                try:
+                    await rag.ainsert(texts, ids=batch_ids, file_paths=[path] * len(batch_ids))
+                except Exception as e:
+                    logger.warning(f"[入库] 批次插入失败（{os.path.basename(path)}）: {str(e)}")
+                done += 1
+                logger.debug(f"[入库] 已提交 {done}/{len(batches)} 批")
+
+        await asyncio.gather(*(insert(*batch) for batch in batches))
+        if batches:
+            logger.info(f"[入库] 文本块插入完成，耗时 {time.perf_counter() - insert_start:.1f} 秒")
+
+        # 第三步：新块全部处理成功的标准才删除旧块并更新清单，否则保留旧块，下次运行重试
+        all_new_ids = [chunk_id for item in changed for chunk_id in item["new_ids"]]
+        statuses = await rag.aget_docs_by_ids(all_new_ids) if all_new_ids else {}
+        processed = {chunk_id for chunk_id, status in statuses.items() if str(getattr(status.status, "value", status.status)) == "processed"}
+
+        for item in changed:
+            missing = [chunk_id for chunk_id in item["new_ids"] if chunk_id not in processed]
+            if missing:
+                logger.warning(f"[入库] {item['title']}: {len(missing)} 个文本块未处理成功，保留旧版本")
+                counts["failed"] += 1
+                continue
+            for chunk_id in item["stale_ids"]:
+                await rag.adelete_by_doc_id(chunk_id)
+            counts["updated"] += 1
+            counts["chunks_inserted"] += len(item["new_ids"])
+            counts["chunks_deleted"] += len(item["stale_ids"])
+            manifest[item["path"]] = {
+                "file_hash": item["file_hash"],
+                "content_hash": item["content_hash"],
+                "title": item["title"],
+                "chunk_ids": list(item["chunks"]),
+                "ingested_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            save_manifest(manifest, manifest_path)
+            logger.info(f"[入库] {item['title']}: 新增 {len(item['new_ids'])} 块，删除 {len(item['stale_ids'])} 块")
+
+        for path in removed:
+            for chunk_id in manifest[path].get("chunk_ids", []):
+                await rag.adelete_by_doc_id(chunk_id)
+                counts["chunks_deleted"] += 1
+            logger.info(f"[入库] 已删除: {manifest[path].get('title', path)}")
+            del manifest[path]
+            counts["removed"] += 1
+        save_manifest(manifest, manifest_path)
+    finally:
+        await analyzer.finalize_rag()
+        # 索引已被修改（包括部分失败的插入），更新版本戳使符合性分析缓存失效
+        write_rag_index_stamp()
+    return counts
+
+
+def main(argv=None):
+    """命令行入口"""
+    from pdf_batch import collect_pdf_paths
+
+    parser = argparse.ArgumentParser(description="增量构建标准符合性分析使用的国家标准索引")
+    parser.add_argument("source", help="标准PDF目录，或每行一个PDF路径的清单文件")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="每次ainsert提交的文本块数")
+    parser.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY, help="同时进行的ainsert批次数")
+    parser.add_argument("--force", action="store_true", help="忽略清单中的哈希，重新解析全部标准并补齐索引中缺失的文本块")
+    parser.add_argument("--prune", action="store_true", help="从索引中删除源文件已不存在的标准")
+    parser.add_argument("--dry-run", action="store_true", help="只解析和比对，不写入索引")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    counts = asyncio.run(ingest_standards(
+        collect_pdf_paths(args.source),
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        force=args.force,
+        prune=args.prune,
+        dry_run=args.dry_run
+    ))
+    close_http_client()
+    print(f"[入库] 完成：更新 {counts['updated']} 份，未变化 {counts['unchanged']} 份，删除 {counts['removed']} 份，失败 {counts['failed']} 份，"
+          f"插入文本块 {counts['chunks_inserted']} 个，删除文本块 {counts['chunks_deleted']} 个，耗时 {time.perf_counter() - start:.1f} 秒", flush=True)
+    return 0 if counts["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
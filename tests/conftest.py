@@ -0,0 +1,11 @@
+"""测试公共配置：把仓库根目录加入导入路径，并切换到临时目录运行
+
+pdf_analysis_app在导入时会在工作目录（WORKING_DIR="./"）下创建SQLite缓存，切换目录避免在仓库中留下文件。
+"""
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(tempfile.mkdtemp(prefix="pdf_tests_"))
@@ -0,0 +1,75 @@
+"""批处理的测试：结果文件按路径去重和单次流式结论的回退"""
+import asyncio
+import json
+
+import pytest
+
+import pdf_analysis_app
+import pdf_batch
+
+
+class FakeAnalyzer:
+    def __init__(self):
+        self.rag_queries = 0
+
+    async def retrieve_compliance_context(self, report_info, report_json=None):
+        return "标准内容"
+
+    async def analyze_report_compliance(self, report_info, report_json=None):
+        self.rag_queries += 1
+        return "原始分析结果"
+
+
+@pytest.fixture
+def single_pass(monkeypatch):
+    monkeypatch.setattr(pdf_analysis_app, "COMPLIANCE_SINGLE_PASS", True)
+    monkeypatch.setattr(pdf_analysis_app, "rule_based_compliance", lambda report_json: None)
+    monkeypatch.setattr(pdf_analysis_app, "format_compliance_result", lambda raw_result, report_json: f"结论：{raw_result}")
+    return monkeypatch
+
+
+def _record():
+    return {"path": "a.pdf", "status": "ok", "report": {"产品信息": {"材料名称": "Q345B"}}, "raw": None, "errors": []}
+
+
+def _failing_stream(context, report_info, report_json):
+    raise ConnectionError("connection reset")
+    yield
+
+
+@pytest.mark.parametrize("stream", [_failing_stream, lambda context, report_info, report_json: iter(())])
+def test_single_pass_falls_back_to_two_steps(single_pass, stream):
+    single_pass.setattr(pdf_analysis_app, "stream_compliance_conclusion", stream)
+    analyzer = FakeAnalyzer()
+    record = _record()
+    asyncio.run(pdf_batch._analyze_compliance(analyzer, record))
+    assert record["status"] == "ok"
+    assert record["compliance"] == "结论：原始分析结果"
+    assert analyzer.rag_queries == 1
+
+
+def test_single_pass_keeps_streamed_conclusion(single_pass):
+    single_pass.setattr(pdf_analysis_app, "stream_compliance_conclusion", lambda *args: iter(["结论", "结论完整"]))
+    analyzer = FakeAnalyzer()
+    record = _record()
+    asyncio.run(pdf_batch._analyze_compliance(analyzer, record))
+    assert record["compliance"] == "结论完整"
+    assert analyzer.rag_queries == 0
+
+
+def test_load_records_keeps_last_record_per_path(tmp_path):
+    output_path = tmp_path / "results.jsonl"
+    lines = [
+        json.dumps({"path": "a.pdf", "status": "failed"}),
+        json.dumps({"path": "b.pdf", "status": "ok", "file_hash": "b1"}),
+        json.dumps({"path": "a.pdf", "status": "ok", "file_hash": "a1"}),
+        '{"path": "c.pdf", "sta',
+    ]
+    output_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    records = pdf_batch.load_records(str(output_path))
+    assert list(records) == ["a.pdf", "b.pdf"]
+    assert records["a.pdf"]["status"] == "ok"
+
+    pdf_batch.rewrite_records(str(output_path), [records["b.pdf"]])
+    assert pdf_batch.load_records(str(output_path)) == {"b.pdf": records["b.pdf"]}
+    assert not (tmp_path / "results.jsonl.tmp").exists()
@@ -0,0 +1,173 @@
+"""熔断器的测试：状态转换、探测名额的归还和过期"""
+import asyncio
+import time
+
+import pytest
+
+from pdf_retry import (
+    ApiResponseError, CircuitBreaker, CircuitOpenError, async_retry_api_call, get_circuit_breaker,
+    is_overload_error, is_retryable_error, retry_api_call,
+)
+
+RESET_TIMEOUT = 0.05
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _open_breaker(threshold=2):
+    breaker = CircuitBreaker("http://model.test", failure_threshold=threshold, reset_timeout=RESET_TIMEOUT)
+    for _ in range(threshold):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    return breaker
+
+
+def _wait_for_half_open():
+    time.sleep(RESET_TIMEOUT * 1.5)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("http://model.test", failure_threshold=3, reset_timeout=RESET_TIMEOUT)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.open_count == 1
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_admits_one_probe_and_closes_on_success():
+    breaker = _open_breaker()
+    _wait_for_half_open()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.snapshot() == {"state": "closed", "consecutive_failures": 0, "open_count": 1}
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    breaker = _open_breaker()
+    _wait_for_half_open()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.open_count == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_release_returns_probe_slot():
+    breaker = _open_breaker()
+    _wait_for_half_open()
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+def test_stalled_probe_expires_after_reset_timeout():
+    breaker = _open_breaker()
+    _wait_for_half_open()
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(RESET_TIMEOUT * 1.5)
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+@pytest.mark.parametrize("error, state", [
+    (StatusError(503), "open"),
+    (ConnectionError("connection reset"), "open"),
+    (StatusError(400), "closed"),
+    (ValueError("invalid JSON"), "closed"),
+    (ApiResponseError("API返回错误: model not found"), "closed"),
+])
+def test_record_error_classifies_probe_result(error, state):
+    breaker = _open_breaker()
+    _wait_for_half_open()
+    breaker.before_call()
+    breaker.record_error(error)
+    assert breaker.state == state
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (TimeoutError("read timed out"), True),
+    (ConnectionResetError("connection reset"), True),
+    (StatusError(400), False),
+    (ApiResponseError("API响应格式错误"), False),
+    (Exception("unexpected"), False),
+    (KeyError("choices"), False),
+    (CircuitOpenError("http://model.test", 1), False),
+])
+def test_only_transient_errors_are_retryable(error, retryable):
+    assert is_retryable_error(error) is retryable
+    assert is_overload_error(error) is retryable
+
+
+def test_third_party_transport_errors_are_retryable():
+    httpx = pytest.importorskip("httpx")
+    assert is_retryable_error(httpx.ConnectTimeout("connect timeout"))
+    assert not is_retryable_error(httpx.InvalidURL("bad url"))
+
+
+def test_api_response_error_fails_without_retry_or_tripping_breaker():
+    breaker = CircuitBreaker("http://model.test", failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+    calls = []
+
+    @retry_api_call(max_retries=3, delay=0)
+    def call_model():
+        calls.append(1)
+        breaker.before_call()
+        error = ApiResponseError("API返回错误: invalid request")
+        breaker.record_error(error)
+        raise error
+
+    with pytest.raises(ApiResponseError):
+        call_model()
+    assert len(calls) == 1
+    assert breaker.state == "closed"
+
+
+def test_record_error_ignores_circuit_open_error():
+    breaker = CircuitBreaker("http://model.test", failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+    breaker.record_error(CircuitOpenError("http://model.test", 1))
+    assert breaker.snapshot() == {"state": "closed", "consecutive_failures": 0, "open_count": 0}
+
+
+def test_cancelled_async_probe_releases_slot():
+    endpoint = "http://cancelled-probe.test"
+    breaker = get_circuit_breaker(endpoint)
+    breaker.state = "open"
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout - 1
+
+    @async_retry_api_call(max_retries=1, endpoint=endpoint)
+    async def slow_call():
+        await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.create_task(slow_call())
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    breaker.before_call()
+    assert breaker.state == "half_open"
@@ -0,0 +1,67 @@
+"""符合性分析缓存的测试：报告JSON规范化、ResultCache淘汰和LightRAG索引版本号"""
+import os
+
+from pdf_analysis_app import canonicalize_report_json, get_rag_index_version, write_rag_index_stamp
+from pdf_extraction import ResultCache
+
+
+def test_canonicalize_converts_units():
+    assert canonicalize_report_json({"最大力": "45.2 kN"}) == canonicalize_report_json({"最大力": "45200N"})
+    assert canonicalize_report_json({"弹性模量": "206 GPa"}) == canonicalize_report_json({"弹性模量": "206000 MPa"})
+    assert canonicalize_report_json({"厚度": "1.2 cm"}) == canonicalize_report_json({"厚度": "12mm"})
+    assert canonicalize_report_json({"抗拉强度": "450 N/mm²"}) == canonicalize_report_json({"抗拉强度": "450MPa"})
+    assert canonicalize_report_json({"最大力": "45.2 kN"}) != canonicalize_report_json({"最大力": "45.2 N"})
+
+
+def test_canonicalize_ignores_key_order_and_whitespace():
+    first = {"产品信息": {"材料名称": "Q235B", "厚度": "10 mm"}, "测试数据": [{"伸长率": "26 %"}]}
+    second = {"测试数据": [{"伸长率": "26%"}], "产品信息": {"厚度": "10.0mm", "材料名称": " Q235B "}}
+    assert canonicalize_report_json(first) == canonicalize_report_json(second)
+
+
+def _backdate(cache, key, **columns):
+    with cache._connect() as conn:
+        for column, value in columns.items():
+            conn.execute(f"UPDATE {cache.table} SET {column} = ? WHERE key = ?", (value, key))
+
+
+def test_result_cache_expires_old_entries(tmp_path):
+    cache = ResultCache(db_path=str(tmp_path / "cache.sqlite3"), max_bytes=0, max_age=60)
+    cache.put("old", "旧结果")
+    cache.put("new", "新结果")
+    _backdate(cache, "old", created_at=1.0)
+    assert cache.get("old") is None
+    assert cache.get("new") == "新结果"
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(db_path=str(tmp_path / "cache.sqlite3"), max_bytes=15, max_age=0)
+    cache.put("a", "x" * 6)
+    cache.put("b", "y" * 6)
+    _backdate(cache, "a", accessed_at=100.0)
+    _backdate(cache, "b", accessed_at=50.0)
+    cache.put("c", "z" * 6)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 6
+    assert cache.get("c") == "z" * 6
+
+
+def test_rag_index_version_ignores_llm_response_cache(tmp_path):
+    working_dir = str(tmp_path)
+    (tmp_path / "kv_store_full_docs.json").write_text('{"doc-1": {}}', encoding="utf-8")
+    version = get_rag_index_version(working_dir)
+    (tmp_path / "kv_store_llm_response_cache.json").write_text('{"query": "answer"}', encoding="utf-8")
+    assert get_rag_index_version(working_dir) == version
+    (tmp_path / "kv_store_full_docs.json").write_text('{"doc-1": {}, "doc-2": {}}', encoding="utf-8")
+    assert get_rag_index_version(working_dir) != version
+
+
+def test_rag_index_stamp_takes_precedence(tmp_path):
+    working_dir = str(tmp_path)
+    (tmp_path / "kv_store_full_docs.json").write_text('{"doc-1": {}}', encoding="utf-8")
+    stamp = write_rag_index_stamp(working_dir)
+    assert get_rag_index_version(working_dir) == stamp
+    (tmp_path / "kv_store_full_docs.json").write_text('{"doc-1": {}, "doc-2": {}}', encoding="utf-8")
+    assert get_rag_index_version(working_dir) == stamp
+    assert write_rag_index_stamp(working_dir) != stamp
+    assert not os.path.exists(os.path.join(working_dir, "rag_index_version.txt.tmp"))
@@ -0,0 +1,76 @@
+"""本地规则判定的测试：厚度解析和报告判定"""
+import pytest
+
+from pdf_compliance_rules import evaluate_report, extract_thickness, format_rule_conclusion
+
+
+def _report(product_info, average):
+    return {"产品信息": product_info, "测试数据": {"平均值": average}}
+
+
+@pytest.mark.parametrize("product_info, expected", [
+    ({"材料名称": "Q235B", "厚度": "10mm"}, 10),
+    ({"材料名称": "Q235B", "厚度(mm)": 12.5}, 12.5),
+    ({"材料名称": "Q235B 钢板 δ=10mm"}, 10),
+    ({"规格": "t=12"}, 12),
+    ({"厚度偏差": "0.5mm", "材料名称": "δ＝16mm"}, 16),
+    ({"厚度": "20", "备注": "δ=20mm"}, 20),
+])
+def test_extract_thickness(product_info, expected):
+    assert extract_thickness({"产品信息": product_info}) == expected
+
+
+@pytest.mark.parametrize("product_info", [
+    {"规格": "10×2000", "标距": "50 mm"},
+    {"尺寸": "50×12.5mm"},
+    {"厚度": "10×2000"},
+    {"厚度": "0"},
+    {"厚度": True},
+    {"厚度": "20", "材料名称": "δ=30mm"},
+    {"材料名称": "Q235B"},
+])
+def test_extract_thickness_missing_or_ambiguous(product_info):
+    assert extract_thickness({"产品信息": product_info}) is None
+
+
+def test_evaluate_report_passes_when_all_metrics_pass():
+    report = _report({"材料名称": "Q235B", "厚度": "10mm"}, {"屈服强度": "280 MPa", "抗拉强度": "430 MPa", "断后伸长率": "30%"})
+    evaluation = evaluate_report(report)
+    assert evaluation["standard"] == "GB/T 700-2006"
+    assert evaluation["grade"] == "Q235"
+    assert evaluation["thickness"] == 10
+    assert [item["metric"] for item in evaluation["metrics"]] == ["屈服强度", "抗拉强度", "断后伸长率"]
+    assert evaluation["unevaluated"] == []
+    assert evaluation["passed"] is True
+
+
+def test_evaluate_report_fails_on_low_value():
+    report = _report({"材料名称": "Q235B", "厚度": "10mm"}, {"屈服强度": "200 MPa", "抗拉强度": "430 MPa", "断后伸长率": "30%"})
+    evaluation = evaluate_report(report)
+    assert evaluation["passed"] is False
+    assert [item["metric"] for item in evaluation["metrics"] if not item["passed"]] == ["屈服强度"]
+
+
+def test_evaluate_report_does_not_pass_partial_metrics():
+    report = _report({"材料名称": "Q235B", "厚度": "10mm"}, {"屈服强度": "280 MPa", "抗拉强度": "430 MPa"})
+    assert evaluate_report(report) is None
+
+
+def test_evaluate_report_lists_unevaluated_metrics_when_failing():
+    report = _report({"材料名称": "Q235B", "厚度": "10mm"}, {"屈服强度": "200 MPa", "抗拉强度": "430 MPa"})
+    evaluation = evaluate_report(report)
+    assert evaluation["passed"] is False
+    assert evaluation["unevaluated"] == ["断后伸长率"]
+    conclusion = format_rule_conclusion(evaluation, "钢板", "10mm")
+    assert "屈服强度不符合" in conclusion
+    assert "未能判定的指标（报告中缺少实测值）：断后伸长率" in conclusion
+
+
+@pytest.mark.parametrize("report", [
+    _report({"材料名称": "Q235B"}, {"屈服强度": "280 MPa", "抗拉强度": "430 MPa", "断后伸长率": "30%"}),
+    _report({"材料名称": "304不锈钢", "厚度": "10mm"}, {"屈服强度": "280 MPa", "抗拉强度": "600 MPa", "断后伸长率": "45%"}),
+    {"产品信息": {"材料名称": "Q235B", "厚度": "10mm"}},
+    {},
+])
+def test_evaluate_report_falls_back_without_limits_or_data(report):
+    assert evaluate_report(report) is None
@@ -0,0 +1,73 @@
+"""find_json_spans / extract_json_from_response 的测试"""
+import json
+
+import pdf_extraction
+from pdf_extraction import extract_json_from_response, find_json_spans, remove_trailing_commas
+
+REPORT = {"产品信息": {"材料名称": "Q235B"}, "测试数据": [{"抗拉强度": "450 MPa", "备注": "见{附表}"}]}
+REPORT_TEXT = json.dumps(REPORT, ensure_ascii=False)
+
+
+def test_plain_json():
+    assert extract_json_from_response(REPORT_TEXT) == REPORT
+
+
+def test_fenced_json():
+    response = f"以下是提取结果：\n```json\n{REPORT_TEXT}\n```\n如有疑问请告知。"
+    assert extract_json_from_response(response) == REPORT
+
+
+def test_prose_wrapped_json():
+    response = f'报告中"抗拉强度"一栏如下 {REPORT_TEXT} 以上数据来自第2页。'
+    assert extract_json_from_response(response) == REPORT
+
+
+def test_nested_braces_inside_strings():
+    text = 'x {"a": {"b": [1, {"c": "}{]["}]}, "d": "\\"}"} y'
+    spans = find_json_spans(text)
+    assert spans == [(2, len(text) - 2, True)]
+    assert json.loads(text[2:len(text) - 2]) == {"a": {"b": [1, {"c": "}{]["}]}, "d": '"}'}
+
+
+def test_multiple_objects():
+    text = '第一个 {"a": 1} 第二个 {"b": 2, "c": [3, 4]} 完'
+    spans = find_json_spans(text)
+    assert [text[start:end] for start, end, _ in spans] == ['{"a": 1}', '{"b": 2, "c": [3, 4]}']
+    assert all(complete for _, _, complete in spans)
+    # 首尾大括号之间的内容无法解析时，取最长的完整对象
+    assert extract_json_from_response(text) == {"b": 2, "c": [3, 4]}
+
+
+def test_truncated_object():
+    text = '结果：{"产品信息": {"材料名称": "Q235B"}, "测试数据": [{"抗拉强度": "45'
+    spans = find_json_spans(text)
+    assert spans == [(3, len(text), False)]
+    result = extract_json_from_response(text)
+    assert result["产品信息"] == {"材料名称": "Q235B"}
+    assert "测试数据" in result
+
+
+def test_no_json():
+    assert find_json_spans("报告中没有可识别的数据") == []
+    assert extract_json_from_response("报告中没有可识别的数据") is None
+    assert extract_json_from_response("") is None
+
+
+def test_trailing_commas_outside_strings_are_removed():
+    text = '{"a": [1, 2,], "b": "保留, }", "c": {"d": "x",},}'
+    assert remove_trailing_commas(text) == '{"a": [1, 2], "b": "保留, }", "c": {"d": "x"}}'
+    assert extract_json_from_response(f"```json\n{text}\n```") == {"a": [1, 2], "b": "保留, }", "c": {"d": "x"}}
+
+
+def test_prose_braces_before_json():
+    body = REPORT_TEXT.replace('"Q235B"}', '"Q235B",}', 1)
+    response = f"这是编号 {{BG-2024-001}} 的报告，提取结果如下：\n{body}\n以上。"
+    assert extract_json_from_response(response) == REPORT
+
+
+def test_repair_skipped_above_size_limit(monkeypatch):
+    text = '{"产品信息": {"材料名称": "Q235B"}, "测试数据": [{"抗拉强度": "45'
+    monkeypatch.setattr(pdf_extraction, "JSON_REPAIR_MAX_CHARS", len(text) - 1)
+    assert extract_json_from_response(text) is None
+    monkeypatch.setattr(pdf_extraction, "JSON_REPAIR_MAX_CHARS", len(text))
+    assert extract_json_from_response(text)["产品信息"] == {"材料名称": "Q235B"}
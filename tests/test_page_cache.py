@@ -0,0 +1,96 @@
+"""页面结果缓存的测试：缓存键随文件内容、提示词和渲染参数变化，命中时不再调用模型"""
+import fitz
+import pytest
+
+import pdf_extraction
+from pdf_extraction import PDFExtractor, ResultCache
+
+QUESTION = "提取报告信息"
+
+
+def _write_pdf(path, label):
+    doc = fitz.open()
+    for index in range(2):
+        page = doc.new_page(width=200, height=200)
+        page.insert_text((20, 100), f"{label} page {index + 1}")
+    doc.save(str(path))
+    doc.close()
+
+
+@pytest.fixture
+def extractor(tmp_path):
+    extractor = PDFExtractor(use_cache=False)
+    extractor.result_cache = ResultCache(db_path=str(tmp_path / "cache.sqlite3"))
+    extractor.calls = []
+
+    def call_vision_api_with_base64(base64_image, question, mime_type="image/png"):
+        extractor.calls.append(mime_type)
+        return {"choices": [{"message": {"content": f"结果{len(extractor.calls)}"}}], "usage": {"total_tokens": 10}}
+
+    extractor.call_vision_api_with_base64 = call_vision_api_with_base64
+    return extractor
+
+
+def _analyze(extractor, pdf_path, question=QUESTION):
+    return list(extractor.iter_pdf_pages(str(pdf_path), question, use_text_layer=False, page_numbers=[0, 1]))
+
+
+def test_cache_hit_skips_model_call(extractor, tmp_path):
+    pdf_path = tmp_path / "report.pdf"
+    _write_pdf(pdf_path, "A")
+    first = _analyze(extractor, pdf_path)
+    assert len(extractor.calls) == 2
+    second = _analyze(extractor, pdf_path)
+    assert len(extractor.calls) == 2
+    assert [item["result"] for item in second] == [item["result"] for item in first]
+    assert "usage" not in second[0]["result"]
+
+
+def test_cache_invalidated_by_file_content(extractor, tmp_path):
+    pdf_path = tmp_path / "report.pdf"
+    _write_pdf(pdf_path, "A")
+    _analyze(extractor, pdf_path)
+    _write_pdf(pdf_path, "B")
+    _analyze(extractor, pdf_path)
+    assert len(extractor.calls) == 4
+
+
+def test_cache_invalidated_by_question(extractor, tmp_path):
+    pdf_path = tmp_path / "report.pdf"
+    _write_pdf(pdf_path, "A")
+    _analyze(extractor, pdf_path)
+    _analyze(extractor, pdf_path, question="只提取测试数据")
+    assert len(extractor.calls) == 4
+
+
+def test_cache_invalidated_by_render_params(extractor, tmp_path, monkeypatch):
+    pdf_path = tmp_path / "report.pdf"
+    _write_pdf(pdf_path, "A")
+    _analyze(extractor, pdf_path)
+    monkeypatch.setattr(pdf_extraction, "RENDER_FORMAT", "jpeg")
+    _analyze(extractor, pdf_path)
+    assert extractor.calls == ["image/png"] * 2 + ["image/jpeg"] * 2
+
+
+def test_failed_pages_are_not_cached(extractor, tmp_path):
+    pdf_path = tmp_path / "report.pdf"
+    _write_pdf(pdf_path, "A")
+
+    def failing_call(base64_image, question, mime_type="image/png"):
+        extractor.calls.append(mime_type)
+        raise ConnectionError("connection reset")
+
+    extractor.call_vision_api_with_base64 = failing_call
+    results = _analyze(extractor, pdf_path)
+    assert all("error" in item["result"] for item in results)
+    _analyze(extractor, pdf_path)
+    assert len(extractor.calls) == 4
+
+
+def test_make_key_depends_on_every_part():
+    params = PDFExtractor._render_params(False)
+    key = ResultCache.make_key("hash", 0, QUESTION, "model", params)
+    assert key == ResultCache.make_key("hash", 0, QUESTION, "model", dict(reversed(list(params.items()))))
+    assert key != ResultCache.make_key("hash", 1, QUESTION, "model", params)
+    assert key != ResultCache.make_key("hash", 0, QUESTION, "other-model", params)
+    assert key != ResultCache.make_key("hash", 0, QUESTION, "model", PDFExtractor._render_params(True))
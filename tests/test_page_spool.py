@@ -0,0 +1,68 @@
+"""大文档逐页结果的测试：PageResultSpool转存到临时文件后按页序读回，以及模型响应瘦身"""
+import fitz
+import pytest
+
+from pdf_extraction import PageResultSpool, PDFExtractor, slim_model_response
+
+
+def _item(page):
+    return {"page": page, "result": {"choices": [{"message": {"role": "assistant", "content": f"第{page}页内容"}}]}}
+
+
+def test_spool_keeps_small_results_in_memory():
+    with PageResultSpool(spill_pages=3) as spool:
+        for page in range(1, 4):
+            spool.append(_item(page))
+        assert not spool.spilled
+        assert list(spool) == [_item(page) for page in range(1, 4)]
+
+
+@pytest.mark.parametrize("count", [4, 10])
+def test_spool_spills_and_reads_back_in_order(tmp_path, count):
+    spool = PageResultSpool(spill_pages=3, spill_dir=str(tmp_path))
+    for page in range(1, count + 1):
+        spool.append(_item(page))
+    assert spool.spilled
+    assert spool._items == []
+    assert len(spool) == count
+    assert list(spool) == [_item(page) for page in range(1, count + 1)]
+    assert spool[2] == _item(3)
+    assert spool[-1] == _item(count)
+    # 迭代中途按下标读取不影响后续顺序
+    iterator = iter(spool)
+    assert next(iterator) == _item(1)
+    assert spool[count - 1] == _item(count)
+    assert next(iterator) == _item(2)
+    spool.close()
+    assert len(spool) == 0 and not spool.spilled
+
+
+def test_spool_without_limit_never_spills():
+    with PageResultSpool(spill_pages=None) as spool:
+        for page in range(1, 101):
+            spool.append(_item(page))
+        assert not spool.spilled and len(spool) == 100
+
+
+def test_slim_model_response():
+    response = {"id": "1", "usage": {"total_tokens": 100}, "choices": [{"message": {"role": "assistant", "content": "内容"}, "logprobs": None}]}
+    assert slim_model_response(response) == {"choices": [{"message": {"role": "assistant", "content": "内容"}}]}
+    assert slim_model_response({"error": "API调用失败"}) == {"error": "API调用失败"}
+    assert slim_model_response({"choices": []}) == {"choices": []}
+
+
+def test_analyze_pdf_returns_spool_in_page_order(tmp_path):
+    doc = fitz.open()
+    for page in range(3):
+        doc.new_page(width=200, height=200).insert_text((20, 100), f"page {page + 1}")
+    pdf_path = str(tmp_path / "report.pdf")
+    doc.save(pdf_path)
+    doc.close()
+    extractor = PDFExtractor(use_cache=False)
+    extractor.call_vision_api_with_base64 = lambda base64_image, question, mime_type="image/png": {
+        "choices": [{"message": {"content": "{}"}}], "usage": {"total_tokens": 10}
+    }
+    with extractor.analyze_pdf(pdf_path, "提取报告信息", use_text_layer=False) as results:
+        assert isinstance(results, PageResultSpool)
+        assert [item["page"] for item in results] == [1, 2, 3]
+        assert all("usage" not in item["result"] for item in results)
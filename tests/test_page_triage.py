@@ -0,0 +1,115 @@
+"""页面分诊的测试：页面打分、按得分排序和全部跳过时的回退"""
+import random
+
+import fitz
+import pytest
+
+from pdf_extraction import PDFExtractor
+
+DATA_LINE = "Specimen tensile strength 450 MPa, yield strength 320 MPa, elongation 26 %"
+
+
+def _add_cover(doc):
+    page = doc.new_page()
+    page.insert_text((200, 300), "TEST REPORT", fontsize=24)
+
+
+def _add_data_page(doc):
+    page = doc.new_page()
+    for line in range(5):
+        page.insert_text((50, 60 + line * 14), DATA_LINE, fontsize=9)
+    for row in range(4):
+        for col in range(4):
+            page.draw_rect(fitz.Rect(50 + col * 100, 200 + row * 25, 150 + col * 100, 225 + row * 25))
+
+
+def _add_image_page(doc):
+    page = doc.new_page()
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 100, 80), False)
+    rng = random.Random(1)
+    for x in range(0, 100, 4):
+        for y in range(0, 80, 4):
+            pix.set_rect(fitz.IRect(x, y, x + 4, y + 4), (rng.randint(0, 255),) * 3)
+    page.insert_image(fitz.Rect(50, 50, 550, 450), pixmap=pix)
+
+
+def _save(doc, path):
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+@pytest.fixture
+def report_pdf(tmp_path):
+    # 第1页封面，第2页数据表，第3页空白，第4页嵌入的扫描图像
+    doc = fitz.open()
+    _add_cover(doc)
+    _add_data_page(doc)
+    doc.new_page()
+    _add_image_page(doc)
+    return _save(doc, tmp_path / "report.pdf")
+
+
+def test_triage_page_scores(report_pdf):
+    extractor = PDFExtractor(use_cache=False)
+    with fitz.open(report_pdf) as doc:
+        cover, data, blank, image = [extractor.triage_page(page) for page in doc]
+    assert data["keep"] and data["table_lines"] >= 16
+    assert set(data["keywords"]) >= {"tensile", "yield", "elongation", "MPa"}
+    assert not cover["keep"]
+    assert not blank["keep"] and blank["entropy"] == 0
+    assert image["keep"] and image["entropy"] >= 1.0
+    assert data["score"] > image["score"]
+
+
+def test_triage_document_ranks_kept_pages(report_pdf):
+    with fitz.open(report_pdf) as doc:
+        assert PDFExtractor(use_cache=False).triage_document(doc) == [1, 3]
+
+
+def test_scanned_document_keeps_pages_with_content(tmp_path):
+    doc = fitz.open()
+    doc.new_page()
+    _add_image_page(doc)
+    doc.new_page()
+    with fitz.open(_save(doc, tmp_path / "scan.pdf")) as doc:
+        assert PDFExtractor(use_cache=False).triage_document(doc) == [1]
+
+
+def test_triage_keeps_all_pages_when_none_pass(tmp_path):
+    doc = fitz.open()
+    _add_cover(doc)
+    doc.new_page()
+    with fitz.open(_save(doc, tmp_path / "cover.pdf")) as doc:
+        assert PDFExtractor(use_cache=False).triage_document(doc) == [0, 1]
+
+
+def test_select_pages_without_triage_or_on_error(report_pdf, monkeypatch):
+    extractor = PDFExtractor(use_cache=False)
+    with fitz.open(report_pdf) as doc:
+        assert extractor.select_pages(doc, use_triage=False) == [0, 1, 2, 3]
+
+        def broken_triage(doc):
+            raise RuntimeError("页面损坏")
+
+        monkeypatch.setattr(extractor, "triage_document", broken_triage)
+        assert extractor.select_pages(doc, use_triage=True) == [0, 1, 2, 3]
+
+
+def test_iter_pdf_pages_analyzes_triaged_pages_in_rank_order(tmp_path):
+    doc = fitz.open()
+    _add_image_page(doc)
+    doc.new_page()
+    _add_data_page(doc)
+    pdf_path = _save(doc, tmp_path / "report.pdf")
+    extractor = PDFExtractor(use_cache=False)
+    calls = []
+
+    def call_vision_api_with_base64(base64_image, question, mime_type="image/png"):
+        calls.append(mime_type)
+        return {"choices": [{"message": {"content": "{}"}}]}
+
+    extractor.call_vision_api_with_base64 = call_vision_api_with_base64
+    results = list(extractor.iter_pdf_pages(pdf_path, "提取报告信息", use_cache=False, use_text_layer=False, use_triage=True))
+    assert [item["page"] for item in results] == [3, 1]
+    assert len(calls) == 2
@@ -0,0 +1,92 @@
+"""多进程渲染池的测试：默认不启用、不满足条件时不创建，以及渲染结果缺失时回退到本地渲染"""
+import multiprocessing
+
+import fitz
+import pytest
+
+import pdf_extraction
+import pdf_render_pool
+from pdf_extraction import PDFExtractor
+from pdf_render_pool import get_render_pool
+
+
+def _write_pdf(path, pages=4):
+    doc = fitz.open()
+    for page in range(pages):
+        doc.new_page(width=200, height=200).insert_text((20, 100), f"page {page + 1}")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+@pytest.fixture
+def no_pool_start(monkeypatch):
+    def start_pool(workers=None):
+        raise AssertionError("不应启动渲染池")
+
+    monkeypatch.setattr(pdf_render_pool, "RenderPool", start_pool)
+    monkeypatch.setattr(pdf_render_pool, "_render_pool", None)
+    return monkeypatch
+
+
+def test_render_pool_disabled_by_default(no_pool_start):
+    assert pdf_render_pool.RENDER_POOL_ENABLED is False
+    assert get_render_pool() is None
+    assert get_render_pool(100) is None
+
+
+def test_render_pool_skipped_for_few_pages_and_in_child_process(no_pool_start):
+    no_pool_start.setattr(pdf_render_pool, "RENDER_POOL_ENABLED", True)
+    assert get_render_pool(pdf_render_pool.RENDER_POOL_MIN_PAGES - 1) is None
+    no_pool_start.setattr(multiprocessing, "parent_process", lambda: object())
+    assert get_render_pool(100) is None
+
+
+class FakeRenderPool:
+    """只渲染部分页面的渲染池，模拟预判与实际不一致的情况"""
+
+    def __init__(self, extractor, skip_pages):
+        self.extractor = extractor
+        self.skip_pages = skip_pages
+        self.requested = None
+
+    def iter_pages(self, pdf_path, page_numbers):
+        self.requested = list(page_numbers)
+        with fitz.open(pdf_path) as doc:
+            for page_num in self.requested:
+                if page_num not in self.skip_pages:
+                    yield page_num, PDFExtractor.render_page_image(self.extractor, doc.load_page(page_num))
+
+
+def _counting_extractor():
+    extractor = PDFExtractor(use_cache=False)
+    extractor.local_renders = []
+    render_page_image = extractor.render_page_image
+
+    def counting_render(page):
+        extractor.local_renders.append(page.number)
+        return render_page_image(page)
+
+    extractor.render_page_image = counting_render
+    extractor.call_vision_api_with_base64 = lambda base64_image, question, mime_type="image/png": {
+        "choices": [{"message": {"content": "{}"}}]
+    }
+    return extractor
+
+
+def test_pages_render_locally_without_pool(tmp_path, no_pool_start):
+    extractor = _counting_extractor()
+    results = list(extractor.iter_pdf_pages(_write_pdf(tmp_path / "report.pdf"), "提取报告信息", use_cache=False, use_text_layer=False, page_numbers=[2, 0, 3, 1]))
+    assert [item["page"] for item in results] == [3, 1, 4, 2]
+    assert extractor.local_renders == [2, 0, 3, 1]
+
+
+def test_missing_pool_results_fall_back_to_local_render(tmp_path, monkeypatch):
+    extractor = _counting_extractor()
+    pool = FakeRenderPool(extractor, skip_pages={0})
+    monkeypatch.setattr(pdf_extraction, "get_render_pool", lambda page_count=None: pool)
+    results = list(extractor.iter_pdf_pages(_write_pdf(tmp_path / "report.pdf"), "提取报告信息", use_cache=False, use_text_layer=False, page_numbers=[2, 0, 3, 1]))
+    assert pool.requested == [2, 0, 3, 1]
+    assert [item["page"] for item in results] == [3, 1, 4, 2]
+    assert extractor.local_renders == [0]
+    assert all(item["result"]["choices"] for item in results)
@@ -0,0 +1,117 @@
+"""多页报告拼接的测试：字段级合并、合并请求的页面选择和extract_report的拼接模式"""
+import json
+import re
+
+import fitz
+import pytest
+
+import pdf_extraction
+from pdf_extraction import PDFExtractor, merge_report_json
+
+PAGE_REPORTS = {
+    1: {"产品信息": {"材料名称": "Q235B", "厚度": "10 mm"}, "测试数据": {"试样": [{"编号": "1", "抗拉强度": "450 MPa"}]}},
+    2: {"试验数据": {"试样": [{"编号": "1", "抗拉强度": "450 MPa"}, {"编号": "2", "抗拉强度": "455 MPa"}]}},
+    3: {"备注": "以下空白"},
+}
+FILLER = "Tensile test report continued, see the table for specimen results and remarks. "
+
+
+def _write_pdf(path, pages=3):
+    doc = fitz.open()
+    for page_number in range(1, pages + 1):
+        page = doc.new_page()
+        page.insert_text((40, 40), f"PAGE-{page_number}", fontsize=9)
+        for line in range(4):
+            page.insert_text((40, 60 + line * 14), FILLER, fontsize=9)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+@pytest.fixture
+def extractor():
+    extractor = PDFExtractor(use_cache=False)
+    extractor.text_pages = []
+
+    def call_text_api(page_text, question):
+        page_number = int(re.search(r"PAGE-(\d+)", page_text).group(1))
+        extractor.text_pages.append(page_number)
+        return {"choices": [{"message": {"content": json.dumps(PAGE_REPORTS[page_number], ensure_ascii=False)}}]}
+
+    def call_vision_api_with_base64(base64_image, question, mime_type="image/png"):
+        # 文本层结果未通过校验的页面（第3页）回退到图像识别
+        return {"choices": [{"message": {"content": json.dumps(PAGE_REPORTS[3], ensure_ascii=False)}}]}
+
+    extractor.call_text_api = call_text_api
+    extractor.call_vision_api_with_base64 = call_vision_api_with_base64
+    return extractor
+
+
+def test_merge_report_json_unifies_sections_and_rows():
+    merged = merge_report_json([PAGE_REPORTS[1], PAGE_REPORTS[2], None, {"产品信息": {"材料名称": "Q345B", "批号": "B01"}}])
+    assert list(merged) == ["产品信息", "测试数据"]
+    assert merged["产品信息"] == {"材料名称": "Q235B", "厚度": "10 mm", "批号": "B01"}
+    assert [row["编号"] for row in merged["测试数据"]["试样"]] == ["1", "2"]
+
+
+def test_default_stitch_mode_is_merge():
+    assert pdf_extraction.REPORT_STITCH_MODE == "merge"
+
+
+def test_merge_mode_joins_continuation_pages(extractor, tmp_path):
+    pdf_path = _write_pdf(tmp_path / "report.pdf")
+    report = extractor.extract_report(pdf_path, use_cache=False, use_text_layer=True, stitch_mode="merge", use_triage=False)
+    assert report["pages"] == [1, 2]
+    assert [row["编号"] for row in report["json"]["测试数据"]["试样"]] == ["1", "2"]
+    assert report["json"]["产品信息"]["材料名称"] == "Q235B"
+
+
+def test_merge_mode_restores_page_order(extractor, tmp_path, monkeypatch):
+    pdf_path = _write_pdf(tmp_path / "report.pdf")
+    monkeypatch.setattr(extractor, "select_pages", lambda doc, use_triage=None: [1, 0, 2])
+    monkeypatch.setitem(PAGE_REPORTS, 1, {"测试数据": {"试样": [{"编号": "1", "抗拉强度": "450 MPa"}]}})
+    monkeypatch.setitem(PAGE_REPORTS, 2, {"产品信息": {"材料名称": "Q235B"}, "测试数据": {"试样": [{"编号": "2", "抗拉强度": "455 MPa"}]}})
+    report = extractor.extract_report(pdf_path, use_cache=False, use_text_layer=True, stitch_mode="merge")
+    assert extractor.text_pages[:2] == [2, 1]
+    assert report["pages"] == [1, 2]
+    assert [row["编号"] for row in report["json"]["测试数据"]["试样"]] == ["1", "2"]
+
+
+def test_off_mode_stops_at_first_complete_page(extractor, tmp_path):
+    pdf_path = _write_pdf(tmp_path / "report.pdf")
+    report = extractor.extract_report(pdf_path, use_cache=False, use_text_layer=True, stitch_mode="off", use_triage=False, max_concurrency=1)
+    assert report["pages"] == [1]
+    assert report["json"] == PAGE_REPORTS[1]
+    assert extractor.text_pages == [1]
+
+
+def test_stitched_request_uses_top_ranked_pages_in_page_order(extractor, tmp_path):
+    pdf_path = _write_pdf(tmp_path / "report.pdf", pages=5)
+    requests = []
+
+    def call_vision_api_with_pages(page_parts, question):
+        requests.append(page_parts)
+        return {"choices": [{"message": {"content": json.dumps(PAGE_REPORTS[1], ensure_ascii=False)}}]}
+
+    extractor.call_vision_api_with_pages = call_vision_api_with_pages
+    stitched = extractor.extract_stitched_report(pdf_path, use_cache=False, use_text_layer=True, max_pages=2, page_numbers=[3, 0, 2])
+    assert stitched["pages"] == [1, 4]
+    assert [(page_number, kind) for page_number, kind, _, _ in requests[0]] == [(1, "text"), (4, "text")]
+    assert stitched["json"] == PAGE_REPORTS[1]
+
+
+@pytest.mark.parametrize("stitched", [None, {"page": 1, "pages": [1, 2], "raw": "{}", "json": {"备注": "无"}}])
+def test_multi_image_falls_back_to_merge(extractor, tmp_path, monkeypatch, stitched):
+    pdf_path = _write_pdf(tmp_path / "report.pdf")
+    monkeypatch.setattr(extractor, "extract_stitched_report", lambda *args, **kwargs: stitched)
+    report = extractor.extract_report(pdf_path, use_cache=False, use_text_layer=True, stitch_mode="multi_image", use_triage=False)
+    assert report["pages"] == [1, 2]
+
+
+def test_multi_image_returns_complete_stitched_report(extractor, tmp_path, monkeypatch):
+    pdf_path = _write_pdf(tmp_path / "report.pdf")
+    stitched = {"page": 1, "pages": [1, 2], "raw": "{}", "json": PAGE_REPORTS[1]}
+    monkeypatch.setattr(extractor, "extract_stitched_report", lambda *args, **kwargs: stitched)
+    report = extractor.extract_report(pdf_path, use_cache=False, use_text_layer=True, stitch_mode="multi_image", use_triage=False)
+    assert report["pages"] == [1, 2]
+    assert extractor.text_pages == []
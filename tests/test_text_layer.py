@@ -0,0 +1,104 @@
+"""文本层快速路径的测试：文本层提取、结果校验和回退到图像识别"""
+import json
+from concurrent.futures import Future
+
+import fitz
+import pytest
+
+from pdf_extraction import PDFExtractor
+
+REPORT = {"产品信息": {"材料名称": "Q235B"}, "测试数据": {"抗拉强度": "450 MPa"}}
+TEXT_LINE = "Tensile test report, material Q235B, thickness 10 mm, max force 45.2 kN"
+
+
+def _response(content):
+    return {"choices": [{"message": {"content": content}}]}
+
+
+def _write_pdf(path, text_lines, table=False):
+    doc = fitz.open()
+    page = doc.new_page()
+    for index in range(text_lines):
+        page.insert_text((40, 60 + index * 14), TEXT_LINE, fontsize=9)
+    if table:
+        for row in range(3):
+            for col in range(3):
+                page.draw_rect(fitz.Rect(40 + col * 100, 300 + row * 20, 140 + col * 100, 320 + row * 20))
+                page.insert_text((45 + col * 100, 315 + row * 20), f"r{row}c{col}", fontsize=9)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+@pytest.fixture
+def extractor():
+    extractor = PDFExtractor(use_cache=False)
+    extractor.calls = []
+    extractor.text_content = json.dumps(REPORT, ensure_ascii=False)
+
+    def call_text_api(page_text, question):
+        extractor.calls.append("text")
+        if isinstance(extractor.text_content, Exception):
+            raise extractor.text_content
+        return _response(extractor.text_content)
+
+    def call_vision_api_with_base64(base64_image, question, mime_type="image/png"):
+        extractor.calls.append("vision")
+        return _response(json.dumps(REPORT, ensure_ascii=False))
+
+    extractor.call_text_api = call_text_api
+    extractor.call_vision_api_with_base64 = call_vision_api_with_base64
+    return extractor
+
+
+def _done(result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+def test_extract_page_text_requires_min_chars(tmp_path):
+    extractor = PDFExtractor(use_cache=False)
+    with fitz.open(_write_pdf(tmp_path / "short.pdf", 1)) as doc:
+        assert extractor.extract_page_text(doc.load_page(0)) is None
+    with fitz.open(_write_pdf(tmp_path / "long.pdf", 6, table=True)) as doc:
+        page_text = extractor.extract_page_text(doc.load_page(0))
+    assert page_text.startswith("【页面文本】")
+    assert "【表格1】" in page_text
+    assert "r1c0 | r1c1 | r1c2" in page_text
+
+
+@pytest.mark.parametrize("future, usable", [
+    (_done(_response(json.dumps(REPORT, ensure_ascii=False))), True),
+    (_done(_response('{"产品信息": {}, "测试数据": {}}')), False),
+    (_done(_response("无法识别报告内容")), False),
+    (_done({"error": "bad request"}), False),
+    (_done(error=ConnectionError("connection reset")), False),
+])
+def test_text_result_usable(future, usable):
+    assert PDFExtractor(use_cache=False)._text_result_usable(0, future) is usable
+
+
+def test_text_page_skips_vision(extractor, tmp_path):
+    pdf_path = _write_pdf(tmp_path / "report.pdf", 6)
+    results = list(extractor.iter_pdf_pages(pdf_path, "提取报告信息", use_cache=False, use_text_layer=True, page_numbers=[0]))
+    assert extractor.calls == ["text"]
+    assert json.loads(results[0]["result"]["choices"][0]["message"]["content"]) == REPORT
+
+
+@pytest.mark.parametrize("text_content", ["无法识别报告内容", '{"备注": "无"}', ConnectionError("connection reset")])
+def test_invalid_text_result_falls_back_to_vision(extractor, tmp_path, text_content):
+    extractor.text_content = text_content
+    pdf_path = _write_pdf(tmp_path / "report.pdf", 6)
+    results = list(extractor.iter_pdf_pages(pdf_path, "提取报告信息", use_cache=False, use_text_layer=True, page_numbers=[0]))
+    assert extractor.calls == ["text", "vision"]
+    assert json.loads(results[0]["result"]["choices"][0]["message"]["content"]) == REPORT
+
+
+def test_pages_without_text_layer_use_vision(extractor, tmp_path):
+    pdf_path = _write_pdf(tmp_path / "report.pdf", 1)
+    list(extractor.iter_pdf_pages(pdf_path, "提取报告信息", use_cache=False, use_text_layer=True, page_numbers=[0]))
+    assert extractor.calls == ["vision"]
@@ -0,0 +1,49 @@
+"""查询token统计的测试：tiktoken编码无法加载时按字符估算"""
+import sys
+import threading
+import types
+
+import pytest
+
+import pdf_analysis_app
+
+
+@pytest.fixture
+def fresh_encoder(monkeypatch):
+    monkeypatch.setattr(pdf_analysis_app, "_token_encoder", None)
+    return monkeypatch
+
+
+def _fake_tiktoken(get_encoding):
+    return types.SimpleNamespace(get_encoding=get_encoding)
+
+
+def test_count_tokens_estimates_when_download_fails(fresh_encoder):
+    def get_encoding(name):
+        raise ConnectionError("无法下载编码文件")
+
+    fresh_encoder.setitem(sys.modules, "tiktoken", _fake_tiktoken(get_encoding))
+    assert pdf_analysis_app.count_tokens("抗拉强度 450MPa") == 4 + (len(" 450MPa") + 3) // 4
+    assert pdf_analysis_app._token_encoder is False
+
+
+def test_count_tokens_estimates_when_download_hangs(fresh_encoder):
+    release = threading.Event()
+
+    def get_encoding(name):
+        release.wait(10)
+        raise ConnectionError("超时")
+
+    fresh_encoder.setitem(sys.modules, "tiktoken", _fake_tiktoken(get_encoding))
+    fresh_encoder.setattr(pdf_analysis_app, "TOKEN_ENCODING_LOAD_TIMEOUT", 0.05)
+    try:
+        assert pdf_analysis_app.count_tokens("abcdefgh") == 2
+    finally:
+        release.set()
+    assert pdf_analysis_app._token_encoder is False
+
+
+def test_count_tokens_uses_loaded_encoder(fresh_encoder):
+    encoder = types.SimpleNamespace(encode=lambda text: text.split())
+    fresh_encoder.setitem(sys.modules, "tiktoken", _fake_tiktoken(lambda name: encoder))
+    assert pdf_analysis_app.count_tokens("a b c") == 3